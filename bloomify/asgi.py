@@ -7,10 +7,19 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bloomify.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from students import prefetch  # noqa: E402  (needs the app registry loaded above)
+
+
+async def application(scope, receive, send):
+    # Question prefetching runs on the server's event loop instead of a private thread
+    prefetch.bind_loop(asyncio.get_running_loop())
+    await django_application(scope, receive, send)
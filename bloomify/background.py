@@ -0,0 +1,57 @@
+"""
+Small in-process background executor.
+
+Used for work that must not hold a request worker (refilling question pools,
+prefetching questions, deferred writes). Each task gets its own DB connection
+handling so threads never reuse a connection closed by the request cycle.
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the shared executor, creating it on first use."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'BACKGROUND_WORKERS', 4),
+                    thread_name_prefix='bloomify-bg',
+                )
+    return _executor
+
+
+def submit(fn, *args, **kwargs):
+    """
+    Run ``fn(*args, **kwargs)`` on the background executor and return a Future.
+    With BACKGROUND_TASKS_ALWAYS_EAGER the call runs inline (used by tests).
+    """
+    if getattr(settings, 'BACKGROUND_TASKS_ALWAYS_EAGER', False):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def run():
+        close_old_connections()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            logger.exception("Background task failed", extra={'task': getattr(fn, '__name__', repr(fn))})
+            raise
+        finally:
+            close_old_connections()
+
+    return get_executor().submit(run)
@@ -0,0 +1,681 @@
+"""
+Shared LLM client.
+
+All model calls go through ``get_client().generate(contents)``, or
+``await get_client().agenerate(contents)`` from async views, or chunk by chunk
+through ``stream`` / ``astream``. Passing ``schema`` asks for JSON matching it
+(LLM_OUTPUT_FORMAT = 'json'). The client wraps a
+provider (Gemini, or a deterministic offline fake for load tests) with:
+
+* bounded concurrency per worker process (LLM_MAX_CONCURRENCY for threads,
+  LLM_ASYNC_MAX_CONCURRENCY per event loop)
+* a per-call timeout and an overall deadline (LLM_TIMEOUT / LLM_DEADLINE)
+* retries with full-jitter exponential backoff, never past the deadline
+* a circuit breaker that fails fast after repeated provider errors
+
+Every call's time and outcome, and each retry, are recorded in bloomify.metrics.
+
+Generation prompts that differ only in seed, session ID and wording variety
+can also share answers through ``get_response_cache()``, keyed on what the
+prompt actually asks for (see ``response_cache_key``).
+
+The provider is created once per process and reused, so its transport
+(channel / connection pool) is shared by every request in the worker.
+"""
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import random
+import re
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from django.conf import settings
+
+from bloomify import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class LLMError(Exception):
+    """The model could not produce a response."""
+
+
+class LLMTimeout(LLMError):
+    """The deadline passed before the model answered."""
+
+
+class CircuitOpenError(LLMError):
+    """Calls are short-circuited after too many consecutive provider failures."""
+
+
+# --- Providers ---
+
+class BaseProvider:
+    """
+    A model backend. ``contents`` is a prompt string or a list of chat turns;
+    ``schema`` (optional) asks for a JSON answer matching that schema.
+    """
+
+    def generate(self, contents, timeout, schema=None):
+        raise NotImplementedError
+
+    async def agenerate(self, contents, timeout, schema=None):
+        """Async variant; providers without a native async API use a worker thread."""
+        return await asyncio.to_thread(self.generate, contents, timeout, schema)
+
+    def stream(self, contents, timeout, schema=None):
+        """Yield the answer in chunks as it is produced; by default as one chunk."""
+        yield self.generate(contents, timeout, schema)
+
+    async def astream(self, contents, timeout, schema=None):
+        """Async ``stream``."""
+        yield await self.agenerate(contents, timeout, schema)
+
+    def is_retryable(self, exc):
+        return True
+
+
+class GeminiProvider(BaseProvider):
+    def __init__(self, model_name, api_key):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    @staticmethod
+    def options(timeout, schema):
+        options = {'request_options': {'timeout': timeout}}
+        if schema:
+            # Constrained decoding: the answer is JSON matching the schema
+            options['generation_config'] = {'response_mime_type': 'application/json', 'response_schema': schema}
+        return options
+
+    def generate(self, contents, timeout, schema=None):
+        response = self.model.generate_content(contents, **self.options(timeout, schema))
+        return response.text
+
+    async def agenerate(self, contents, timeout, schema=None):
+        response = await self.model.generate_content_async(contents, **self.options(timeout, schema))
+        return response.text
+
+    def stream(self, contents, timeout, schema=None):
+        response = self.model.generate_content(contents, stream=True, **self.options(timeout, schema))
+        for chunk in response:
+            yield chunk.text
+
+    async def astream(self, contents, timeout, schema=None):
+        response = await self.model.generate_content_async(contents, stream=True, **self.options(timeout, schema))
+        async for chunk in response:
+            yield chunk.text
+
+    def is_retryable(self, exc):
+        from google.api_core import exceptions as api_exceptions
+        permanent = (
+            api_exceptions.InvalidArgument,
+            api_exceptions.PermissionDenied,
+            api_exceptions.Unauthenticated,
+            api_exceptions.NotFound,
+        )
+        # response.text raises ValueError when the answer was blocked; asking again may pass
+        return not isinstance(exc, permanent)
+
+
+class FakeProvider(BaseProvider):
+    """
+    Deterministic offline provider. Answers in the MCQ or descriptive format the
+    quiz engines expect (as JSON when a schema is given, and as a batch when the
+    prompt asks for several questions), derived from a hash of the prompt, after
+    an optional simulated latency (LLM_FAKE_LATENCY seconds).
+    """
+
+    BATCH_RE = re.compile(r'exactly (\d+) questions')
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    @staticmethod
+    def prompt_text(contents):
+        if isinstance(contents, str):
+            return contents
+        turns = [turn for turn in contents if isinstance(turn, dict) and turn.get('role') == 'user']
+        last = turns[-1] if turns else (contents[-1] if contents else '')
+        if isinstance(last, dict):
+            return '\n'.join(str(part) for part in last.get('parts', []))
+        return str(last)
+
+    def generate(self, contents, timeout, schema=None):
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+        return self.answer(contents, schema)
+
+    async def agenerate(self, contents, timeout, schema=None):
+        if self.latency:
+            await asyncio.sleep(min(self.latency, timeout))
+        return self.answer(contents, schema)
+
+    def stream(self, contents, timeout, schema=None):
+        """First words after a fifth of the latency, the rest spread over the remainder, like a real model."""
+        words = self.answer_words(contents, schema)
+        if self.latency:
+            time.sleep(min(self.latency * 0.2, timeout))
+        for word in words:
+            if self.latency:
+                time.sleep(self.latency * 0.8 / len(words))
+            yield word
+
+    async def astream(self, contents, timeout, schema=None):
+        words = self.answer_words(contents, schema)
+        if self.latency:
+            await asyncio.sleep(min(self.latency * 0.2, timeout))
+        for word in words:
+            if self.latency:
+                await asyncio.sleep(self.latency * 0.8 / len(words))
+            yield word
+
+    def answer_words(self, contents, schema=None):
+        return re.findall(r'\S+\s*|\s+', self.answer(contents, schema))
+
+    def answer(self, contents, schema=None):
+        prompt = self.prompt_text(contents)
+        digest = hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+        topic = 'General'
+        for line in prompt.splitlines():
+            if line.strip().lower().startswith('section:'):
+                topic = line.strip()[len('section:'):].strip() or topic
+                break
+        batch = self.BATCH_RE.search(prompt)
+        if schema is not None:
+            schema = schema.get('properties', {}).get('questions', {}).get('items', schema)
+            descriptive = 'keywords' in schema.get('properties', {})
+        else:
+            descriptive = 'Keywords:' in prompt
+        if not batch:
+            return self.question(topic, digest, descriptive, schema is not None)
+        digests = [hashlib.sha1(f"{digest}{i}".encode('utf-8')).hexdigest() for i in range(int(batch.group(1)))]
+        if schema is not None:
+            return json.dumps({'questions': [json.loads(self.question(topic, d, descriptive, True)) for d in digests]})
+        return '\n---\n'.join(self.question(topic, d, descriptive, False) for d in digests)
+
+    @staticmethod
+    def question(topic, digest, descriptive, as_json):
+        if descriptive:
+            question = f"Explain the role of {topic} in case {digest[:8]}-{digest[24:32]}."
+            keywords = ['function', 'variable', 'loop', 'condition']
+            if as_json:
+                return json.dumps({'topic': topic, 'question': question, 'keywords': keywords})
+            return f"Topic: {topic}\nQuestion: {question}\nKeywords: {', '.join(keywords)}"
+        question = f"Which statement about {topic} holds in case {digest[:8]}-{digest[24:32]}?"
+        options = [f"Statement {digest[i:i + 4]}" for i in (10, 14, 18, 22)]
+        correct = int(digest[8], 16) % 4
+        if as_json:
+            return json.dumps({'topic': topic, 'question': question, 'options': options, 'correct_index': correct})
+        return (
+            f"Topic: {topic}\n"
+            f"Question: {question}\n"
+            + ''.join(f"{letter}) {option}\n" for letter, option in zip('ABCD', options))
+            + f"Correct: {'ABCD'[correct]}"
+        )
+
+
+# --- Resilience ---
+
+class CircuitBreaker:
+    """
+    Opens after ``failure_threshold`` consecutive failures and rejects calls
+    for ``reset_timeout`` seconds; then lets one trial call through.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self.trial_in_progress:
+                return False
+            self.trial_in_progress = True  # half-open
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_progress = False
+
+    def release_trial(self):
+        """End a trial call that was cancelled before the provider answered."""
+        with self.lock:
+            self.trial_in_progress = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_progress = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+@contextlib.contextmanager
+def measured(method):
+    """Record the time and outcome of one LLMClient call, retries included, in bloomify.metrics."""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    except (GeneratorExit, asyncio.CancelledError):
+        # The caller stopped reading a stream (or the request went away)
+        outcome = 'closed'
+        raise
+    except CircuitOpenError:
+        outcome = 'circuit_open'
+        raise
+    except LLMTimeout:
+        outcome = 'timeout'
+        raise
+    finally:
+        metrics.LLM_CALL_SECONDS.labels(method, outcome).observe(time.perf_counter() - started)
+
+
+class LLMClient:
+    def __init__(self, provider, timeout=30.0, deadline=60.0, max_retries=2,
+                 backoff_base=0.5, backoff_max=8.0, max_concurrency=8, breaker=None,
+                 async_max_concurrency=200):
+        self.provider = provider
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.breaker = breaker or CircuitBreaker(5, 30.0)
+        self.async_max_concurrency = async_max_concurrency
+        # asyncio semaphores belong to one event loop, so keep one per loop
+        self._async_slots = weakref.WeakKeyDictionary()
+
+    def new_deadline(self):
+        """Absolute deadline (monotonic seconds) for one logical generation."""
+        return time.monotonic() + self.deadline
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def generate(self, contents, deadline=None, schema=None):
+        """
+        Return the model's text for ``contents`` (JSON matching ``schema`` when
+        one is given). Raises LLMTimeout when the
+        deadline passes, CircuitOpenError while the breaker is open and
+        LLMError when retries are exhausted.
+        """
+        with measured('generate'):
+            deadline = deadline or self.new_deadline()
+            if not self.slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                raise LLMTimeout("Timed out waiting for a free LLM slot")
+            try:
+                attempt = 0
+                while True:
+                    if not self.breaker.allow():
+                        raise CircuitOpenError("LLM circuit breaker is open")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise LLMTimeout("LLM deadline exceeded")
+                    try:
+                        text = self.provider.generate(contents, timeout=min(self.timeout, remaining), schema=schema)
+                    except Exception as e:
+                        self.breaker.record_failure()
+                        if attempt >= self.max_retries or not self.provider.is_retryable(e):
+                            raise LLMError(f"LLM call failed after {attempt + 1} attempt(s): {e}") from e
+                        pause = self._backoff(attempt)
+                        if time.monotonic() + pause >= deadline:
+                            raise LLMTimeout(f"LLM deadline exceeded while retrying: {e}") from e
+                        time.sleep(pause)
+                        attempt += 1
+                        metrics.LLM_RETRIES.labels('generate').inc()
+                        continue
+                    self.breaker.record_success()
+                    return text
+            finally:
+                self.slots.release()
+
+    def stream(self, contents, deadline=None, schema=None):
+        """
+        Yield the model's answer in chunks as they arrive (see ``astream``).
+        Closing the generator early ends the provider's stream.
+        """
+        with measured('stream'):
+            deadline = deadline or self.new_deadline()
+            if not self.slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                raise LLMTimeout("Timed out waiting for a free LLM slot")
+            try:
+                attempt = 0
+                while True:
+                    if not self.breaker.allow():
+                        raise CircuitOpenError("LLM circuit breaker is open")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise LLMTimeout("LLM deadline exceeded")
+                    stream = self.provider.stream(contents, timeout=min(self.timeout, remaining), schema=schema)
+                    started = False
+                    try:
+                        for chunk in stream:
+                            if time.monotonic() > deadline:
+                                raise LLMTimeout("LLM deadline exceeded while streaming")
+                            started = True
+                            yield chunk
+                    except GeneratorExit:
+                        # The caller stopped reading (a complete or malformed answer);
+                        # the provider did answer, so this counts as a success
+                        self.breaker.record_success()
+                        raise
+                    except Exception as e:
+                        self.breaker.record_failure()
+                        if started or attempt >= self.max_retries or not self.provider.is_retryable(e):
+                            if isinstance(e, LLMError):
+                                raise
+                            raise LLMError(f"LLM stream failed after {attempt + 1} attempt(s): {e}") from e
+                        pause = self._backoff(attempt)
+                        if time.monotonic() + pause >= deadline:
+                            raise LLMTimeout(f"LLM deadline exceeded while retrying: {e}") from e
+                        time.sleep(pause)
+                        attempt += 1
+                        metrics.LLM_RETRIES.labels('stream').inc()
+                        continue
+                    finally:
+                        stream.close()
+                    self.breaker.record_success()
+                    return
+            finally:
+                self.slots.release()
+
+    def _loop_slots(self):
+        loop = asyncio.get_running_loop()
+        slots = self._async_slots.get(loop)
+        if slots is None:
+            slots = self._async_slots[loop] = asyncio.BoundedSemaphore(self.async_max_concurrency)
+        return slots
+
+    async def astream(self, contents, deadline=None, schema=None):
+        """
+        Yield the model's answer in chunks as they arrive. Failures before the
+        first chunk are retried like ``agenerate``; once text has been yielded a
+        failure raises LLMError, since the caller has already used the output.
+        Each chunk must arrive within LLM_TIMEOUT and before the deadline.
+        """
+        with measured('astream'):
+            deadline = deadline or self.new_deadline()
+            slots = self._loop_slots()
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise LLMTimeout("Timed out waiting for a free LLM slot")
+            try:
+                attempt = 0
+                while True:
+                    if not self.breaker.allow():
+                        raise CircuitOpenError("LLM circuit breaker is open")
+                    if deadline - time.monotonic() <= 0:
+                        raise LLMTimeout("LLM deadline exceeded")
+                    stream = self.provider.astream(contents, timeout=min(self.timeout, deadline - time.monotonic()), schema=schema)
+                    started = False
+                    try:
+                        while True:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                raise LLMTimeout("LLM deadline exceeded while streaming")
+                            try:
+                                chunk = await asyncio.wait_for(stream.__anext__(), timeout=min(self.timeout, remaining))
+                            except StopAsyncIteration:
+                                break
+                            started = True
+                            yield chunk
+                    except (GeneratorExit, asyncio.CancelledError):
+                        # The caller stopped reading (a complete or malformed answer, or the
+                        # client went away): a success once the provider has answered
+                        if started:
+                            self.breaker.record_success()
+                        else:
+                            self.breaker.release_trial()
+                        raise
+                    except Exception as e:
+                        self.breaker.record_failure()
+                        if started or attempt >= self.max_retries or not self.provider.is_retryable(e):
+                            if isinstance(e, LLMError):
+                                raise
+                            raise LLMError(f"LLM stream failed after {attempt + 1} attempt(s): {e!r}") from e
+                        pause = self._backoff(attempt)
+                        if time.monotonic() + pause >= deadline:
+                            raise LLMTimeout(f"LLM deadline exceeded while retrying: {e!r}") from e
+                        await asyncio.sleep(pause)
+                        attempt += 1
+                        metrics.LLM_RETRIES.labels('astream').inc()
+                        continue
+                    finally:
+                        await stream.aclose()
+                    self.breaker.record_success()
+                    return
+            finally:
+                slots.release()
+
+    async def agenerate(self, contents, deadline=None, schema=None):
+        """
+        Async ``generate``: same deadline, retry and circuit breaker rules, but
+        waiting on the model (and on backoff) does not hold a thread.
+        """
+        with measured('agenerate'):
+            deadline = deadline or self.new_deadline()
+            slots = self._loop_slots()
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise LLMTimeout("Timed out waiting for a free LLM slot")
+            try:
+                attempt = 0
+                while True:
+                    if not self.breaker.allow():
+                        raise CircuitOpenError("LLM circuit breaker is open")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise LLMTimeout("LLM deadline exceeded")
+                    timeout = min(self.timeout, remaining)
+                    try:
+                        text = await asyncio.wait_for(self.provider.agenerate(contents, timeout=timeout, schema=schema), timeout=timeout)
+                    except Exception as e:
+                        self.breaker.record_failure()
+                        if attempt >= self.max_retries or not self.provider.is_retryable(e):
+                            raise LLMError(f"LLM call failed after {attempt + 1} attempt(s): {e!r}") from e
+                        pause = self._backoff(attempt)
+                        if time.monotonic() + pause >= deadline:
+                            raise LLMTimeout(f"LLM deadline exceeded while retrying: {e!r}") from e
+                        await asyncio.sleep(pause)
+                        attempt += 1
+                        metrics.LLM_RETRIES.labels('agenerate').inc()
+                        continue
+                    self.breaker.record_success()
+                    return text
+            finally:
+                slots.release()
+
+
+# --- Response cache ---
+
+def response_cache_key(kind, syllabus_hash, level_name, covered_topics=()):
+    """
+    Canonical key for a generation prompt: the syllabus content, the Bloom level
+    and the set of topics to avoid. Seeds, session IDs and history are left out.
+    """
+    topics = sorted({' '.join(t.lower().split()) for t in covered_topics if t})
+    raw = '|'.join([kind, syllabus_hash, level_name] + topics)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    In-process LRU + TTL cache of raw model responses, several per key.
+
+    Reuse policy: a key only serves from the cache once it holds
+    ``min_variants`` different responses (until then every lookup is a miss
+    and the fresh answer is added), and each response is dropped after being
+    served ``max_reuse`` times, so the same prompt keeps producing new questions.
+    """
+
+    def __init__(self, max_keys=1000, ttl=3600, min_variants=3, max_variants=10, max_reuse=20, report_every=100):
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.min_variants = min_variants
+        self.max_variants = max_variants
+        self.max_reuse = max_reuse
+        self.report_every = report_every
+        self.entries = OrderedDict()  # key -> {'expires': t, 'variants': [[label, text, served], ...]}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, key, exclude=(), accept=None):
+        """
+        Return a cached response text for ``key``, skipping variants labelled
+        with anything in ``exclude`` or whose label ``accept(label)`` rejects.
+        """
+        with self.lock:
+            text = self._lookup(key, exclude, accept)
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            lookups = self.hits + self.misses
+        if self.report_every and lookups % self.report_every == 0:
+            logger.info("LLM response cache stats", extra={'stats': self.stats()})
+        return text
+
+    def _lookup(self, key, exclude, accept):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry['expires'] <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        variants = entry['variants']
+        if len(variants) < self.min_variants:
+            return None
+        candidates = [v for v in variants if v[0] not in exclude and (accept is None or accept(v[0]))]
+        if not candidates:
+            return None
+        variant = random.choice(candidates)
+        variant[2] += 1
+        if variant[2] >= self.max_reuse:
+            variants.remove(variant)
+        return variant[1]
+
+    def store(self, key, text, label):
+        """Add a response that parsed successfully; ``label`` identifies it (the question text)."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry['expires'] <= time.monotonic():
+                entry = {'expires': time.monotonic() + self.ttl, 'variants': []}
+                self.entries[key] = entry
+            self.entries.move_to_end(key)
+            variants = entry['variants']
+            if any(v[0] == label for v in variants):
+                return
+            variants.append([label, text, 0])
+            if len(variants) > self.max_variants:
+                variants.pop(0)
+            while len(self.entries) > self.max_keys:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'keys': len(self.entries),
+        }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = 0
+
+
+class NullResponseCache:
+    """Stand-in used when LLM_RESPONSE_CACHE is disabled."""
+
+    def lookup(self, key, exclude=(), accept=None):
+        return None
+
+    def store(self, key, text, label):
+        pass
+
+    def stats(self):
+        return {'hits': 0, 'misses': 0, 'hit_rate': 0.0, 'keys': 0}
+
+    def clear(self):
+        pass
+
+
+_client = None
+_response_cache = None
+_client_lock = threading.Lock()
+
+
+def build_provider():
+    name = getattr(settings, 'LLM_PROVIDER', 'gemini')
+    if name == 'fake':
+        return FakeProvider(latency=getattr(settings, 'LLM_FAKE_LATENCY', 0.0))
+    if name == 'gemini':
+        return GeminiProvider(getattr(settings, 'LLM_MODEL', 'gemini-2.5-flash'), settings.API_KEY)
+    raise ValueError(f"Unknown LLM_PROVIDER: {name}")
+
+
+def get_client():
+    """Return the process-wide client, created from settings on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient(
+                    build_provider(),
+                    timeout=getattr(settings, 'LLM_TIMEOUT', 30.0),
+                    deadline=getattr(settings, 'LLM_DEADLINE', 60.0),
+                    max_retries=getattr(settings, 'LLM_MAX_RETRIES', 2),
+                    max_concurrency=getattr(settings, 'LLM_MAX_CONCURRENCY', 8),
+                    async_max_concurrency=getattr(settings, 'LLM_ASYNC_MAX_CONCURRENCY', 200),
+                    breaker=CircuitBreaker(
+                        getattr(settings, 'LLM_BREAKER_THRESHOLD', 5),
+                        getattr(settings, 'LLM_BREAKER_RESET', 30.0),
+                    ),
+                )
+    return _client
+
+
+def get_response_cache():
+    """Return the process-wide response cache configured by LLM_RESPONSE_CACHE."""
+    global _response_cache
+    if _response_cache is None:
+        with _client_lock:
+            if _response_cache is None:
+                options = {k.lower(): v for k, v in getattr(settings, 'LLM_RESPONSE_CACHE', {}).items()}
+                if options.pop('enabled', True):
+                    _response_cache = ResponseCache(**options)
+                else:
+                    _response_cache = NullResponseCache()
+    return _response_cache
+
+
+def reset_client():
+    """Drop the cached client and response cache (after changing LLM settings, e.g. in tests)."""
+    global _client, _response_cache
+    with _client_lock:
+        _client = None
+        _response_cache = None
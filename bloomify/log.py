@@ -0,0 +1,90 @@
+"""
+Structured, non-blocking logging.
+
+The application loggers (``bloomify``, ``students``, ``teachers``,
+``feedback``; see LOGGING in settings) hand their records to
+``BackgroundQueueHandler``, which only puts them on an in-memory queue. A
+QueueListener thread formats them as one JSON object per line
+(``JsonFormatter``) and writes them to stdout, so a request never waits on a
+slow stdout pipe under gunicorn or supervisord.
+
+Verbose debug events (whole model answers, keyword lists, score breakdowns)
+are sampled: ``SamplingFilter`` keeps LOG_DEBUG_SAMPLE_RATE of the DEBUG
+records and drops the rest before they are queued. Fields passed with
+``extra`` become keys of the JSON object; ``attempt_fields`` gives the
+attempt and session IDs of a quiz attempt.
+"""
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else on a record came from ``extra``
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and the ``extra`` fields."""
+
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update((key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES)
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exc_info'] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Passes every record above DEBUG and a ``rate`` share of the DEBUG ones."""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    Queues records for a listener thread that writes them to ``stream``
+    (stdout by default) through JsonFormatter. Closing the handler (logging
+    does so at exit) writes out whatever is still queued.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        target = logging.StreamHandler(stream or sys.stdout)
+        target.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, target)
+        self.listener.start()
+
+    def prepare(self, record):
+        # Merge the arguments into the message now (they may change before the
+        # listener gets to them), but leave the formatting to the listener
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def close(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+        super().close()
+
+
+def attempt_fields(state):
+    """``extra`` fields naming a quiz attempt, from a QuizState or a generation context."""
+    attempt_id = getattr(state, 'attempt_id', None)
+    if attempt_id is None:
+        attempt_id = state.get('attempt_id')
+    return {'attempt_id': attempt_id or '', 'session_id': state.get('session_id', '')}
@@ -0,0 +1,158 @@
+"""
+Prometheus metrics for the quiz pipeline.
+
+Each stage of a quiz request records into the metrics below:
+
+* ``bloomify_llm_call_seconds`` - LLMClient calls (retries and waiting for a
+  slot included) by method and outcome (ok, error, timeout, circuit_open, or
+  closed when the caller stopped reading a stream), and
+  ``bloomify_llm_retries_total`` for the retried attempts
+* ``bloomify_parse_seconds`` - parsing a whole model answer, by quiz kind and
+  outcome, and ``bloomify_model_answers_total`` for every answer the
+  generators read (parsed, malformed or repeat; streamed and batched too)
+* ``bloomify_quiz_state_seconds`` / ``bloomify_quiz_state_bytes`` - reads and
+  writes of the per-attempt quiz state, by backend operation
+* ``bloomify_feedback_save_seconds`` / ``bloomify_feedback_save_queries`` -
+  ``FeedbackService.save_quiz_feedback``
+
+``metrics_view`` serves them in the Prometheus text format, to
+METRICS_ALLOWED_IPS only. Under gunicorn every worker process keeps its own
+values; with PROMETHEUS_MULTIPROC_DIR set in the server's environment (an
+empty directory shared by the workers, cleared before each start)
+prometheus_client keeps them in per-process files there and the view adds up
+all the workers' values, so a scrape sees the whole server whichever worker
+answers it.
+
+prometheus_client is optional: without it the metrics record nothing and the
+view answers 404.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.http import Http404, HttpResponse
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144)
+QUERY_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class NullMetric:
+    """Stands in for a metric when prometheus_client is not installed."""
+
+    def labels(self, *values, **labels):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+def counter(name, documentation, labels=()):
+    if prometheus_client is None:
+        return NullMetric()
+    return prometheus_client.Counter(name, documentation, labels)
+
+
+def histogram(name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+    if prometheus_client is None:
+        return NullMetric()
+    return prometheus_client.Histogram(name, documentation, labels, buckets=buckets)
+
+
+LLM_CALL_SECONDS = histogram(
+    'bloomify_llm_call_seconds', 'LLMClient calls, retries included, by method and outcome', ['method', 'outcome'],
+)
+LLM_RETRIES = counter('bloomify_llm_retries', 'Model calls retried after a retryable error', ['method'])
+PARSE_SECONDS = histogram(
+    'bloomify_parse_seconds', 'Parsing a whole model answer, by quiz kind and outcome', ['kind', 'outcome'],
+    buckets=FAST_BUCKETS,
+)
+MODEL_ANSWERS = counter(
+    'bloomify_model_answers', 'Model answers read by the question generators, by quiz kind, requested format and outcome',
+    ['kind', 'format', 'outcome'],
+)
+QUIZ_STATE_SECONDS = histogram(
+    'bloomify_quiz_state_seconds', 'Quiz state backend calls, by operation', ['operation'], buckets=FAST_BUCKETS,
+)
+QUIZ_STATE_BYTES = histogram(
+    'bloomify_quiz_state_bytes', 'Size (as JSON) of quiz state read or written, by operation', ['operation'],
+    buckets=SIZE_BUCKETS,
+)
+FEEDBACK_SAVE_SECONDS = histogram('bloomify_feedback_save_seconds', 'FeedbackService.save_quiz_feedback calls')
+FEEDBACK_SAVE_QUERIES = histogram(
+    'bloomify_feedback_save_queries', 'Database queries run by one save_quiz_feedback call', buckets=QUERY_BUCKETS,
+)
+
+
+def is_enabled():
+    return prometheus_client is not None
+
+
+@contextmanager
+def timed(histogram, *labels):
+    """Time the block into ``histogram`` with ``labels`` plus an outcome label: 'ok', or 'failed' when it raises."""
+    started = time.perf_counter()
+    outcome = 'failed'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        histogram.labels(*labels, outcome).observe(time.perf_counter() - started)
+
+
+@contextmanager
+def measure_queries(seconds, queries):
+    """
+    Time the block into the ``seconds`` histogram and count the queries it runs
+    on this thread's database connection into ``queries``.
+    """
+    count = 0
+
+    def count_query(execute, sql, params, many, context):
+        nonlocal count
+        count += 1
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        with connection.execute_wrapper(count_query):
+            yield
+    finally:
+        seconds.observe(time.perf_counter() - started)
+        queries.observe(count)
+
+
+def exposition():
+    """The current metrics in the Prometheus text format, added up over all worker processes in multi-process mode."""
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry, path=directory)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Only answers requests made directly from
+    METRICS_ALLOWED_IPS; anything forwarded by a proxy is refused, since the
+    proxy's own address would otherwise pass for a local one.
+    """
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if (not is_enabled() or request.META.get('REMOTE_ADDR') not in allowed
+            or 'HTTP_X_FORWARDED_FOR' in request.META):
+        raise Http404
+    return HttpResponse(exposition(), content_type=prometheus_client.CONTENT_TYPE_LATEST)
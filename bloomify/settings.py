@@ -149,6 +149,100 @@ LOGIN_URL = '/accounts/login/'
 SESSION_ENGINE = 'django.contrib.sessions.backends.db'
 SESSION_COOKIE_AGE = 86400  # 24 hours
 
+# LLM client (bloomify.llm). LLM_PROVIDER='fake' answers offline, for load tests.
+LLM_PROVIDER = os.environ.get('LLM_PROVIDER', 'gemini')
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gemini-2.5-flash')
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 30))  # seconds per call
+LLM_DEADLINE = float(os.environ.get('LLM_DEADLINE', 60))  # seconds per generated question, retries included
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 2))
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 8))  # in-flight calls per worker process
+LLM_ASYNC_MAX_CONCURRENCY = int(os.environ.get('LLM_ASYNC_MAX_CONCURRENCY', 200))  # in-flight calls per event loop (async views)
+LLM_BREAKER_THRESHOLD = 5  # consecutive failures before failing fast
+LLM_BREAKER_RESET = 30.0  # seconds before a trial call is let through
+LLM_FAKE_LATENCY = float(os.environ.get('LLM_FAKE_LATENCY', 0))
+# 'json': schema-constrained JSON answers (the text parser stays as a fallback); 'text': Topic:/Question: answers
+LLM_OUTPUT_FORMAT = os.environ.get('LLM_OUTPUT_FORMAT', 'json')
+# Estimated tokens per generation request (prompt plus chat history; students.prompts)
+PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', 8000))
+PROMPT_TOPICS_TOKEN_BUDGET = 150  # covered topics listed in a prompt, most recent first
+# Shared answers for identical generation prompts (same syllabus, level and covered topics)
+LLM_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'MAX_KEYS': 1000,  # LRU bound
+    'TTL': 60 * 60,  # seconds a key keeps its responses
+    'MIN_VARIANTS': 3,  # distinct responses collected before a key serves from the cache
+    'MAX_VARIANTS': 10,
+    'MAX_REUSE': 20,  # times one response is served before it is dropped
+    'REPORT_EVERY': 100,  # print hit/miss stats every N lookups (0 disables)
+}
+
+# Per-attempt quiz state (students.quiz_state). Use 'students.quiz_state.CacheBackend'
+# to keep attempts in the cache named by QUIZ_STATE_CACHE_ALIAS (local memory or Redis).
+QUIZ_STATE_BACKEND = os.environ.get('QUIZ_STATE_BACKEND', 'students.quiz_state.DatabaseBackend')
+QUIZ_STATE_CACHE_ALIAS = 'default'
+
+# Background tasks (question pool refills, prefetching, deferred writes)
+BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', 4))
+BACKGROUND_TASKS_ALWAYS_EAGER = False
+
+# Pre-generated MCQ pool per (syllabus, Bloom level)
+QUESTION_POOL_LOW_WATER = int(os.environ.get('QUESTION_POOL_LOW_WATER', 5))
+QUESTION_POOL_TARGET_SIZE = int(os.environ.get('QUESTION_POOL_TARGET_SIZE', 15))
+QUESTION_POOL_MAX_SERVES = int(os.environ.get('QUESTION_POOL_MAX_SERVES', 20))
+
+# Cached per-student quiz score summaries (invalidated when StudentResponse rows change)
+STUDENT_RESULTS_CACHE_TIMEOUT = 60 * 60
+
+# PDF syllabus text extraction (teachers.ingestion, needs the optional pypdf package)
+SYLLABUS_PDF_MAX_PAGES = int(os.environ.get('SYLLABUS_PDF_MAX_PAGES', 500))
+# Seconds after which a pending or processing extraction is taken to be lost (e.g. by a restart)
+SYLLABUS_EXTRACTION_TIMEOUT = 10 * 60
+
+# Cached syllabus catalog for the student dashboard (invalidated when a Syllabus changes)
+SYLLABUS_CATALOG_CACHE_TIMEOUT = 60 * 60
+
+# Write per-question quiz results on the background executor after the quiz ends
+FEEDBACK_DEFERRED_WRITES = os.environ.get('FEEDBACK_DEFERRED_WRITES', 'False') == 'True'
+
+# Speculative generation of the next quiz question while the current one is answered
+QUIZ_PREFETCH_ENABLED = os.environ.get('QUIZ_PREFETCH_ENABLED', 'True') == 'True'
+QUIZ_PREFETCH_TIMEOUT = 600  # seconds a prefetched candidate stays usable
+
+# Render the quiz page at once and stream a question that has to be generated live
+# into it over server-sent events. Only takes effect under ASGI (see README); WSGI
+# requests generate the question inline
+QUIZ_STREAMING_ENABLED = os.environ.get('QUIZ_STREAMING_ENABLED', 'False') == 'True'
+
+# Generate the questions a level still needs (plus spares) in one model call and
+# queue them per attempt, instead of making one call per question
+QUIZ_BATCH_GENERATION = os.environ.get('QUIZ_BATCH_GENERATION', 'False') == 'True'
+QUIZ_BATCH_SPARES = int(os.environ.get('QUIZ_BATCH_SPARES', 2))
+QUIZ_BATCH_TIMEOUT = 3600  # seconds queued questions stay usable
+
+# Application logs: JSON lines on stdout, written by a background thread (bloomify.log).
+# DEBUG events (model answers, keyword and score details) are sampled.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG')
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0.01))
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sample_debug': {'()': 'bloomify.log.SamplingFilter', 'rate': LOG_DEBUG_SAMPLE_RATE},
+    },
+    'handlers': {
+        'queue': {'()': 'bloomify.log.BackgroundQueueHandler', 'filters': ['sample_debug']},
+    },
+    'loggers': {
+        name: {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False}
+        for name in ('bloomify', 'students', 'teachers', 'feedback')
+    },
+}
+
+# Prometheus metrics at /metrics/ (bloomify.metrics), served only to direct requests from these
+# addresses. Under gunicorn, set PROMETHEUS_MULTIPROC_DIR in the server's environment to add up
+# the metrics of all worker processes.
+METRICS_ALLOWED_IPS = os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
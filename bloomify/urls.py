@@ -20,6 +20,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.views.generic import TemplateView
 
+from bloomify import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/auth/', include('django.contrib.auth.urls')),
@@ -28,4 +30,5 @@ urlpatterns = [
     path('teachers/', include('teachers.urls')),
     path('students/', include('students.urls')),
     path('feedback/', include('feedback.urls')),
+    path('metrics/', metrics.metrics_view, name='metrics'),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import QuizFeedback, QuizQuestionResult
+from .models import QuizFeedback, QuizQuestionResult, RegradeCheckpoint
 
 @admin.register(QuizFeedback)
 class QuizFeedbackAdmin(admin.ModelAdmin):
@@ -49,3 +49,8 @@ class QuizQuestionResultAdmin(admin.ModelAdmin):
             'fields': ('created_at',)
         }),
     )
+
+@admin.register(RegradeCheckpoint)
+class RegradeCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['name', 'processed', 'changed', 'last_result_id', 'started_at', 'updated_at', 'finished_at']
+    readonly_fields = ['started_at', 'updated_at']
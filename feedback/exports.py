@@ -0,0 +1,232 @@
+"""
+Streaming exports of quiz results.
+
+Rows come from one query over QuizQuestionResult joined with its QuizFeedback
+(and the student, teacher and syllabus), read with a chunked server-side
+iterator, and are encoded as they are read: CSV a few hundred lines at a time,
+Parquet one row group at a time. Memory use is bounded by the chunk size,
+not by the size of the export. Parquet needs the optional ``pyarrow`` package.
+"""
+import csv
+import importlib.util
+import json
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import QuizFeedback, QuizQuestionResult
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+CHUNK_SIZE = 2000  # Rows fetched from the database per round trip
+CSV_LINES_PER_CHUNK = 500
+PARQUET_ROWS_PER_GROUP = 10000
+
+# (column name, queryset field)
+COLUMNS = [
+    ('feedback_id', 'feedback_id'),
+    ('attempt_created_at', 'feedback__created_at'),
+    ('student', 'feedback__student__username'),
+    ('teacher', 'feedback__teacher__username'),
+    ('syllabus_id', 'feedback__syllabus_id'),
+    ('syllabus_title', 'feedback__syllabus__title'),
+    ('quiz_type', 'feedback__quiz_type'),
+    ('max_level_reached', 'feedback__max_level_reached'),
+    ('feedback_level', 'feedback__feedback_level'),
+    ('attempt_accuracy', 'feedback__accuracy_percentage'),
+    ('result_id', 'id'),
+    ('bloom_level', 'bloom_level'),
+    ('topic', 'topic'),
+    ('question_text', 'question_text'),
+    ('student_answer', 'student_answer'),
+    ('selected_option', 'selected_option'),
+    ('correct_option', 'correct_option'),
+    ('expected_keywords', 'expected_keywords'),
+    ('is_correct', 'is_correct'),
+    ('score_percentage', 'score_percentage'),
+]
+COLUMN_NAMES = [name for name, _ in COLUMNS]
+JSON_COLUMNS = {'expected_keywords'}
+
+
+def parse_filters(params):
+    """
+    Validate export filters from a dict of strings (query parameters or command
+    options): ``teacher``, ``syllabus``, ``quiz_type``, ``start`` and ``end``
+    (inclusive YYYY-MM-DD dates). Raises ValueError for invalid values.
+    """
+    filters = {}
+    for name in ('teacher', 'syllabus'):
+        if params.get(name) not in (None, ''):
+            filters[name] = int(params[name])
+    quiz_type = params.get('quiz_type')
+    if quiz_type:
+        if quiz_type not in dict(QuizFeedback.QUIZ_TYPES):
+            raise ValueError(f"Unknown quiz type: {quiz_type}")
+        filters['quiz_type'] = quiz_type
+    for name in ('start', 'end'):
+        if params.get(name):
+            filters[name] = datetime.strptime(params[name], '%Y-%m-%d').date()
+    return filters
+
+
+def export_queryset(teacher=None, syllabus=None, quiz_type=None, start=None, end=None):
+    """Joined result rows matching the filters, as value tuples in COLUMNS order."""
+    results = QuizQuestionResult.objects.all()
+    if teacher is not None:
+        results = results.filter(feedback__teacher_id=teacher)
+    if syllabus is not None:
+        results = results.filter(feedback__syllabus_id=syllabus)
+    if quiz_type:
+        results = results.filter(feedback__quiz_type=quiz_type)
+    # Compare against datetimes (not __date) so the created_at indexes stay usable
+    tz = timezone.get_current_timezone()
+    if start:
+        results = results.filter(feedback__created_at__gte=datetime.combine(start, time.min, tzinfo=tz))
+    if end:
+        results = results.filter(feedback__created_at__lt=datetime.combine(end + timedelta(days=1), time.min, tzinfo=tz))
+    return results.order_by('feedback_id', 'id').values_list(*[field for _, field in COLUMNS])
+
+
+def iter_rows(queryset):
+    """Rows from a chunked (server-side where supported) cursor, with JSON columns encoded."""
+    json_positions = [i for i, name in enumerate(COLUMN_NAMES) if name in JSON_COLUMNS]
+    for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+        if json_positions:
+            row = list(row)
+            for i in json_positions:
+                row[i] = json.dumps(row[i]) if row[i] is not None else None
+        yield row
+
+
+class _LineBuffer:
+    """File-like object collecting what csv.writer writes."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, value):
+        self.parts.append(value)
+
+    def drain(self):
+        data, self.parts = ''.join(self.parts), []
+        return data
+
+
+def stream_csv(rows):
+    """Yield CSV text in chunks of CSV_LINES_PER_CHUNK lines, header first."""
+    buffer = _LineBuffer()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMN_NAMES)
+    pending = 1
+    for row in rows:
+        writer.writerow(row)
+        pending += 1
+        if pending >= CSV_LINES_PER_CHUNK:
+            yield buffer.drain()
+            pending = 0
+    if pending:
+        yield buffer.drain()
+
+
+class _ByteSink:
+    """Write-only binary file handed to the Parquet writer; drained after each row group."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self.parts.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def parquet_available():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def stream_parquet(rows):
+    """Yield a Parquet file as bytes, one row group of PARQUET_ROWS_PER_GROUP rows at a time."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('feedback_id', pa.int64()),
+        ('attempt_created_at', pa.timestamp('us', tz='UTC')),
+        ('student', pa.string()),
+        ('teacher', pa.string()),
+        ('syllabus_id', pa.int64()),
+        ('syllabus_title', pa.string()),
+        ('quiz_type', pa.string()),
+        ('max_level_reached', pa.int32()),
+        ('feedback_level', pa.string()),
+        ('attempt_accuracy', pa.float64()),
+        ('result_id', pa.int64()),
+        ('bloom_level', pa.string()),
+        ('topic', pa.string()),
+        ('question_text', pa.string()),
+        ('student_answer', pa.string()),
+        ('selected_option', pa.string()),
+        ('correct_option', pa.string()),
+        ('expected_keywords', pa.string()),
+        ('is_correct', pa.bool_()),
+        ('score_percentage', pa.float64()),
+    ])
+    sink = _ByteSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    def row_group(batch):
+        columns = list(zip(*batch))
+        return pa.Table.from_arrays(
+            [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+        )
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= PARQUET_ROWS_PER_GROUP:
+            writer.write_table(row_group(batch))
+            batch = []
+            yield sink.drain()
+    if batch:
+        writer.write_table(row_group(batch))
+    writer.close()
+    yield sink.drain()
+
+
+def stream_export(export_format, filters):
+    """Generator of encoded chunks for an export of ``export_format`` ('csv' or 'parquet')."""
+    rows = iter_rows(export_queryset(**filters))
+    if export_format == 'parquet':
+        return stream_parquet(rows)
+    return stream_csv(rows)
+
+
+def export_filename(export_format, filters):
+    parts = ['quiz_results']
+    if 'syllabus' in filters:
+        parts.append(f"syllabus{filters['syllabus']}")
+    if 'quiz_type' in filters:
+        parts.append(filters['quiz_type'])
+    for name in ('start', 'end'):
+        if name in filters:
+            parts.append(filters[name].isoformat())
+    return f"{'_'.join(parts)}.{FORMATS[export_format][1]}"
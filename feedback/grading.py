@@ -0,0 +1,154 @@
+"""
+Batch re-grading of stored descriptive answers.
+
+After the keyword scorer changes, historical descriptive results can be scored
+again with ``regrade_descriptive_results`` (or ``manage.py regrade_descriptive``).
+Rows are streamed in primary-key order in batches, scored in parallel across
+a process pool and written back with one bulk UPDATE per batch. The highest
+id written is stored in a RegradeCheckpoint in the same transaction as the
+batch, so an interrupted run picks up after the last committed batch.
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import transaction
+from django.utils import timezone
+
+from students.scoring import evaluate_answer, PASS_SCORE
+from . import rollups
+from .models import QuizQuestionResult, RegradeCheckpoint
+from .services import FeedbackService
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def score_rows(rows):
+    """
+    Score ``(id, student_answer, expected_keywords)`` rows. Runs in the worker
+    processes, so it only touches the (Django-free) scorer.
+    """
+    scored = []
+    for result_id, student_answer, expected_keywords in rows:
+        score, details = evaluate_answer(student_answer, expected_keywords, verbose=False)
+        scored.append((result_id, score, score >= PASS_SCORE, details))
+    return scored
+
+
+def descriptive_results():
+    """Stored descriptive answers that have keywords to be scored against."""
+    return QuizQuestionResult.objects.filter(
+        feedback__quiz_type='descriptive',
+        expected_keywords__isnull=False,
+    )
+
+
+def _batches(after_id, batch_size):
+    """Yield batches of result rows with ids above ``after_id`` (keyset pagination)."""
+    queryset = descriptive_results().order_by('id').values_list(
+        'id', 'feedback_id', 'student_answer', 'expected_keywords',
+        'score_percentage', 'is_correct', 'matched_keywords',
+    )
+    while True:
+        batch = list(queryset.filter(id__gt=after_id)[:batch_size])
+        if not batch:
+            return
+        yield batch
+        after_id = batch[-1][0]
+
+
+def _scoring_input(batch):
+    return [(result_id, student_answer, expected_keywords)
+            for result_id, _, student_answer, expected_keywords, _, _, _ in batch]
+
+
+def _write_batch(checkpoint, batch, scored, dry_run):
+    """Write back the rows whose grade changed and advance the checkpoint. Returns the number changed."""
+    current = {row[0]: row for row in batch}
+    changed = []
+    flipped = {}  # result id -> +1 / -1 change in correct answers
+    for result_id, score, is_correct, details in scored:
+        _, feedback_id, _, _, old_score, old_is_correct, old_details = current[result_id]
+        if (score, is_correct, details) != (old_score, old_is_correct, old_details):
+            changed.append((feedback_id, QuizQuestionResult(
+                id=result_id, score_percentage=score, is_correct=is_correct, matched_keywords=details
+            )))
+        if is_correct != old_is_correct:
+            flipped[result_id] = 1 if is_correct else -1
+
+    checkpoint.last_result_id = batch[-1][0]
+    checkpoint.processed += len(batch)
+    checkpoint.changed += len(changed)
+    if dry_run:
+        return len(changed)
+
+    with transaction.atomic():
+        if changed:
+            QuizQuestionResult.objects.bulk_update(
+                [result for _, result in changed],
+                ['score_percentage', 'is_correct', 'matched_keywords'],
+            )
+            # Attempt totals, level summaries and rollups depend on is_correct
+            FeedbackService.refresh_aggregates({feedback_id for feedback_id, _ in changed})
+            if flipped:
+                rollups.adjust_correct(flipped)
+        checkpoint.save()
+    return len(changed)
+
+
+def regrade_descriptive_results(name='default', batch_size=DEFAULT_BATCH_SIZE, workers=None,
+                                restart=False, dry_run=False, progress=None):
+    """
+    Re-score descriptive question results and store the new ``score_percentage``,
+    ``is_correct`` and ``matched_keywords``.
+
+    ``name`` identifies the run's checkpoint; a run with the same name resumes
+    after the last committed batch unless ``restart`` is set. ``workers`` is the
+    process pool size (None: one per CPU, 0: score in this process).
+    ``progress(checkpoint, total, processed_this_run)`` is called after every
+    batch. Returns the checkpoint.
+    """
+    if dry_run:
+        checkpoint = RegradeCheckpoint.objects.filter(name=name).first() or RegradeCheckpoint(name=name)
+    else:
+        checkpoint, _ = RegradeCheckpoint.objects.get_or_create(name=name)
+    # A finished run is started over: the scorer has presumably changed again
+    if restart or checkpoint.finished_at:
+        checkpoint.last_result_id = checkpoint.processed = checkpoint.changed = 0
+        checkpoint.started_at = timezone.now()
+        checkpoint.finished_at = None
+        if not dry_run:
+            checkpoint.save()
+
+    total = checkpoint.processed + descriptive_results().filter(id__gt=checkpoint.last_result_id).count()
+    batches = _batches(checkpoint.last_result_id, batch_size)
+
+    resumed_at = checkpoint.processed
+
+    def finish(batch, scored):
+        _write_batch(checkpoint, batch, scored, dry_run)
+        if progress:
+            progress(checkpoint, total, checkpoint.processed - resumed_at)
+
+    if workers == 0:
+        for batch in batches:
+            finish(batch, score_rows(_scoring_input(batch)))
+    else:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Keep a few batches in flight and write them back in order, so the
+            # checkpoint only ever covers batches that are fully written
+            in_flight = deque()
+            for batch in batches:
+                in_flight.append((batch, pool.submit(score_rows, _scoring_input(batch))))
+                if len(in_flight) >= 2 * workers:
+                    done_batch, future = in_flight.popleft()
+                    finish(done_batch, future.result())
+            while in_flight:
+                done_batch, future = in_flight.popleft()
+                finish(done_batch, future.result())
+
+    checkpoint.finished_at = timezone.now()
+    if not dry_run:
+        checkpoint.save(update_fields=['finished_at', 'updated_at'])
+    return checkpoint
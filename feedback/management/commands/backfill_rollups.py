@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from feedback import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuild the teacher analytics rollup tables from the stored quiz feedback."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--syllabus', type=int, action='append', help='Only rebuild these syllabus IDs')
+
+    def handle(self, *args, **options):
+        topic_rows, attempt_rows = rollups.rebuild(options['syllabus'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rollups rebuilt: {topic_rows} topic rows, {attempt_rows} attempt rows."
+        ))
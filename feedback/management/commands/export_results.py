@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from feedback import exports
+
+
+class Command(BaseCommand):
+    help = "Export quiz results (one row per answered question) as CSV or Parquet, streaming from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(exports.FORMATS), default='csv')
+        parser.add_argument('--output', '-o', help='File to write (default: stdout, CSV only)')
+        parser.add_argument('--teacher', type=int, help='Only results of this teacher ID')
+        parser.add_argument('--syllabus', type=int, help='Only results of this syllabus ID')
+        parser.add_argument('--quiz-type', dest='quiz_type', help='mcq or descriptive')
+        parser.add_argument('--start', help='First day to include (YYYY-MM-DD)')
+        parser.add_argument('--end', help='Last day to include (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        export_format = options['format']
+        if export_format == 'parquet':
+            if not exports.parquet_available():
+                raise CommandError("Parquet export needs the pyarrow package.")
+            if not options['output']:
+                raise CommandError("Parquet export needs --output.")
+        try:
+            filters = exports.parse_filters(options)
+        except ValueError as e:
+            raise CommandError(f"Invalid filter: {e}")
+
+        chunks = exports.stream_export(export_format, filters)
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        if export_format == 'parquet':
+            output = open(options['output'], 'wb')
+        else:
+            output = open(options['output'], 'w', encoding='utf-8', newline='')
+        with output:
+            for chunk in chunks:
+                output.write(chunk)
+        self.stderr.write(self.style.SUCCESS(f"Exported quiz results to {options['output']}"))
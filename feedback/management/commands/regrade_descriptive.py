@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from feedback.grading import regrade_descriptive_results, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Re-score stored descriptive answers with the current keyword scorer. Resumes an interrupted run of the same name."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', default='default', help='Checkpoint name of the run to start or resume')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Results read, scored and written per batch')
+        parser.add_argument('--workers', type=int, default=None, help='Scoring processes (default: one per CPU, 0: no pool)')
+        parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start from the first result')
+        parser.add_argument('--dry-run', action='store_true', help='Count the grades that would change without writing them')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def progress(checkpoint, total, processed_this_run):
+            rate = processed_this_run / max(time.monotonic() - started, 1e-6)
+            percent = (checkpoint.processed / total) * 100 if total else 100.0
+            self.stdout.write(
+                f"{checkpoint.processed}/{total} results ({percent:.1f}%), "
+                f"{checkpoint.changed} changed, {rate:.0f} results/s"
+            )
+
+        checkpoint = regrade_descriptive_results(
+            name=options['name'],
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            restart=options['restart'],
+            dry_run=options['dry_run'],
+            progress=progress,
+        )
+        verb = 'would change' if options['dry_run'] else 'changed'
+        self.stdout.write(self.style.SUCCESS(
+            f"Regrade '{checkpoint.name}' complete: {checkpoint.processed} results scored, {checkpoint.changed} {verb}."
+        ))
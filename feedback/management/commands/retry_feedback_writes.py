@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from feedback.models import QuizFeedback
+from feedback.services import FeedbackService
+
+
+class Command(BaseCommand):
+    help = "Write the question results of deferred feedback saves that failed, or were left pending by a restart."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--feedback', type=int, action='append', help='Only retry these feedback IDs')
+        parser.add_argument('--pending-minutes', type=int, default=10,
+                            help='Also retry attempts pending for at least this many minutes (default 10)')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(minutes=options['pending_minutes'])
+        # Newer pending attempts are most likely still queued on the background executor
+        feedbacks = QuizFeedback.objects.filter(
+            Q(results_status='failed') | Q(results_status='pending', created_at__lte=cutoff)
+        )
+        if options['feedback']:
+            feedbacks = feedbacks.filter(id__in=options['feedback'])
+
+        written = failed = 0
+        for feedback_id in feedbacks.order_by('id').values_list('id', flat=True):
+            if FeedbackService.write_pending_results(feedback_id):
+                written += 1
+                self.stdout.write(f"Feedback {feedback_id}: written")
+            else:
+                failed += 1
+                error = QuizFeedback.objects.filter(id=feedback_id).values_list('results_error', flat=True).first()
+                self.stdout.write(self.style.WARNING(f"Feedback {feedback_id}: failed ({error})"))
+
+        self.stdout.write(self.style.SUCCESS(f"Feedback writes retried. {written} written, {failed} failed."))
@@ -0,0 +1,36 @@
+from django.db import migrations, models
+
+
+def backfill_level_summaries(apps, schema_editor):
+    QuizFeedback = apps.get_model('feedback', 'QuizFeedback')
+    QuizQuestionResult = apps.get_model('feedback', 'QuizQuestionResult')
+
+    summaries = {}
+    for feedback_id, level, is_correct in QuizQuestionResult.objects.values_list('feedback_id', 'bloom_level', 'is_correct').iterator():
+        level_data = summaries.setdefault(feedback_id, {}).setdefault(level, {'total': 0, 'correct': 0})
+        level_data['total'] += 1
+        if is_correct:
+            level_data['correct'] += 1
+
+    feedbacks = []
+    for feedback_id, summary in summaries.items():
+        for level_data in summary.values():
+            level_data['accuracy'] = (level_data['correct'] / level_data['total']) * 100
+        feedbacks.append(QuizFeedback(id=feedback_id, level_summary=summary))
+    QuizFeedback.objects.bulk_update(feedbacks, ['level_summary'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizfeedback',
+            name='level_summary',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(backfill_level_summaries, migrations.RunPython.noop),
+    ]
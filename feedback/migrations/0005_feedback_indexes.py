@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0004_regradecheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quizfeedback',
+            index=models.Index(fields=['student', '-created_at', '-id'], name='feedback_student_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizfeedback',
+            index=models.Index(fields=['teacher', 'syllabus', 'created_at'], name='feedback_teacher_syl_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='quizquestionresult',
+            index=models.Index(fields=['feedback', 'bloom_level'], name='feedback_result_level_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:57
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teachers', '0006_syllabus_chunks'),
+        ('feedback', '0005_feedback_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyllabusTopicRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quiz_type', models.CharField(choices=[('mcq', 'Multiple Choice Questions'), ('descriptive', 'Descriptive Questions')], max_length=20)),
+                ('bloom_level', models.CharField(max_length=20)),
+                ('topic', models.CharField(blank=True, default='', max_length=200)),
+                ('answered', models.IntegerField(default=0)),
+                ('correct', models.IntegerField(default=0)),
+                ('syllabus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='topic_rollups', to='teachers.syllabus')),
+            ],
+            options={
+                'unique_together': {('syllabus', 'day', 'quiz_type', 'bloom_level', 'topic')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SyllabusAttemptRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quiz_type', models.CharField(choices=[('mcq', 'Multiple Choice Questions'), ('descriptive', 'Descriptive Questions')], max_length=20)),
+                ('max_level_reached', models.IntegerField()),
+                ('ended_level', models.CharField(blank=True, default='', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('syllabus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attempt_rollups', to='teachers.syllabus')),
+            ],
+            options={
+                'unique_together': {('syllabus', 'day', 'quiz_type', 'max_level_reached', 'ended_level')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('feedback', '0006_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizfeedback',
+            name='pending_results',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quizfeedback',
+            name='results_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='quizfeedback',
+            name='results_status',
+            field=models.CharField(choices=[('written', 'Written'), ('pending', 'Pending'), ('failed', 'Failed')], default='written', max_length=20),
+        ),
+    ]
@@ -15,6 +15,12 @@ class QuizFeedback(models.Model):
         ('excellent', 'Excellent Knowledge'),
     ]
     
+    RESULTS_STATUSES = [
+        ('written', 'Written'),
+        ('pending', 'Pending'),
+        ('failed', 'Failed'),
+    ]
+    
     student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quiz_feedbacks')
     teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name='given_feedbacks')
     syllabus = models.ForeignKey(Syllabus, on_delete=models.CASCADE)
@@ -27,11 +33,25 @@ class QuizFeedback(models.Model):
     total_questions_attempted = models.IntegerField(default=0)
     total_correct_answers = models.IntegerField(default=0)
     accuracy_percentage = models.FloatField(default=0.0)
+    # Per Bloom level totals, filled in at save time:
+    # {"remember": {"total": 8, "correct": 6, "accuracy": 75.0}, ...}
+    level_summary = models.JSONField(default=dict, blank=True)
+    # Question results written after the attempt (FEEDBACK_DEFERRED_WRITES): they wait
+    # in pending_results until FeedbackService.write_pending_results has written them
+    results_status = models.CharField(max_length=20, choices=RESULTS_STATUSES, default='written')
+    results_error = models.TextField(blank=True, default='')
+    pending_results = models.JSONField(blank=True, null=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Student history pages (keyset pagination on created_at, id; id breaks ties)
+            models.Index(fields=['student', '-created_at', '-id'], name='feedback_student_created_idx'),
+            # Teacher / syllabus reporting
+            models.Index(fields=['teacher', 'syllabus', 'created_at'], name='feedback_teacher_syl_idx'),
+        ]
     
     def __str__(self):
         return f"{self.student.username} - {self.quiz_type} - Level {self.max_level_reached}"
@@ -59,6 +79,63 @@ class QuizQuestionResult(models.Model):
     
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['feedback', 'bloom_level'], name='feedback_result_level_idx'),
+        ]
     
     def __str__(self):
         return f"{self.feedback.student.username} - {self.bloom_level} - {'✓' if self.is_correct else '✗'}"
+
+class RegradeCheckpoint(models.Model):
+    """Progress of a batch re-grade run, so an interrupted run resumes where it stopped."""
+    name = models.CharField(max_length=100, unique=True)
+    last_result_id = models.BigIntegerField(default=0)  # Highest QuizQuestionResult id written
+    processed = models.IntegerField(default=0)
+    changed = models.IntegerField(default=0)
+    
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+    
+    def __str__(self):
+        status = 'finished' if self.finished_at else f'at result {self.last_result_id}'
+        return f"Regrade '{self.name}' - {self.processed} processed, {status}"
+
+class SyllabusTopicRollup(models.Model):
+    """
+    Daily answer totals per syllabus, quiz type, Bloom level and topic.
+    Maintained incrementally by FeedbackService.save_quiz_feedback (see feedback.rollups).
+    """
+    syllabus = models.ForeignKey(Syllabus, on_delete=models.CASCADE, related_name='topic_rollups')
+    day = models.DateField()
+    quiz_type = models.CharField(max_length=20, choices=QuizFeedback.QUIZ_TYPES)
+    bloom_level = models.CharField(max_length=20)
+    topic = models.CharField(max_length=200, blank=True, default='')
+    
+    answered = models.IntegerField(default=0)
+    correct = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('syllabus', 'day', 'quiz_type', 'bloom_level', 'topic')
+    
+    def __str__(self):
+        return f"{self.syllabus.title} - {self.day} - {self.bloom_level} - {self.topic}: {self.correct}/{self.answered}"
+
+class SyllabusAttemptRollup(models.Model):
+    """
+    Daily attempt counts per syllabus and quiz type, by the highest level
+    reached and the level the attempt ended on (its drop-off point).
+    """
+    syllabus = models.ForeignKey(Syllabus, on_delete=models.CASCADE, related_name='attempt_rollups')
+    day = models.DateField()
+    quiz_type = models.CharField(max_length=20, choices=QuizFeedback.QUIZ_TYPES)
+    max_level_reached = models.IntegerField()  # 0-6, 6 = every level passed
+    ended_level = models.CharField(max_length=20, blank=True, default='')
+    
+    attempts = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('syllabus', 'day', 'quiz_type', 'max_level_reached', 'ended_level')
+    
+    def __str__(self):
+        return f"{self.syllabus.title} - {self.day} - level {self.max_level_reached}: {self.attempts}"
@@ -0,0 +1,196 @@
+"""
+Incremental analytics rollups.
+
+Every saved quiz attempt adds its counts to two small tables:
+
+* SyllabusTopicRollup   - answered / correct per (syllabus, day, quiz type, level, topic)
+* SyllabusAttemptRollup - attempts per (syllabus, day, quiz type, max level, ended level)
+
+so the teacher analytics page reads a few rows per syllabus and day instead
+of scanning QuizFeedback / QuizQuestionResult. ``rebuild`` recomputes the
+tables from the raw history (``manage.py backfill_rollups``).
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from students.views.dynamic_quiz_logic import BLOOM_LEVELS
+from .models import QuizFeedback, QuizQuestionResult, SyllabusAttemptRollup, SyllabusTopicRollup
+
+TOPIC_MAX_LENGTH = 200
+
+
+def _topic(topic):
+    return (topic or '')[:TOPIC_MAX_LENGTH]
+
+
+def _increment(model, keys, **deltas):
+    """Add ``deltas`` to the rollup row identified by ``keys``, creating it if needed."""
+    row, created = model.objects.get_or_create(**keys, defaults=deltas)
+    if not created:
+        model.objects.filter(pk=row.pk).update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+
+def record_attempt(quiz_feedback, question_results):
+    """
+    Add a saved attempt and its question results (the dicts passed to
+    save_quiz_feedback) to the rollups. Runs inside the caller's transaction.
+    """
+    day = timezone.localdate(quiz_feedback.created_at)
+    base = {'syllabus_id': quiz_feedback.syllabus_id, 'day': day, 'quiz_type': quiz_feedback.quiz_type}
+
+    answered, correct = Counter(), Counter()
+    for result in question_results:
+        key = (result.get('level', ''), _topic(result.get('topic')))
+        answered[key] += 1
+        if result.get('is_correct'):
+            correct[key] += 1
+
+    for (bloom_level, topic), count in answered.items():
+        _increment(SyllabusTopicRollup, dict(base, bloom_level=bloom_level, topic=topic),
+                   answered=count, correct=correct[(bloom_level, topic)])
+
+    ended_level = question_results[-1].get('level', '') if question_results else ''
+    _increment(SyllabusAttemptRollup, dict(base, max_level_reached=quiz_feedback.max_level_reached, ended_level=ended_level),
+               attempts=1)
+
+
+def adjust_correct(changes):
+    """
+    Apply re-grade results to the rollups. ``changes`` maps QuizQuestionResult
+    ids to +1 (now correct) or -1 (no longer correct).
+    """
+    deltas = Counter()
+    rows = QuizQuestionResult.objects.filter(id__in=list(changes)).values_list(
+        'id', 'feedback__syllabus_id', 'feedback__created_at', 'feedback__quiz_type', 'bloom_level', 'topic'
+    )
+    for result_id, syllabus_id, created_at, quiz_type, bloom_level, topic in rows:
+        key = (syllabus_id, timezone.localdate(created_at), quiz_type, bloom_level, _topic(topic))
+        deltas[key] += changes[result_id]
+
+    for (syllabus_id, day, quiz_type, bloom_level, topic), delta in deltas.items():
+        if delta:
+            SyllabusTopicRollup.objects.filter(
+                syllabus_id=syllabus_id, day=day, quiz_type=quiz_type, bloom_level=bloom_level, topic=topic
+            ).update(correct=F('correct') + delta)
+
+
+def rebuild(syllabus_ids=None):
+    """
+    Recompute the rollups from QuizFeedback / QuizQuestionResult with GROUP BY
+    queries, one syllabus at a time. Returns (topic rows, attempt rows) written.
+    """
+    if syllabus_ids is None:
+        syllabus_ids = QuizFeedback.objects.order_by().values_list('syllabus_id', flat=True).distinct()
+    tz = timezone.get_current_timezone()
+
+    topic_rows = attempt_rows = 0
+    for syllabus_id in list(syllabus_ids):
+        topics = (
+            QuizQuestionResult.objects.filter(feedback__syllabus_id=syllabus_id)
+            .annotate(day=TruncDate('feedback__created_at', tzinfo=tz))
+            .values('day', 'feedback__quiz_type', 'bloom_level', 'topic')
+            .annotate(answered=Count('id'), correct=Count('id', filter=Q(is_correct=True)))
+            .order_by()
+        )
+        # NULL and '' topics, and topics longer than the rollup column, share a row
+        merged = {}
+        for row in topics:
+            key = (row['day'], row['feedback__quiz_type'], row['bloom_level'], _topic(row['topic']))
+            totals = merged.setdefault(key, [0, 0])
+            totals[0] += row['answered']
+            totals[1] += row['correct']
+
+        last_level = (
+            QuizQuestionResult.objects.filter(feedback=OuterRef('pk'))
+            .order_by('-created_at', '-id').values('bloom_level')[:1]
+        )
+        # Attempts whose results are not written yet are added when they are
+        attempts = (
+            QuizFeedback.objects.filter(syllabus_id=syllabus_id, results_status='written')
+            .annotate(day=TruncDate('created_at', tzinfo=tz), ended_level=Subquery(last_level))
+            .values('day', 'quiz_type', 'max_level_reached', 'ended_level')
+            .annotate(attempts=Count('id'))
+            .order_by()
+        )
+
+        with transaction.atomic():
+            SyllabusTopicRollup.objects.filter(syllabus_id=syllabus_id).delete()
+            SyllabusAttemptRollup.objects.filter(syllabus_id=syllabus_id).delete()
+            topic_objects = [
+                SyllabusTopicRollup(
+                    syllabus_id=syllabus_id, day=day, quiz_type=quiz_type, bloom_level=bloom_level, topic=topic,
+                    answered=answered, correct=correct,
+                )
+                for (day, quiz_type, bloom_level, topic), (answered, correct) in merged.items()
+            ]
+            SyllabusTopicRollup.objects.bulk_create(topic_objects, batch_size=500)
+            attempt_objects = [
+                SyllabusAttemptRollup(
+                    syllabus_id=syllabus_id, day=row['day'], quiz_type=row['quiz_type'],
+                    max_level_reached=row['max_level_reached'], ended_level=row['ended_level'] or '',
+                    attempts=row['attempts'],
+                )
+                for row in attempts
+            ]
+            SyllabusAttemptRollup.objects.bulk_create(attempt_objects, batch_size=500)
+        topic_rows += len(topic_objects)
+        attempt_rows += len(attempt_objects)
+    return topic_rows, attempt_rows
+
+
+def syllabus_analytics(syllabus, since=None):
+    """
+    Analytics for one syllabus from the rollups: mastery distribution,
+    drop-off levels, per-level and per-topic accuracy. ``since`` limits the
+    rollup days read.
+    """
+    topic_rows = SyllabusTopicRollup.objects.filter(syllabus=syllabus)
+    attempt_rows = SyllabusAttemptRollup.objects.filter(syllabus=syllabus)
+    if since:
+        topic_rows = topic_rows.filter(day__gte=since)
+        attempt_rows = attempt_rows.filter(day__gte=since)
+
+    levels, topics = {}, {}
+    for bloom_level, topic, answered, correct in topic_rows.values_list('bloom_level', 'topic', 'answered', 'correct'):
+        for bucket, key in ((levels, bloom_level), (topics, topic or 'General')):
+            totals = bucket.setdefault(key, {'answered': 0, 'correct': 0})
+            totals['answered'] += answered
+            totals['correct'] += correct
+    for totals in list(levels.values()) + list(topics.values()):
+        totals['accuracy'] = (totals['correct'] / totals['answered']) * 100 if totals['answered'] else 0.0
+
+    mastery, drop_off = Counter(), Counter()
+    total_attempts = completed = 0
+    for max_level, ended_level, attempts in attempt_rows.values_list('max_level_reached', 'ended_level', 'attempts'):
+        total_attempts += attempts
+        mastery[max_level] += attempts
+        if max_level >= len(BLOOM_LEVELS):
+            completed += attempts
+        else:
+            drop_off[ended_level or 'none'] += attempts
+
+    def share(count):
+        return (count / total_attempts) * 100 if total_attempts else 0.0
+
+    mastery_names = BLOOM_LEVELS + ['all levels']
+    return {
+        'total_attempts': total_attempts,
+        'completed': completed,
+        'mastery': [
+            {'level': mastery_names[i], 'attempts': mastery[i], 'share': share(mastery[i])}
+            for i in range(len(mastery_names))
+        ],
+        'drop_off': [
+            {'level': level, 'attempts': drop_off[level], 'share': share(drop_off[level])}
+            for level in BLOOM_LEVELS if drop_off[level]
+        ],
+        'levels': [dict(levels[level], level=level) for level in BLOOM_LEVELS if level in levels],
+        'topics': sorted(
+            (dict(totals, topic=topic) for topic, totals in topics.items()),
+            key=lambda t: (-t['answered'], t['topic'])
+        ),
+    }
@@ -1,7 +1,17 @@
+import logging
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from asgiref.sync import sync_to_async
 from .models import QuizFeedback, QuizQuestionResult
-from django.contrib.auth.models import User
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from bloomify import background, metrics
+from . import rollups
 from teachers.models import Syllabus
 
+logger = logging.getLogger(__name__)
+
 class FeedbackService:
     """
     Service class to handle quiz feedback generation and storage
@@ -55,69 +65,251 @@ class FeedbackService:
         return (correct_answers / total_questions) * 100
     
     @staticmethod
-    def save_quiz_feedback(student_user, teacher_id, syllabus_id, quiz_type, max_level_reached, question_results):
+    def build_level_summary(results):
         """
-        Save comprehensive quiz feedback to database
+        Per Bloom level totals, correct counts and accuracy from (level, is_correct) pairs
         """
-        try:
-            # Get teacher and syllabus
-            teacher = User.objects.get(id=teacher_id)
-            syllabus = Syllabus.objects.get(id=syllabus_id, teacher=teacher)
-            
-            # Get feedback details
-            feedback_info = FeedbackService.get_feedback_message(max_level_reached)
-            accuracy = FeedbackService.calculate_accuracy(question_results)
-            
-            # Create main feedback record
-            quiz_feedback = QuizFeedback.objects.create(
-                student=student_user,
-                teacher=teacher,
-                syllabus=syllabus,
-                quiz_type=quiz_type,
-                max_level_reached=max_level_reached,
-                feedback_level=feedback_info['level'],
-                feedback_message=feedback_info['message'],
-                total_questions_attempted=len(question_results),
-                total_correct_answers=sum(1 for result in question_results if result['is_correct']),
-                accuracy_percentage=accuracy
+        summary = {}
+        for level, is_correct in results:
+            level_data = summary.setdefault(level, {'total': 0, 'correct': 0})
+            level_data['total'] += 1
+            if is_correct:
+                level_data['correct'] += 1
+        for level_data in summary.values():
+            level_data['accuracy'] = (level_data['correct'] / level_data['total']) * 100
+        return summary
+    
+    @staticmethod
+    def build_question_results(quiz_feedback, question_results):
+        """
+        Build (unsaved) QuizQuestionResult rows for an attempt's results
+        """
+        return [
+            QuizQuestionResult(
+                feedback=quiz_feedback,
+                bloom_level=result.get('level', ''),
+                question_text=result.get('question', ''),
+                student_answer=result.get('student_answer', ''),
+                correct_option=result.get('correct_option', ''),
+                selected_option=result.get('selected_option', ''),
+                expected_keywords=result.get('expected_keywords', []),
+                matched_keywords=result.get('matched_keywords', {}),
+                is_correct=result.get('is_correct', False),
+                score_percentage=result.get('score_percentage', 0.0),
+                topic=result.get('topic', '')
             )
+            for result in question_results
+        ]
+    
+    @staticmethod
+    def write_question_results(quiz_feedback, question_results):
+        """
+        Insert all question results of an attempt and add the attempt to the
+        analytics rollups, in one transaction
+        """
+        with transaction.atomic():
+            QuizQuestionResult.objects.bulk_create(
+                FeedbackService.build_question_results(quiz_feedback, question_results),
+                batch_size=500
+            )
+            rollups.record_attempt(quiz_feedback, question_results)
+    
+    @staticmethod
+    def write_pending_results(feedback_id):
+        """
+        Write the question results of an attempt saved with
+        FEEDBACK_DEFERRED_WRITES (pending, or failed on an earlier try). The
+        results and the status change are committed together, so a retry never
+        writes them twice. Records the outcome in ``results_status``; returns
+        True on success.
+        """
+        try:
+            with transaction.atomic():
+                quiz_feedback = (
+                    QuizFeedback.objects.select_for_update()
+                    .filter(id=feedback_id, results_status__in=['pending', 'failed'])
+                    .first()
+                )
+                if quiz_feedback is None:
+                    return False  # Deleted, or already written
+                FeedbackService.write_question_results(quiz_feedback, quiz_feedback.pending_results or [])
+                quiz_feedback.results_status = 'written'
+                quiz_feedback.results_error = ''
+                quiz_feedback.pending_results = None
+                quiz_feedback.save(update_fields=['results_status', 'results_error', 'pending_results'])
+        except Exception as e:
+            logger.exception("Writing question results failed", extra={'feedback_id': feedback_id})
+            QuizFeedback.objects.filter(id=feedback_id).update(results_status='failed', results_error=str(e))
+            return False
+        return True
+    
+    @staticmethod
+    def save_quiz_feedback(student_user, teacher_id, syllabus_id, quiz_type, max_level_reached, question_results):
+        """
+        Save comprehensive quiz feedback to database.
+        
+        The attempt row (with its aggregates computed up front) and all question
+        results are written in one transaction with a single bulk insert. With
+        FEEDBACK_DEFERRED_WRITES the question results are instead stored on the
+        attempt row (``results_status`` 'pending') and written by the background
+        executor once it is committed, so the request only pays for one INSERT;
+        writes that fail are marked 'failed' and retried by
+        ``manage.py retry_feedback_writes``. Either way the attempt is added to
+        the analytics rollups together with its question results.
+        
+        The time taken and the queries run are recorded in bloomify.metrics.
+        """
+        with metrics.measure_queries(metrics.FEEDBACK_SAVE_SECONDS, metrics.FEEDBACK_SAVE_QUERIES):
+            try:
+                # Get teacher and syllabus in one query
+                syllabus = Syllabus.objects.select_related('teacher').get(id=syllabus_id, teacher_id=teacher_id)
+                teacher = syllabus.teacher
             
-            # Create individual question results
-            for result in question_results:
-                QuizQuestionResult.objects.create(
-                    feedback=quiz_feedback,
-                    bloom_level=result.get('level', ''),
-                    question_text=result.get('question', ''),
-                    student_answer=result.get('student_answer', ''),
-                    correct_option=result.get('correct_option', ''),
-                    selected_option=result.get('selected_option', ''),
-                    expected_keywords=result.get('expected_keywords', []),
-                    matched_keywords=result.get('matched_keywords', {}),
-                    is_correct=result.get('is_correct', False),
-                    score_percentage=result.get('score_percentage', 0.0),
-                    topic=result.get('topic', '')
+                # Precompute aggregates in a single pass
+                question_results = list(question_results)
+                total_correct = sum(1 for result in question_results if result.get('is_correct'))
+                feedback_info = FeedbackService.get_feedback_message(max_level_reached)
+                accuracy = (total_correct / len(question_results)) * 100 if question_results else 0.0
+                level_summary = FeedbackService.build_level_summary(
+                    (result.get('level', ''), result.get('is_correct', False)) for result in question_results
                 )
             
-            return quiz_feedback
+                deferred = getattr(settings, 'FEEDBACK_DEFERRED_WRITES', False)
+                with transaction.atomic():
+                    # Create main feedback record
+                    quiz_feedback = QuizFeedback.objects.create(
+                        student=student_user,
+                        teacher=teacher,
+                        syllabus=syllabus,
+                        quiz_type=quiz_type,
+                        max_level_reached=max_level_reached,
+                        feedback_level=feedback_info['level'],
+                        feedback_message=feedback_info['message'],
+                        total_questions_attempted=len(question_results),
+                        total_correct_answers=total_correct,
+                        accuracy_percentage=accuracy,
+                        level_summary=level_summary,
+                        results_status='pending' if deferred else 'written',
+                        pending_results=question_results if deferred else None
+                    )
+                
+                    # Create individual question results and update the analytics rollups
+                    if deferred:
+                        transaction.on_commit(lambda: background.submit(
+                            FeedbackService.write_pending_results, quiz_feedback.id
+                        ))
+                    else:
+                        FeedbackService.write_question_results(quiz_feedback, question_results)
             
-        except Exception as e:
-            print(f"Error saving feedback: {e}")
-            return None
+                return quiz_feedback
+            
+            except Exception:
+                logger.exception("Error saving feedback", extra={'quiz_type': quiz_type, 'syllabus_id': syllabus_id})
+                return None
+    
+    @staticmethod
+    async def asave_quiz_feedback(student_user, teacher_id, syllabus_id, quiz_type, max_level_reached, question_results):
+        """
+        Async ``save_quiz_feedback`` for the async quiz views. The ORM cannot run
+        a transaction from async code, so the write itself runs through
+        sync_to_async; the event loop stays free while it does.
+        """
+        return await sync_to_async(FeedbackService.save_quiz_feedback)(
+            student_user, teacher_id, syllabus_id, quiz_type, max_level_reached, question_results
+        )
+    
+    @staticmethod
+    def refresh_aggregates(feedback_ids):
+        """
+        Recompute correct counts, accuracy and level summaries of attempts
+        whose question results were changed after saving (e.g. by a re-grade)
+        """
+        results = {}
+        for feedback_id, level, is_correct in QuizQuestionResult.objects.filter(
+            feedback_id__in=feedback_ids
+        ).values_list('feedback_id', 'bloom_level', 'is_correct'):
+            results.setdefault(feedback_id, []).append((level, is_correct))
+        
+        feedbacks = []
+        for feedback_id, level_results in results.items():
+            total_correct = sum(1 for _, is_correct in level_results if is_correct)
+            feedbacks.append(QuizFeedback(
+                id=feedback_id,
+                total_questions_attempted=len(level_results),
+                total_correct_answers=total_correct,
+                accuracy_percentage=(total_correct / len(level_results)) * 100,
+                level_summary=FeedbackService.build_level_summary(level_results)
+            ))
+        QuizFeedback.objects.bulk_update(
+            feedbacks,
+            ['total_questions_attempted', 'total_correct_answers', 'accuracy_percentage', 'level_summary'],
+            batch_size=500
+        )
     
     @staticmethod
     def get_student_feedbacks(student_user):
         """
         Get all feedback records for a student
         """
-        return QuizFeedback.objects.filter(student=student_user).order_by('-created_at')
+        return QuizFeedback.objects.filter(student=student_user).order_by('-created_at', '-id')
+    
+    @staticmethod
+    def encode_history_cursor(feedback):
+        """
+        Opaque cursor pointing just after ``feedback`` in a history listing
+        """
+        raw = f"{feedback.created_at.isoformat()}|{feedback.id}"
+        return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+    
+    @staticmethod
+    def decode_history_cursor(cursor):
+        """
+        (created_at, id) from a history cursor, or None if it is malformed
+        """
+        try:
+            raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            created_at, feedback_id = raw.rsplit('|', 1)
+            return datetime.fromisoformat(created_at), int(feedback_id)
+        except (ValueError, TypeError, UnicodeDecodeError):
+            return None
+    
+    @staticmethod
+    def get_student_feedback_page(student_user, cursor=None, page_size=20):
+        """
+        One page of a student's feedback history, newest first, using keyset
+        pagination on (created_at, id) so every page is an index range scan.
+        Returns (feedbacks, next_cursor); next_cursor is None on the last page.
+        """
+        feedbacks = (
+            FeedbackService.get_student_feedbacks(student_user)
+            .select_related('teacher', 'syllabus')
+        )
+        position = FeedbackService.decode_history_cursor(cursor) if cursor else None
+        if position:
+            created_at, feedback_id = position
+            feedbacks = feedbacks.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=feedback_id)
+            )
+        
+        # Fetch one extra row to know whether there is a next page
+        page = list(feedbacks[:page_size + 1])
+        next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            next_cursor = FeedbackService.encode_history_cursor(page[-1])
+        return page, next_cursor
     
     @staticmethod
     def get_feedback_details(feedback_id):
         """
-        Get detailed feedback with all question results
+        Get detailed feedback with all question results (one query plus one prefetch)
         """
         try:
-            feedback = QuizFeedback.objects.get(id=feedback_id)
+            feedback = (
+                QuizFeedback.objects.select_related('teacher', 'syllabus')
+                .prefetch_related('question_results')
+                .get(id=feedback_id)
+            )
             question_results = feedback.question_results.all()
             
             return {
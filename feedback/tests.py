@@ -1,3 +1,343 @@
-from django.test import TestCase
+import csv
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from bloomify import metrics
+from . import exports, grading, rollups
+from teachers.models import Syllabus
+from .models import QuizFeedback, QuizQuestionResult, RegradeCheckpoint, SyllabusAttemptRollup, SyllabusTopicRollup
+from .services import FeedbackService
+from .views import HISTORY_PAGE_SIZE
+
+
+def descriptive_result(answer, is_correct=False, score=0.0, level='remember', topic='Loops'):
+    """A question result dict as the descriptive quiz passes it to save_quiz_feedback."""
+    return {
+        'level': level, 'question': f'Explain {topic.lower()}', 'student_answer': answer, 'topic': topic,
+        'expected_keywords': ['loop', 'repeat'], 'matched_keywords': {}, 'is_correct': is_correct,
+        'score_percentage': score,
+    }
+
+
+class FeedbackHistoryPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', password='pass')
+        cls.student = User.objects.create_user('student', password='pass')
+        other = User.objects.create_user('other', password='pass')
+        cls.syllabus = Syllabus.objects.create(teacher=cls.teacher, title='Python', content='Variables and loops')
+        for user, count in ((cls.student, HISTORY_PAGE_SIZE * 2 + 5), (other, 3)):
+            QuizFeedback.objects.bulk_create([
+                QuizFeedback(
+                    student=user, teacher=cls.teacher, syllabus=cls.syllabus, quiz_type='mcq',
+                    max_level_reached=i % 6, feedback_level='basic', feedback_message='Keep going'
+                )
+                for i in range(count)
+            ])
+
+    def setUp(self):
+        self.client.force_login(self.student)
+
+    def test_pages_cover_history_once_newest_first(self):
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = FeedbackService.get_student_feedback_page(self.student, cursor, HISTORY_PAGE_SIZE)
+            seen.extend(page)
+            if cursor is None:
+                break
+        expected = list(QuizFeedback.objects.filter(student=self.student).order_by('-created_at', '-id'))
+        self.assertEqual(seen, expected)
+
+    def test_history_page_query_count(self):
+        # session, user, one page of feedback (teacher and syllabus joined),
+        # plus the two permission lookups of the base template
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('feedback:feedback_history'))
+        self.assertEqual(len(response.context['feedbacks']), HISTORY_PAGE_SIZE)
+        self.assertIsNotNone(response.context['next_cursor'])
+
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse('feedback:feedback_history'), {'cursor': response.context['next_cursor']})
+        self.assertEqual(len(response.context['feedbacks']), HISTORY_PAGE_SIZE)
+
+    def test_malformed_cursor_shows_first_page(self):
+        response = self.client.get(reverse('feedback:feedback_history'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['feedbacks']), HISTORY_PAGE_SIZE)
+
+    def test_history_query_uses_student_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plan assertions are written for SQLite')
+        page = FeedbackService.get_student_feedbacks(self.student).select_related('teacher', 'syllabus')
+        plan = page[:HISTORY_PAGE_SIZE + 1].explain()
+        self.assertIn('feedback_student_created_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+
+class FeedbackSaveMetricsTests(TestCase):
+    def test_save_records_time_and_query_count(self):
+        if not metrics.is_enabled():
+            self.skipTest('prometheus_client is not installed')
+        from prometheus_client import REGISTRY
+
+        teacher = User.objects.create_user('teacher', password='pass')
+        student = User.objects.create_user('student', password='pass')
+        syllabus = Syllabus.objects.create(teacher=teacher, title='Python', content='Variables and loops')
+        saves = REGISTRY.get_sample_value('bloomify_feedback_save_seconds_count') or 0.0
+        queries = REGISTRY.get_sample_value('bloomify_feedback_save_queries_sum') or 0.0
+
+        results = [{'level': 'remember', 'is_correct': True, 'question': 'Q1', 'student_answer': 'A'}]
+        with CaptureQueriesContext(connection) as captured:
+            self.assertIsNotNone(FeedbackService.save_quiz_feedback(student, teacher.id, syllabus.id, 'mcq', 1, results))
+        self.assertEqual(REGISTRY.get_sample_value('bloomify_feedback_save_seconds_count'), saves + 1)
+        self.assertEqual(REGISTRY.get_sample_value('bloomify_feedback_save_queries_sum'), queries + len(captured))
+
+
+
+@override_settings(FEEDBACK_DEFERRED_WRITES=True, BACKGROUND_TASKS_ALWAYS_EAGER=True)
+class DeferredFeedbackWriteTests(TestCase):
+    results = [
+        {'level': 'remember', 'is_correct': True, 'question': 'Q1', 'student_answer': 'A', 'topic': 'Loops'},
+        {'level': 'understand', 'is_correct': False, 'question': 'Q2', 'student_answer': 'B', 'topic': 'Loops'},
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', password='pass')
+        cls.student = User.objects.create_user('student', password='pass')
+        cls.syllabus = Syllabus.objects.create(teacher=cls.teacher, title='Python', content='Variables and loops')
+
+    def setUp(self):
+        self.client.force_login(self.student)
+
+    def save(self):
+        return FeedbackService.save_quiz_feedback(self.student, self.teacher.id, self.syllabus.id, 'mcq', 1, self.results)
+
+    def detail_page(self, feedback):
+        return self.client.get(reverse('feedback:detailed_feedback', args=[feedback.id])).content.decode()
+
+    def test_results_written_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            feedback = self.save()
+        feedback.refresh_from_db()
+        self.assertEqual(feedback.results_status, 'pending')
+        self.assertEqual(feedback.pending_results, self.results)
+        self.assertFalse(QuizQuestionResult.objects.filter(feedback=feedback).exists())
+        self.assertIn('still being saved', self.detail_page(feedback))
+
+        for callback in callbacks:
+            callback()
+        feedback.refresh_from_db()
+        self.assertEqual(feedback.results_status, 'written')
+        self.assertIsNone(feedback.pending_results)
+        self.assertEqual(QuizQuestionResult.objects.filter(feedback=feedback).count(), 2)
+        self.assertEqual(SyllabusAttemptRollup.objects.get(syllabus=self.syllabus).attempts, 1)
+        self.assertNotIn('still being saved', self.detail_page(feedback))
+
+    def test_failed_write_is_flagged_and_retried_once(self):
+        with mock.patch('feedback.rollups.record_attempt', side_effect=RuntimeError('database went away')):
+            with self.assertLogs('feedback.services', 'ERROR'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    feedback = self.save()
+        feedback.refresh_from_db()
+        self.assertEqual(feedback.results_status, 'failed')
+        self.assertEqual(feedback.results_error, 'database went away')
+        self.assertEqual(feedback.pending_results, self.results)
+        # The bulk insert was rolled back with the failed rollup update
+        self.assertFalse(QuizQuestionResult.objects.filter(feedback=feedback).exists())
+        self.assertIn('could not be saved yet', self.detail_page(feedback))
+
+        out = StringIO()
+        call_command('retry_feedback_writes', stdout=out)
+        self.assertIn('1 written, 0 failed', out.getvalue())
+        feedback.refresh_from_db()
+        self.assertEqual(feedback.results_status, 'written')
+        self.assertEqual(feedback.results_error, '')
+
+        # Written attempts are not picked up again
+        self.assertFalse(FeedbackService.write_pending_results(feedback.id))
+        self.assertEqual(QuizQuestionResult.objects.filter(feedback=feedback).count(), 2)
+        self.assertEqual(SyllabusAttemptRollup.objects.get(syllabus=self.syllabus).attempts, 1)
+        self.assertEqual(sum(SyllabusTopicRollup.objects.values_list('answered', flat=True)), 2)
+
+    def test_recent_pending_attempts_are_left_to_the_executor(self):
+        with self.captureOnCommitCallbacks():
+            feedback = self.save()
+        out = StringIO()
+        call_command('retry_feedback_writes', stdout=out)
+        self.assertIn('0 written, 0 failed', out.getvalue())
+        call_command('retry_feedback_writes', pending_minutes=0, stdout=out)
+        feedback.refresh_from_db()
+        self.assertEqual(feedback.results_status, 'written')
+
+
+class RegradeResumeTests(TestCase):
+    class Interrupted(Exception):
+        pass
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = User.objects.create_user('teacher', password='pass')
+        student = User.objects.create_user('student', password='pass')
+        syllabus = Syllabus.objects.create(teacher=teacher, title='Python', content='Variables and loops')
+        # Good answers are saved with a stale failing grade, so re-grading changes them;
+        # empty answers score 0 either way
+        for answers in (['A loop repeats code', ''], ['Loops repeat steps', '', 'We repeat it in a loop'], ['', 'loop']):
+            FeedbackService.save_quiz_feedback(
+                student, teacher.id, syllabus.id, 'descriptive', 1, [descriptive_result(answer) for answer in answers]
+            )
+
+    def test_interrupted_run_resumes_without_grading_twice(self):
+        graded = []
+
+        def recording_score_rows(rows):
+            graded.extend(result_id for result_id, _, _ in rows)
+            return score_rows(rows)
+
+        def stop_after_two_batches(checkpoint, total, processed_this_run):
+            if processed_this_run >= 4:
+                raise self.Interrupted
+
+        score_rows = grading.score_rows
+        # A dry run under another name counts the changes without writing them
+        expected_changed = grading.regrade_descriptive_results('preview', workers=0, dry_run=True).changed
+        self.assertGreater(expected_changed, 0)
+
+        with mock.patch.object(grading, 'score_rows', recording_score_rows):
+            with self.assertRaises(self.Interrupted):
+                grading.regrade_descriptive_results('resume', batch_size=2, workers=0, progress=stop_after_two_batches)
+            checkpoint = RegradeCheckpoint.objects.get(name='resume')
+            self.assertEqual(checkpoint.processed, 4)
+            self.assertIsNone(checkpoint.finished_at)
+
+            checkpoint = grading.regrade_descriptive_results('resume', batch_size=2, workers=0)
+
+        all_ids = list(grading.descriptive_results().order_by('id').values_list('id', flat=True))
+        self.assertEqual(graded, all_ids)
+        self.assertEqual(checkpoint.processed, len(all_ids))
+        self.assertEqual(checkpoint.changed, expected_changed)
+        self.assertIsNotNone(checkpoint.finished_at)
+        checkpoint.refresh_from_db()
+        self.assertEqual((checkpoint.processed, checkpoint.changed), (len(all_ids), expected_changed))
+
+
+class RollupRebuildTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        teacher = User.objects.create_user('teacher', password='pass')
+        student = User.objects.create_user('student', password='pass')
+        cls.syllabus = Syllabus.objects.create(teacher=teacher, title='Python', content='Variables and loops')
+        mcq = [
+            {'level': 'remember', 'is_correct': True, 'question': 'Q1', 'topic': 'Variables'},
+            {'level': 'understand', 'is_correct': False, 'question': 'Q2', 'topic': None},
+            {'level': 'understand', 'is_correct': True, 'question': 'Q3', 'topic': ''},
+        ]
+        descriptive = [
+            descriptive_result('A loop repeats code'),
+            descriptive_result('', level='understand'),
+            descriptive_result('We repeat it in a loop', level='apply', topic='Iteration'),
+        ]
+        for quiz_type, max_level, results in (
+                ('mcq', 2, mcq), ('mcq', 0, mcq[:1]), ('mcq', 0, []),
+                ('descriptive', 1, descriptive), ('descriptive', 3, descriptive[:2])):
+            FeedbackService.save_quiz_feedback(student, teacher.id, cls.syllabus.id, quiz_type, max_level, results)
+
+    def rollup_rows(self):
+        return (
+            sorted(SyllabusTopicRollup.objects.values_list(
+                'syllabus_id', 'day', 'quiz_type', 'bloom_level', 'topic', 'answered', 'correct')),
+            sorted(SyllabusAttemptRollup.objects.values_list(
+                'syllabus_id', 'day', 'quiz_type', 'max_level_reached', 'ended_level', 'attempts')),
+        )
+
+    def assert_matches_rebuild(self):
+        incremental = self.rollup_rows()
+        rollups.rebuild()
+        self.assertEqual(incremental, self.rollup_rows())
+        return incremental
+
+    def test_incremental_rollups_match_rebuild(self):
+        topics, attempts = self.assert_matches_rebuild()
+        self.assertEqual(sum(row[-1] for row in attempts), 5)
+        # NULL and '' topics share a row
+        self.assertIn((self.syllabus.id, topics[0][1], 'mcq', 'understand', '', 2, 1), topics)
+
+    def test_regrade_adjustments_match_rebuild(self):
+        correct_before = sum(SyllabusTopicRollup.objects.values_list('correct', flat=True))
+        checkpoint = grading.regrade_descriptive_results('rollups', workers=0)
+        self.assertGreater(checkpoint.changed, 0)
+        topics, _ = self.assert_matches_rebuild()
+        self.assertGreater(sum(row[-1] for row in topics), correct_before)
+
+
+class ExportResultsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', password='pass')
+        cls.other_teacher = User.objects.create_user('other_teacher', password='pass')
+        cls.staff = User.objects.create_user('staff', password='pass', is_staff=True)
+        student = User.objects.create_user('student', password='pass')
+        for teacher, attempts in ((cls.teacher, 3), (cls.other_teacher, 1)):
+            syllabus = Syllabus.objects.create(teacher=teacher, title='Python', content='Variables and loops')
+            for _ in range(attempts):
+                FeedbackService.save_quiz_feedback(student, teacher.id, syllabus.id, 'descriptive', 1, [
+                    descriptive_result('A loop repeats code', is_correct=True, score=100.0),
+                    descriptive_result('', level='understand'),
+                ])
+
+    def export(self, user, **params):
+        self.client.force_login(user)
+        return self.client.get(reverse('feedback:export_results'), params)
+
+    def test_csv_header_and_chunks(self):
+        rows = [[i] * len(exports.COLUMN_NAMES) for i in range(7)]
+        with mock.patch.object(exports, 'CSV_LINES_PER_CHUNK', 3):
+            chunks = list(exports.stream_csv(rows))
+        # The header counts towards the first chunk
+        self.assertEqual([chunk.count('\n') for chunk in chunks], [3, 3, 2])
+        lines = list(csv.reader(StringIO(''.join(chunks))))
+        self.assertEqual(lines[0], exports.COLUMN_NAMES)
+        self.assertEqual(lines[1:], [[str(value) for value in row] for row in rows])
+
+    def test_teacher_export_is_limited_to_own_results(self):
+        # A teacher cannot widen the export by asking for another teacher's results
+        response = self.export(self.teacher, teacher=self.other_teacher.id)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual({row['teacher'] for row in rows}, {'teacher'})
+        self.assertEqual(rows[0]['expected_keywords'], '["loop", "repeat"]')
+
+    def test_staff_export_covers_every_teacher(self):
+        rows = list(csv.DictReader(StringIO(b''.join(self.export(self.staff).streaming_content).decode())))
+        self.assertEqual(len(rows), 8)
+        self.assertEqual({row['teacher'] for row in rows}, {'teacher', 'other_teacher'})
+
+        response = self.export(self.staff, teacher=self.other_teacher.id)
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual({row['teacher'] for row in rows}, {'other_teacher'})
+
+    def test_parquet_row_groups(self):
+        if not exports.parquet_available():
+            self.skipTest('pyarrow is not installed')
+        import pyarrow.parquet as pq
+
+        with mock.patch.object(exports, 'PARQUET_ROWS_PER_GROUP', 4):
+            response = self.export(self.staff, format='parquet')
+            parquet = pq.ParquetFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(parquet.schema_arrow.names, exports.COLUMN_NAMES)
+        self.assertEqual(parquet.metadata.num_rows, 8)
+        self.assertEqual(parquet.num_row_groups, 2)
+
+    def test_parquet_without_pyarrow_is_refused(self):
+        with mock.patch.object(exports, 'parquet_available', return_value=False):
+            response = self.export(self.staff, format='parquet')
+        self.assertEqual(response.status_code, 400)
@@ -9,4 +9,5 @@ urlpatterns = [
     # New comprehensive feedback URLs
     path('detailed/<int:feedback_id>/', views.detailed_feedback, name='detailed_feedback'),
     path('history/', views.feedback_history, name='feedback_history'),
+    path('export/', views.export_results, name='export_results'),
 ]
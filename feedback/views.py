@@ -1,10 +1,13 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from teachers.models import Quiz, Question
+from teachers.models import Quiz
 from students.models import StudentResponse, StudentFeedback
-from .models import QuizFeedback, QuizQuestionResult
 from .services import FeedbackService
+from . import exports
+
+HISTORY_PAGE_SIZE = 20
 
 @login_required
 def view_feedback(request, quiz_id):
@@ -88,23 +91,25 @@ def detailed_feedback(request, feedback_id):
     question_results = feedback_data['question_results']
     
     # Ensure the student can only see their own feedback
-    if feedback.student != request.user:
+    if feedback.student_id != request.user.id:
         messages.error(request, "You can only view your own feedback.")
         return redirect('students:dashboard')
     
-    # Organize results by Bloom's taxonomy level
-    levels_data = {}
+    # Organize results by Bloom's taxonomy level, from the prefetched results
     bloom_levels = ['remember', 'understand', 'apply', 'analyze', 'evaluate', 'create']
+    questions_by_level = {}
+    for result in question_results:
+        questions_by_level.setdefault(result.bloom_level, []).append(result)
     
+    # Attempts saved before level summaries existed are summarized on the fly
+    level_summary = feedback.level_summary or FeedbackService.build_level_summary(
+        (result.bloom_level, result.is_correct) for result in question_results
+    )
+    
+    levels_data = {}
     for level in bloom_levels:
-        level_questions = question_results.filter(bloom_level=level)
-        if level_questions.exists():
-            levels_data[level] = {
-                'questions': level_questions,
-                'total': level_questions.count(),
-                'correct': level_questions.filter(is_correct=True).count(),
-                'accuracy': (level_questions.filter(is_correct=True).count() / level_questions.count()) * 100 if level_questions.count() > 0 else 0
-            }
+        if level in level_summary:
+            levels_data[level] = dict(level_summary[level], questions=questions_by_level.get(level, []))
     
     context = {
         'feedback': feedback,
@@ -121,10 +126,38 @@ def feedback_history(request):
     """
     Display all feedback history for the current student
     """
-    feedbacks = FeedbackService.get_student_feedbacks(request.user)
+    cursor = request.GET.get('cursor')
+    feedbacks, next_cursor = FeedbackService.get_student_feedback_page(
+        request.user, cursor=cursor, page_size=HISTORY_PAGE_SIZE
+    )
     
     context = {
-        'feedbacks': feedbacks
+        'feedbacks': feedbacks,
+        'next_cursor': next_cursor,
+        'is_first_page': not cursor
     }
     
     return render(request, 'feedback/feedback_history.html', context)
+
+@login_required
+def export_results(request):
+    """
+    Stream quiz results as CSV (default) or Parquet. Staff can export any
+    teacher's results; teachers only their own.
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in exports.FORMATS:
+        return HttpResponseBadRequest("Unknown export format.")
+    if export_format == 'parquet' and not exports.parquet_available():
+        return HttpResponseBadRequest("Parquet export needs the pyarrow package.")
+    try:
+        filters = exports.parse_filters(request.GET)
+    except ValueError as e:
+        return HttpResponseBadRequest(f"Invalid filter: {e}")
+    if not request.user.is_staff:
+        filters['teacher'] = request.user.id
+    
+    content_type, _ = exports.FORMATS[export_format]
+    response = StreamingHttpResponse(exports.stream_export(export_format, filters), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{exports.export_filename(export_format, filters)}"'
+    return response
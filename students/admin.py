@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import StudentResponse, StudentFeedback
+from .models import StudentResponse, StudentFeedback, PooledQuestion
 
 @admin.register(StudentResponse)
 class StudentResponseAdmin(admin.ModelAdmin):
@@ -56,3 +56,13 @@ class StudentFeedbackAdmin(admin.ModelAdmin):
     def get_queryset(self, request):
         queryset = super().get_queryset(request)
         return queryset.select_related('student', 'quiz')
+
+@admin.register(PooledQuestion)
+class PooledQuestionAdmin(admin.ModelAdmin):
+    list_display = ['syllabus', 'bloom_level', 'times_served', 'created_at']
+    list_filter = ['bloom_level', 'syllabus']
+    readonly_fields = ['question_hash', 'created_at']
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return queryset.select_related('syllabus')
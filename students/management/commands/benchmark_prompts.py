@@ -0,0 +1,62 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from students.prompts import estimate_tokens, fit_history, turn_tokens
+from students.quiz_state import SYSTEM_ACKNOWLEDGEMENTS, SYSTEM_INSTRUCTIONS
+from students.views.descriptive_quiz_logic import build_descriptive_prompt
+from students.views.dynamic_quiz_logic import build_mcq_prompt
+
+BUILDERS = {'mcq': build_mcq_prompt, 'descriptive': build_descriptive_prompt}
+SYLLABUS_CONTEXT = (
+    "Course outline (Python):\n" + '\n'.join(f"- Module {i}: topic summary {i}" for i in range(12)) +
+    "\n\nBase the question on this section of the syllabus:\nSection: Module 3\n---\n" + "for and while loops " * 70 + "\n---"
+)
+
+
+def simulate_attempt(engine, questions):
+    """A generation context after ``questions`` questions, each with its own topic and a full exchange in the history."""
+    history = [
+        {'role': 'user', 'parts': [SYSTEM_INSTRUCTIONS[engine].format(session_id='bench')]},
+        {'role': 'model', 'parts': [SYSTEM_ACKNOWLEDGEMENTS[engine]]},
+    ]
+    topics = [f"Module {i % 12}: concept number {i}" for i in range(questions)]
+    for topic in topics:
+        history.append({'role': 'user', 'parts': [BUILDERS[engine](SYLLABUS_CONTEXT, 'apply', {'session_id': 'bench'})]})
+        history.append({'role': 'model', 'parts': [f"Topic: {topic}\nQuestion: What about {topic}?"]})
+    return {'session_id': 'bench', 'asked_questions': [], 'asked_topics': topics, 'chat_history': history}
+
+
+def measure(engine, questions, repeats=50):
+    """
+    Estimated tokens sent for the next question of an attempt of ``questions``
+    questions (prompt plus history), and the mean seconds to build them.
+    """
+    context = simulate_attempt(engine, questions)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        run = dict(context, chat_history=list(context['chat_history']))
+        prompt = BUILDERS[engine](SYLLABUS_CONTEXT, 'apply', run)
+        history = fit_history(run, estimate_tokens(prompt))
+    elapsed = (time.perf_counter() - started) / repeats
+    return estimate_tokens(prompt) + sum(turn_tokens(turn) for turn in history), elapsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the estimated size and build time of the generation prompt (with its chat history) "
+        "as a quiz attempt grows, for both quiz engines."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 50, 200],
+                            help='Attempt lengths (questions already asked) to measure')
+        parser.add_argument('--repeats', type=int, default=50, help='Builds timed per measurement')
+
+    def handle(self, *args, **options):
+        for engine in BUILDERS:
+            for questions in options['sizes']:
+                tokens, seconds = measure(engine, questions, options['repeats'])
+                self.stdout.write(
+                    f"{engine:<12} {questions:>5} questions: ~{tokens} tokens, built in {seconds * 1000:.2f} ms"
+                )
@@ -0,0 +1,20 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from students.models import QuizAttemptState
+
+
+class Command(BaseCommand):
+    help = "Delete abandoned quiz attempts from the database quiz state backend (like clearsessions)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age', type=int, default=settings.SESSION_COOKIE_AGE,
+                            help='Delete attempts not updated for this many seconds')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(seconds=options['max_age'])
+        deleted, _ = QuizAttemptState.objects.filter(updated_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} quiz attempt rows."))
@@ -0,0 +1,198 @@
+import html
+import json
+import re
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+
+from teachers.models import Syllabus
+
+ANSWER_RE = re.compile(r'name="answer"[^>]*value="([^"]*)"')
+STREAM_URL_RE = re.compile(r'data-stream-url="([^"]+)"')
+QUIZ_PATHS = {
+    'mcq': ('/students/start-dynamic-quiz/', 'syllabus', '/students/dynamic-quiz/'),
+    'descriptive': ('/students/start-descriptive-quiz/', 'syllabus_id', '/students/descriptive-quiz/'),
+}
+
+
+class SimulatedStudent:
+    """One student driving a quiz over HTTP with its own cookie jar."""
+
+    def __init__(self, base_url, username, password, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+
+    def csrf_token(self):
+        return next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+
+    def request(self, path, data=None):
+        url = self.base_url + path
+        headers = {}
+        body = None
+        if data is not None:
+            body = urlencode(dict(data, csrfmiddlewaretoken=self.csrf_token())).encode()
+            headers = {'X-CSRFToken': self.csrf_token(), 'Referer': url}
+        with self.opener.open(Request(url, data=body, headers=headers), timeout=self.timeout) as response:
+            return response.status, response.read().decode('utf-8', 'replace')
+
+    def read_stream(self, path, started):
+        """
+        Read a question's server-sent events. Returns the 'done' payload (None if
+        the stream ended otherwise) and the seconds until the first question text.
+        """
+        first_text = None
+        event = None
+        with self.opener.open(Request(self.base_url + path), timeout=self.timeout) as response:
+            for raw in response:
+                line = raw.decode('utf-8', 'replace').rstrip('\n')
+                if line.startswith('event: '):
+                    event = line[len('event: '):]
+                elif line.startswith('data: '):
+                    if first_text is None and event in ('topic', 'question_partial', 'question'):
+                        first_text = time.monotonic() - started
+                    if event == 'done':
+                        return json.loads(line[len('data: '):]), first_text
+                    if event in ('redirect', 'failed'):
+                        return None, first_text
+        return None, first_text
+
+    def run(self, quiz_type, syllabus_id, questions):
+        """
+        Log in, start a quiz and answer ``questions`` questions. Returns the
+        latencies until each question could be answered, and for streamed
+        questions the latencies until their first text was shown.
+        """
+        start_path, syllabus_field, quiz_path = QUIZ_PATHS[quiz_type]
+        self.request('/accounts/login/')
+        self.request('/accounts/login/', {'username': self.username, 'password': self.password})
+        self.request(start_path, {syllabus_field: syllabus_id, 'num_per_taxonomy': 3, 'num_questions': 3})
+
+        latencies, first_text_latencies = [], []
+        for _ in range(questions):
+            started = time.monotonic()
+            _, page = self.request(quiz_path)
+            stream = STREAM_URL_RE.search(page)
+            streamed = None
+            if stream:
+                streamed, first_text = self.read_stream(html.unescape(stream.group(1)), started)
+                if first_text is not None:
+                    first_text_latencies.append(first_text)
+                if streamed is None:
+                    break
+            latencies.append(time.monotonic() - started)
+            if quiz_type == 'mcq':
+                if streamed:
+                    answer = {'answer': streamed['options'][0]}
+                else:
+                    match = ANSWER_RE.search(page)
+                    if not match:
+                        break  # Quiz over (or the question could not be generated)
+                    answer = {'answer': html.unescape(match.group(1))}
+            else:
+                if not streamed and 'name="student_answer"' not in page:
+                    break
+                answer = {'student_answer': 'A function groups statements; a loop repeats them over a variable.'}
+            self.request(quiz_path, answer)
+        return latencies, first_text_latencies
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive concurrent simulated students through a quiz against a running server and report "
+        "question latency and throughput. Start the server with LLM_PROVIDER=fake (and e.g. "
+        "LLM_FAKE_LATENCY=2) under both gunicorn (bloomify.wsgi) and an ASGI server such as "
+        "uvicorn (bloomify.asgi:application) to compare how each scales with concurrency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the running server')
+        parser.add_argument('--students', type=int, default=100, help='Concurrent simulated students')
+        parser.add_argument('--questions', type=int, default=3, help='Questions each student answers')
+        parser.add_argument('--quiz-type', choices=sorted(QUIZ_PATHS), default='mcq')
+        parser.add_argument('--syllabus', type=int, help='Syllabus to quiz on (default: the first one)')
+        parser.add_argument('--prefix', default='loadtest', help='Username prefix of the simulated students')
+        parser.add_argument('--password', default='loadtest-password')
+        parser.add_argument('--create-users', action='store_true',
+                            help='Create the student accounts in this database first (the server must share it)')
+        parser.add_argument('--timeout', type=float, default=120.0, help='Per-request timeout in seconds')
+
+    def handle(self, *args, **options):
+        syllabus_id = options['syllabus'] or Syllabus.objects.order_by('id').values_list('id', flat=True).first()
+        if not syllabus_id:
+            raise CommandError("No syllabus to run the quiz on; upload one or pass --syllabus.")
+        usernames = [f"{options['prefix']}{i}" for i in range(options['students'])]
+        if options['create_users']:
+            self.create_users(usernames, options['password'])
+
+        latencies, first_text_latencies, errors = [], [], []
+        lock = threading.Lock()
+
+        def run_student(username):
+            student = SimulatedStudent(options['url'], username, options['password'], options['timeout'])
+            try:
+                result, first_text = student.run(options['quiz_type'], syllabus_id, options['questions'])
+            except (HTTPError, URLError, OSError) as e:
+                with lock:
+                    errors.append(f"{username}: {e}")
+                return
+            with lock:
+                latencies.extend(result)
+                first_text_latencies.extend(first_text)
+
+        self.stdout.write(
+            f"{options['students']} students x {options['questions']} {options['quiz_type']} questions "
+            f"against {options['url']}"
+        )
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['students']) as pool:
+            list(pool.map(run_student, usernames))
+        elapsed = time.monotonic() - started
+
+        self.report(latencies, first_text_latencies, errors, elapsed)
+
+    def create_users(self, usernames, password):
+        group, _ = Group.objects.get_or_create(name='student')
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        for username in usernames:
+            if username not in existing:
+                user = User.objects.create_user(username, password=password)
+                user.groups.add(group)
+        self.stdout.write(f"Created {len(usernames) - len(existing)} student accounts.")
+
+    def report(self, latencies, first_text_latencies, errors, elapsed):
+        def summary(values):
+            ordered = sorted(values)
+
+            def percentile(p):
+                return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+            return (
+                f"mean {statistics.mean(ordered):.2f}s, p50 {percentile(50):.2f}s, "
+                f"p95 {percentile(95):.2f}s, p99 {percentile(99):.2f}s, max {ordered[-1]:.2f}s"
+            )
+
+        if latencies:
+            self.stdout.write(
+                f"Question pages: {len(latencies)} in {elapsed:.1f}s ({len(latencies) / elapsed:.1f}/s); "
+                f"latency {summary(latencies)}"
+            )
+        if first_text_latencies:
+            self.stdout.write(
+                f"Streamed questions: {len(first_text_latencies)}; first text shown after {summary(first_text_latencies)}"
+            )
+        for error in errors[:10]:
+            self.stdout.write(self.style.WARNING(error))
+        result = f"Load test finished: {len(errors)} student(s) failed."
+        self.stdout.write(self.style.SUCCESS(result) if not errors else self.style.ERROR(result))
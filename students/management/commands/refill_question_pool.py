@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from teachers.models import Syllabus
+from students.question_pool import QuestionPool, low_water
+from students.views.dynamic_quiz_logic import BLOOM_LEVELS
+
+
+class Command(BaseCommand):
+    help = "Refill the pre-generated MCQ pool for every (syllabus, Bloom level) bucket below the low-water mark."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--syllabus', type=int, action='append', help='Only refill these syllabus IDs')
+        parser.add_argument('--level', choices=BLOOM_LEVELS, action='append', help='Only refill these Bloom levels')
+        parser.add_argument('--target', type=int, help='Questions to keep per bucket (default QUESTION_POOL_TARGET_SIZE)')
+        parser.add_argument('--force', action='store_true', help='Refill even when above the low-water mark')
+
+    def handle(self, *args, **options):
+        syllabi = Syllabus.objects.all()
+        if options['syllabus']:
+            syllabi = syllabi.filter(id__in=options['syllabus'])
+        levels = options['level'] or BLOOM_LEVELS
+
+        total_added = 0
+        for syllabus_id in syllabi.values_list('id', flat=True):
+            for level_name in levels:
+                available = QuestionPool.available(syllabus_id, level_name).count()
+                if available >= low_water() and not options['force']:
+                    continue
+                added = QuestionPool.refill(syllabus_id, level_name, target=options['target'])
+                total_added += added
+                self.stdout.write(f"Syllabus {syllabus_id} / {level_name}: {available} available, added {added}")
+
+        self.stdout.write(self.style.SUCCESS(f"Question pool refill complete. Added {total_added} questions."))
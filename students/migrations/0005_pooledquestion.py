@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teachers', '0005_delete_choice'),
+        ('students', '0004_studentresponse_student_college_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PooledQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bloom_level', models.CharField(choices=[('remember', 'Remember'), ('understand', 'Understand'), ('apply', 'Apply'), ('analyze', 'Analyze'), ('evaluate', 'Evaluate'), ('create', 'Create')], max_length=20)),
+                ('question_hash', models.CharField(max_length=40)),
+                ('question_data', models.JSONField()),
+                ('times_served', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('syllabus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pooled_questions', to='teachers.syllabus')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['syllabus', 'bloom_level', 'times_served'], name='students_po_syllabu_5e4778_idx')],
+                'unique_together': {('syllabus', 'bloom_level', 'question_hash')},
+            },
+        ),
+    ]
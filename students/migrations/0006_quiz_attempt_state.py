@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0005_pooledquestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizAttemptState',
+            fields=[
+                ('attempt_id', models.CharField(max_length=32, primary_key=True, serialize=False)),
+                ('quiz_type', models.CharField(max_length=20)),
+                ('counters', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuizAttemptEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('list_name', models.CharField(max_length=20)),
+                ('key', models.CharField(blank=True, default='', max_length=40)),
+                ('data', models.JSONField()),
+                ('attempt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='students.quizattemptstate')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['attempt', 'list_name', 'key'], name='students_qu_attempt_2ca3ca_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+from students.similarity import encode, signature
+
+
+def backfill_signatures(apps, schema_editor):
+    PooledQuestion = apps.get_model('students', 'PooledQuestion')
+
+    pooled = [
+        PooledQuestion(id=pk, signature=encode(signature(data.get('question', ''))))
+        for pk, data in PooledQuestion.objects.values_list('id', 'question_data').iterator()
+    ]
+    PooledQuestion.objects.bulk_update(pooled, ['signature'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('students', '0006_quiz_attempt_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pooledquestion',
+            name='signature',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(backfill_signatures, migrations.RunPython.noop),
+    ]
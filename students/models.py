@@ -1,6 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
-from teachers.models import Quiz, Question
+from teachers.models import Quiz, Question, Syllabus
 
 class StudentResponse(models.Model):
     student = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
@@ -41,3 +41,48 @@ class StudentFeedback(models.Model):
     
     def __str__(self):
         return f"{self.student.username} - {self.quiz.title} Feedback"
+
+class PooledQuestion(models.Model):
+    """A pre-generated MCQ kept in the question bank for a (syllabus, Bloom level) bucket."""
+    syllabus = models.ForeignKey(Syllabus, on_delete=models.CASCADE, related_name='pooled_questions')
+    bloom_level = models.CharField(max_length=20, choices=Question.BLOOM_LEVELS)
+    question_hash = models.CharField(max_length=40)
+    question_data = models.JSONField()  # question, options, correct_answer, topic
+    signature = models.TextField(blank=True, default='')  # Encoded MinHash signature (students.similarity)
+    times_served = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('syllabus', 'bloom_level', 'question_hash')
+        indexes = [
+            models.Index(fields=['syllabus', 'bloom_level', 'times_served']),
+        ]
+
+    def __str__(self):
+        return f"{self.syllabus.title} - {self.bloom_level} - {self.question_data.get('question', '')[:50]}"
+
+class QuizAttemptState(models.Model):
+    """Counters of an in-progress quiz attempt (see students.quiz_state)."""
+    attempt_id = models.CharField(max_length=32, primary_key=True)
+    quiz_type = models.CharField(max_length=20)
+    counters = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.quiz_type} attempt {self.attempt_id}"
+
+class QuizAttemptEntry(models.Model):
+    """An append-only item of an attempt: asked question hash, signature, topic, result or question payload."""
+    attempt = models.ForeignKey(QuizAttemptState, on_delete=models.CASCADE, related_name='entries')
+    list_name = models.CharField(max_length=20)
+    key = models.CharField(max_length=40, blank=True, default='')
+    data = models.JSONField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['attempt', 'list_name', 'key']),
+        ]
+
+    def __str__(self):
+        return f"{self.attempt_id} - {self.list_name}"
@@ -0,0 +1,163 @@
+"""
+Speculative prefetching of the next quiz question.
+
+While a student reads question N, candidates for question N+1 are generated
+concurrently on an asyncio loop: at the current level when the level still has
+questions left, otherwise one level up and one level down. The GET that follows
+the answer POST then takes the matching candidate instead of waiting on the model.
+
+Under ASGI the pipeline runs on the server's own event loop, bound by
+``bloomify.asgi``; under WSGI a private loop thread is started on first use.
+Candidates are kept in the default cache under the attempt ID, so they are
+shared between workers whenever the cache backend is.
+"""
+import asyncio
+import copy
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+
+from .similarity import question_index
+
+logger = logging.getLogger(__name__)
+
+BLOOM_LEVELS = ['remember', 'understand', 'apply', 'analyze', 'evaluate', 'create']
+
+_loop = None
+_loop_lock = threading.Lock()
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def bind_loop(loop):
+    """Run prefetch tasks on an existing event loop (the ASGI server loop)."""
+    global _loop
+    _loop = loop
+
+
+def get_loop():
+    """Return the loop prefetch tasks run on, starting a private one if needed."""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        with _loop_lock:
+            if _loop is None or _loop.is_closed():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='bloomify-prefetch', daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def is_enabled():
+    return getattr(settings, 'QUIZ_PREFETCH_ENABLED', True)
+
+
+def prefetch_timeout():
+    return getattr(settings, 'QUIZ_PREFETCH_TIMEOUT', 600)
+
+
+def cache_key(kind, attempt_id, level_name):
+    return f"prefetch:{kind}:{attempt_id}:{level_name}"
+
+
+def candidate_levels(quiz_state, num_per_taxonomy):
+    """
+    Levels question N+1 can be asked at, given the student is answering question N.
+    Mid-level the next question stays at the current level; on the last question
+    of a level the student either moves up or down.
+    """
+    level_index = quiz_state['level_index']
+    if quiz_state['questions_answered_in_level'] + 1 < num_per_taxonomy:
+        indexes = [level_index]
+    else:
+        indexes = [level_index + 1, level_index - 1]
+    return [BLOOM_LEVELS[i] for i in indexes if 0 <= i < len(BLOOM_LEVELS)]
+
+
+def _with_connections(fn, *args):
+    """
+    Run ``fn`` on a worker thread the way bloomify.background runs its tasks:
+    the thread's database connection is checked before and closed after, so
+    the threads of asyncio.to_thread do not keep connections open.
+    """
+    close_old_connections()
+    try:
+        return fn(*args)
+    finally:
+        close_old_connections()
+
+
+async def _generate_candidates(kind, attempt_id, generate, syllabus, context, levels):
+    async def generate_one(level_name):
+        key = cache_key(kind, attempt_id, level_name)
+        try:
+            # Each level gets its own copy of the conversation so runs don't interleave
+            question = await asyncio.to_thread(_with_connections, generate, syllabus, level_name, copy.deepcopy(context))
+            if question:
+                await asyncio.to_thread(_with_connections, cache.set, key, question, prefetch_timeout())
+        except Exception as e:
+            logger.warning("Prefetch failed: %s", e, extra={'attempt_id': attempt_id, 'bloom_level': level_name})
+        finally:
+            with _in_flight_lock:
+                _in_flight.discard(key)
+
+    await asyncio.gather(*(generate_one(level_name) for level_name in levels))
+
+
+def prefetch_next(kind, attempt_id, generate, syllabus, quiz_state, current_question, num_per_taxonomy, levels=None):
+    """
+    Start generating candidates for the student's next question.
+
+    ``generate(syllabus, level_name, context)`` is the engine's generation
+    function; it runs on a snapshot of the attempt's generation context that
+    already counts the current question (and its topic) as asked.
+    """
+    if not (is_enabled() and attempt_id):
+        return
+    levels = candidate_levels(quiz_state, num_per_taxonomy) if levels is None else levels
+
+    pending = []
+    with _in_flight_lock:
+        for level_name in levels:
+            key = cache_key(kind, attempt_id, level_name)
+            if key not in _in_flight:
+                _in_flight.add(key)
+                pending.append(level_name)
+    if not pending:
+        return
+
+    snapshot = quiz_state.generation_context()
+    if current_question.get('question') not in snapshot['asked_questions']:
+        snapshot['asked_questions'].append(current_question.get('question', ''))
+        question_index(snapshot).add(current_question.get('question', ''))
+    coro = _generate_candidates(kind, attempt_id, generate, syllabus, snapshot, pending)
+
+    if getattr(settings, 'BACKGROUND_TASKS_ALWAYS_EAGER', False):
+        asyncio.run(coro)
+    else:
+        asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+def take(kind, attempt_id, level_name, quiz_state):
+    """
+    Pop the prefetched candidate for a level, unless it is a near duplicate of
+    a question the attempt (``quiz_state``) has already asked.
+    """
+    if not (is_enabled() and attempt_id):
+        return None
+    key = cache_key(kind, attempt_id, level_name)
+    question = cache.get(key)
+    if question is None:
+        return None
+    cache.delete(key)
+    if quiz_state.question_index().is_duplicate(question.get('question', '')):
+        return None
+    return question
+
+
+def discard(kind, attempt_id):
+    """Drop any leftover candidates when an attempt ends."""
+    if attempt_id:
+        cache.delete_many([cache_key(kind, attempt_id, level_name) for level_name in BLOOM_LEVELS])
@@ -0,0 +1,151 @@
+"""
+Prompt building for the quiz engines.
+
+Each engine describes its prompt once per (level, output format, batch size)
+as a ``PromptTemplate``: the static text (level definition, examples,
+guidelines, output format) is assembled when the template is first
+compiled, and a request only fills in the few slots that change
+(session, seed, syllabus context, topics to avoid). Engines cache their
+compiled templates with functools.lru_cache.
+
+Sizes are estimated with ``estimate_tokens`` (about CHARS_PER_TOKEN
+characters per token, which is close enough to budget with and costs nothing
+to compute). Two budgets keep a prompt from growing with the attempt:
+
+* the covered topics listed in a prompt are the most recent ones that fit in
+  PROMPT_TOPICS_TOKEN_BUDGET
+* ``fit_history`` cuts the chat history sent with a prompt down to
+  PROMPT_TOKEN_BUDGET, dropping the oldest exchanges first and replacing them
+  with a one-line summary of the topics they covered
+"""
+import re
+
+from django.conf import settings
+
+CHARS_PER_TOKEN = 4
+SYSTEM_TURNS = 2  # The system instruction and the model's acknowledgement
+SUMMARY_PREFIX = "Earlier questions in this session covered: "
+SUMMARY_ACKNOWLEDGEMENT = "Noted. I will cover different topics."
+
+SLOT_RE = re.compile(r'\{(\w+)\}')
+TOPIC_RE = re.compile(r'^\s*"?topic"?\s*:\s*"?([^"\n]+?)"?\s*,?\s*$', re.IGNORECASE | re.MULTILINE)
+JSON_TOPIC_RE = re.compile(r'"topic"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+def token_budget():
+    return getattr(settings, 'PROMPT_TOKEN_BUDGET', 8000)
+
+
+def topics_token_budget():
+    return getattr(settings, 'PROMPT_TOPICS_TOKEN_BUDGET', 150)
+
+
+def estimate_tokens(text):
+    """Rough token count of ``text``."""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def turn_tokens(turn):
+    return sum(estimate_tokens(str(part)) for part in turn.get('parts', []))
+
+
+class PromptTemplate:
+    """
+    Prompt text with ``{name}`` slots, split into static pieces once so that
+    rendering is a single join.
+    """
+
+    def __init__(self, source):
+        pieces = SLOT_RE.split(source)
+        self.static = pieces[0::2]
+        self.slots = pieces[1::2]
+
+    def render(self, **values):
+        parts = [self.static[0]]
+        for slot, text in zip(self.slots, self.static[1:]):
+            parts.append(str(values[slot]))
+            parts.append(text)
+        return ''.join(parts)
+
+
+def recent_within(items, budget):
+    """The most recent ``items`` whose comma-joined text fits in ``budget`` tokens, oldest first."""
+    kept, used = [], 0
+    for item in reversed(items):
+        cost = estimate_tokens(item) + 1
+        if used + cost > budget:
+            break
+        kept.append(item)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+def topic_instruction(covered_topics):
+    """The TOPIC VARIETY line, listing only the most recent covered topics that fit the topics budget."""
+    recent = recent_within(list(covered_topics), topics_token_budget())
+    if not recent:
+        return "Cover any relevant topic from the syllabus."
+    return f"AVOID these already covered topics: {', '.join(recent)}"
+
+
+def answer_topics(text):
+    """Topics named in a model answer, in either output format."""
+    return JSON_TOPIC_RE.findall(text) or TOPIC_RE.findall(text)
+
+
+def _summary_topics(turn):
+    text = ' '.join(str(part) for part in turn.get('parts', []))
+    if not text.startswith(SUMMARY_PREFIX):
+        return None
+    return [topic for topic in text[len(SUMMARY_PREFIX):].rstrip('.').split('; ') if topic]
+
+
+def fit_history(context, reserve):
+    """
+    Cut the context's ``chat_history`` so that it plus ``reserve`` tokens (the
+    prompt about to be sent) fits in PROMPT_TOKEN_BUDGET. The system turns are
+    kept; the oldest exchanges go first, and the topics of the ones dropped are
+    folded into a summary exchange after the system turns. Stores and returns
+    the new history.
+    """
+    history = context['chat_history']
+    system, body = history[:SYSTEM_TURNS], history[SYSTEM_TURNS:]
+    summarized = _summary_topics(body[0]) if body else None
+    if summarized is not None:
+        body = body[2:]
+    summarized = summarized or []
+
+    available = token_budget() - reserve - sum(turn_tokens(turn) for turn in system)
+    available -= estimate_tokens(SUMMARY_PREFIX + SUMMARY_ACKNOWLEDGEMENT) + topics_token_budget()
+    # Keep whole user/model exchanges, newest first, so the turns keep alternating;
+    # only the kept turns are measured, whatever the length of the history
+    keep, used = len(body), 0
+    while keep >= 2:
+        cost = turn_tokens(body[keep - 2]) + turn_tokens(body[keep - 1])
+        if used + cost > available:
+            break
+        used += cost
+        keep -= 2
+    dropped, body = body[:keep], body[keep:]
+
+    # Topics of the dropped answers, newest first, until the summary is full
+    recent, cost = [], 0
+    for turn in reversed(dropped):
+        if cost >= topics_token_budget():
+            break
+        if turn.get('role') == 'model':
+            topics = answer_topics(' '.join(str(part) for part in turn.get('parts', [])))
+            recent[:0] = topics
+            cost += sum(estimate_tokens(topic) + 1 for topic in topics)
+    summarized = recent_within(summarized + recent, topics_token_budget())
+
+    summary = []
+    if summarized:
+        summary = [
+            {'role': 'user', 'parts': [SUMMARY_PREFIX + '; '.join(summarized) + '.']},
+            {'role': 'model', 'parts': [SUMMARY_ACKNOWLEDGEMENT]},
+        ]
+    if dropped or summary:
+        context['chat_history'] = system + summary + body
+    return context['chat_history']
@@ -0,0 +1,81 @@
+"""
+Per-attempt queues of questions generated in batches.
+
+With QUIZ_BATCH_GENERATION on, a question that has to be generated live is
+generated together with the rest of its level: one model call asks for the
+questions the level still needs plus QUIZ_BATCH_SPARES extras, the first is
+shown and the others are queued here under the attempt ID and level. Later
+questions of the level are taken from the queue, skipping any that turned into
+near duplicates of a question asked since, so a level of 3, 6 or 8 questions
+costs one model round trip instead of one per question. Spares cover those
+skips and a return to the level after a downgrade.
+
+Queues live in the default cache, like prefetched candidates, so they are
+shared between workers whenever the cache backend is.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+BLOOM_LEVELS = ['remember', 'understand', 'apply', 'analyze', 'evaluate', 'create']
+
+
+def is_enabled():
+    return getattr(settings, 'QUIZ_BATCH_GENERATION', False)
+
+
+def batch_timeout():
+    return getattr(settings, 'QUIZ_BATCH_TIMEOUT', 3600)
+
+
+def queue_key(kind, attempt_id, level_name):
+    return f"batch:{kind}:{attempt_id}:{level_name}"
+
+
+def batch_size(quiz_state, num_per_taxonomy):
+    """Questions to ask for: the rest of the current level plus the spares."""
+    remaining = max(1, num_per_taxonomy - quiz_state['questions_answered_in_level'])
+    return remaining + getattr(settings, 'QUIZ_BATCH_SPARES', 2)
+
+
+def put(kind, attempt_id, level_name, questions):
+    """Queue the extra questions of a batch, after any still queued for the level."""
+    if not questions:
+        return
+    key = queue_key(kind, attempt_id, level_name)
+    cache.set(key, (cache.get(key) or []) + list(questions), batch_timeout())
+
+
+def take(kind, attempt_id, level_name, quiz_state):
+    """
+    Pop the next queued question for a level that is not a near duplicate of
+    one the attempt (``quiz_state``) has already asked. Returns None when the
+    queue is empty or batching is off.
+    """
+    if not (is_enabled() and attempt_id):
+        return None
+    key = queue_key(kind, attempt_id, level_name)
+    queued = cache.get(key)
+    if not queued:
+        return None
+    index = quiz_state.question_index()
+    question = None
+    while queued and question is None:
+        candidate = queued.pop(0)
+        if not index.is_duplicate(candidate.get('question', '')):
+            question = candidate
+    if queued:
+        cache.set(key, queued, batch_timeout())
+    else:
+        cache.delete(key)
+    return question
+
+
+def queued_levels(kind, attempt_id, levels):
+    """The levels among ``levels`` that still have queued questions."""
+    keys = {queue_key(kind, attempt_id, level_name): level_name for level_name in levels}
+    return [keys[key] for key, queued in cache.get_many(list(keys)).items() if queued]
+
+
+def discard(kind, attempt_id):
+    """Drop the queues of an attempt that has ended."""
+    cache.delete_many([queue_key(kind, attempt_id, level_name) for level_name in BLOOM_LEVELS])
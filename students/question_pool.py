@@ -0,0 +1,157 @@
+"""
+Question bank for the dynamic (MCQ) quiz.
+
+Questions are pre-generated per (syllabus, Bloom level) bucket and served from
+the database, so a student only waits on the model when a bucket runs dry.
+A background refill keeps every bucket above QUESTION_POOL_LOW_WATER.
+"""
+import hashlib
+import random
+import re
+import threading
+
+from django.conf import settings
+from django.db.models import Count, F
+
+from bloomify import background
+from .models import PooledQuestion
+from .similarity import QuestionIndex, decode, encode, signature
+
+
+def low_water():
+    return getattr(settings, 'QUESTION_POOL_LOW_WATER', 5)
+
+
+def target_size():
+    return getattr(settings, 'QUESTION_POOL_TARGET_SIZE', 15)
+
+
+def max_serves():
+    return getattr(settings, 'QUESTION_POOL_MAX_SERVES', 20)
+
+
+# Buckets with a refill already queued in this process
+_pending_refills = set()
+_pending_lock = threading.Lock()
+
+
+def question_hash(question_text):
+    """Stable hash of a question, insensitive to case and whitespace."""
+    normalized = re.sub(r'\s+', ' ', (question_text or '').strip().lower())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+class QuestionPool:
+    """
+    Service class to serve and refill pooled questions
+    """
+
+    @staticmethod
+    def available(syllabus_id, level_name):
+        return PooledQuestion.objects.filter(
+            syllabus_id=syllabus_id, bloom_level=level_name, times_served__lt=max_serves()
+        )
+
+    @staticmethod
+    def levels_running_low(syllabus_id, levels):
+        """Return the levels whose bucket is below the low-water mark, in one query."""
+        counts = dict(
+            PooledQuestion.objects.filter(
+                syllabus_id=syllabus_id, bloom_level__in=levels, times_served__lt=max_serves()
+            ).values_list('bloom_level').annotate(n=Count('id'))
+        )
+        return [level_name for level_name in levels if counts.get(level_name, 0) < low_water()]
+
+    @staticmethod
+    def draw(syllabus_id, level_name, asked_questions=(), asked_index=None):
+        """
+        Take a random pooled question the student has not seen yet: neither
+        one of ``asked_questions`` nor a near duplicate of a question in
+        ``asked_index`` (a students.similarity.QuestionIndex of the attempt).
+        Returns the question dict, or None when the bucket has nothing left.
+        """
+        asked_hashes = {question_hash(q) for q in asked_questions if q}
+        candidates = list(
+            QuestionPool.available(syllabus_id, level_name).values_list('id', 'question_hash', 'signature')
+        )
+        remaining = len(candidates)
+        candidates = [
+            pk for pk, qhash, sig in candidates
+            if qhash not in asked_hashes and not (asked_index and sig and asked_index.is_duplicate_signature(decode(sig)))
+        ]
+
+        question = None
+        while candidates and question is None:
+            pk = candidates.pop(random.randrange(len(candidates)))
+            # Guarded update so concurrent workers never over-serve an entry
+            served = PooledQuestion.objects.filter(pk=pk, times_served__lt=max_serves()).update(
+                times_served=F('times_served') + 1
+            )
+            if served:
+                question = PooledQuestion.objects.values_list('question_data', flat=True).get(pk=pk)
+
+        if question is None or remaining < low_water():
+            QuestionPool.schedule_refill(syllabus_id, level_name)
+        return question
+
+    @staticmethod
+    def add(syllabus_id, level_name, question_data):
+        """
+        Store a generated question in its bucket. Returns False for a duplicate
+        or a near duplicate (see students.similarity) of a question already in it.
+        """
+        sig = signature(question_data.get('question'))
+        bucket = PooledQuestion.objects.filter(syllabus_id=syllabus_id, bloom_level=level_name).exclude(signature='')
+        if QuestionIndex.from_signatures(bucket.values_list('signature', flat=True)).is_duplicate_signature(sig):
+            return False
+        _, created = PooledQuestion.objects.get_or_create(
+            syllabus_id=syllabus_id,
+            bloom_level=level_name,
+            question_hash=question_hash(question_data.get('question')),
+            defaults={'question_data': question_data, 'signature': encode(sig)},
+        )
+        return created
+
+    @staticmethod
+    def refill(syllabus_id, level_name, target=None, max_attempts=None):
+        """
+        Generate questions until the bucket holds ``target`` servable entries.
+        Returns the number of questions added.
+        """
+        from .views.dynamic_quiz_logic import generate_pool_question
+
+        target = target or target_size()
+        missing = target - QuestionPool.available(syllabus_id, level_name).count()
+        attempts_left = max_attempts or missing * 2
+        added = 0
+        while missing > 0 and attempts_left > 0:
+            attempts_left -= 1
+            existing = [
+                data.get('question', '') for data in
+                PooledQuestion.objects.filter(syllabus_id=syllabus_id, bloom_level=level_name)
+                .values_list('question_data', flat=True)
+            ]
+            question = generate_pool_question(syllabus_id, level_name, existing)
+            if not question or not QuestionPool.add(syllabus_id, level_name, question):
+                continue
+            missing -= 1
+            added += 1
+        return added
+
+    @staticmethod
+    def schedule_refill(syllabus_id, level_name):
+        """Queue a background refill for a bucket unless one is already pending."""
+        key = (int(syllabus_id), level_name)
+        with _pending_lock:
+            if key in _pending_refills:
+                return
+            _pending_refills.add(key)
+
+        def run():
+            try:
+                QuestionPool.refill(syllabus_id, level_name)
+            finally:
+                with _pending_lock:
+                    _pending_refills.discard(key)
+
+        background.submit(run)
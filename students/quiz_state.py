@@ -0,0 +1,380 @@
+"""
+Per-attempt quiz state store.
+
+The session only carries an attempt ID; the attempt itself lives in a
+pluggable backend (QUIZ_STATE_BACKEND) with a compact layout:
+
+* counters  - the small dict of scalars (level, counts, current question hash)
+* questions - each question payload stored once, keyed by its hash
+* asked / topics / results - append-only lists; results reference questions
+  by hash instead of repeating their text
+* signatures - MinHash signatures of the asked questions, which the
+  generators check new questions against (students.similarity)
+
+Requests only rewrite the counters that changed and append new list items,
+instead of pickling the whole quiz into the session row on every page view.
+The chat history sent to the model is rebuilt from question references, so
+prompts (and the syllabus text inside them) are never persisted.
+
+The time and size of every backend call are recorded in bloomify.metrics
+(``MeasuredBackend``).
+"""
+import json
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from bloomify import metrics
+
+from .question_pool import question_hash
+from .similarity import QuestionIndex, encode as encode_signature, signature
+
+SESSION_KEYS = {
+    'mcq': 'quiz_attempt_id',
+    'descriptive': 'desc_quiz_attempt_id',
+}
+SYSTEM_INSTRUCTIONS = {
+    'mcq': "You are an expert educator and assessment designer with session ID {session_id}. Create diverse, varied questions covering different topics and concepts from the given syllabus. Avoid repetitive patterns and ensure each question explores different aspects of the material.",
+    'descriptive': "You are an expert educator who creates descriptive questions and evaluation keywords based on a syllabus.",
+}
+SYSTEM_ACKNOWLEDGEMENTS = {
+    'mcq': "Understood. I will create diverse questions covering different topics and concepts, avoiding repetitive patterns.",
+    'descriptive': "Understood.",
+}
+HISTORY_EXCHANGES = 2  # Recent question exchanges replayed to the model
+
+
+# --- Backends ---
+
+class DatabaseBackend:
+    """Stores attempts in the QuizAttemptState / QuizAttemptEntry tables."""
+
+    def create(self, attempt_id, quiz_type, counters):
+        from .models import QuizAttemptState
+        QuizAttemptState.objects.create(attempt_id=attempt_id, quiz_type=quiz_type, counters=counters)
+
+    def load_counters(self, attempt_id):
+        from .models import QuizAttemptState
+        return QuizAttemptState.objects.filter(attempt_id=attempt_id).values_list('counters', flat=True).first()
+
+    def save_counters(self, attempt_id, counters):
+        from .models import QuizAttemptState
+        QuizAttemptState.objects.filter(attempt_id=attempt_id).update(counters=counters)
+
+    def append(self, attempt_id, list_name, item, key=''):
+        from .models import QuizAttemptEntry
+        QuizAttemptEntry.objects.create(attempt_id=attempt_id, list_name=list_name, key=key, data=item)
+
+    def get_list(self, attempt_id, list_name):
+        from .models import QuizAttemptEntry
+        return list(
+            QuizAttemptEntry.objects.filter(attempt_id=attempt_id, list_name=list_name)
+            .order_by('id').values_list('data', flat=True)
+        )
+
+    def put_question(self, attempt_id, qhash, payload):
+        from .models import QuizAttemptEntry
+        QuizAttemptEntry.objects.get_or_create(
+            attempt_id=attempt_id, list_name='questions', key=qhash, defaults={'data': payload}
+        )
+
+    def get_questions(self, attempt_id, hashes=None):
+        from .models import QuizAttemptEntry
+        entries = QuizAttemptEntry.objects.filter(attempt_id=attempt_id, list_name='questions')
+        if hashes is not None:
+            entries = entries.filter(key__in=list(hashes))
+        return dict(entries.values_list('key', 'data'))
+
+    def delete(self, attempt_id):
+        from .models import QuizAttemptState
+        QuizAttemptState.objects.filter(attempt_id=attempt_id).delete()
+
+
+class CacheBackend:
+    """
+    Stores attempts in a Django cache (QUIZ_STATE_CACHE_ALIAS). Works with the
+    local-memory cache for development and with a Redis cache in production.
+    List appends use an atomic length counter, so each append writes one item.
+    """
+
+    def __init__(self):
+        self.cache = caches[getattr(settings, 'QUIZ_STATE_CACHE_ALIAS', 'default')]
+        self.timeout = getattr(settings, 'SESSION_COOKIE_AGE', 86400)
+
+    def _key(self, attempt_id, *parts):
+        return ':'.join(('quiz_attempt', attempt_id) + parts)
+
+    def create(self, attempt_id, quiz_type, counters):
+        self.cache.set(self._key(attempt_id, 'counters'), counters, self.timeout)
+
+    def load_counters(self, attempt_id):
+        return self.cache.get(self._key(attempt_id, 'counters'))
+
+    def save_counters(self, attempt_id, counters):
+        self.cache.set(self._key(attempt_id, 'counters'), counters, self.timeout)
+
+    def append(self, attempt_id, list_name, item, key=''):
+        length_key = self._key(attempt_id, list_name, 'len')
+        self.cache.add(length_key, 0, self.timeout)
+        position = self.cache.incr(length_key) - 1
+        self.cache.set(self._key(attempt_id, list_name, str(position)), item, self.timeout)
+
+    def get_list(self, attempt_id, list_name):
+        length = self.cache.get(self._key(attempt_id, list_name, 'len')) or 0
+        keys = [self._key(attempt_id, list_name, str(i)) for i in range(length)]
+        items = self.cache.get_many(keys)
+        return [items[k] for k in keys if k in items]
+
+    def put_question(self, attempt_id, qhash, payload):
+        if self.cache.add(self._key(attempt_id, 'questions', qhash), payload, self.timeout):
+            self.append(attempt_id, 'question_hashes', qhash)
+
+    def get_questions(self, attempt_id, hashes=None):
+        if hashes is None:
+            hashes = self.get_list(attempt_id, 'question_hashes')
+        keys = {self._key(attempt_id, 'questions', h): h for h in hashes}
+        return {keys[k]: v for k, v in self.cache.get_many(list(keys)).items()}
+
+    def delete(self, attempt_id):
+        keys = [self._key(attempt_id, 'counters')]
+        for h in self.get_list(attempt_id, 'question_hashes'):
+            keys.append(self._key(attempt_id, 'questions', h))
+        for list_name in ('asked', 'topics', 'results', 'signatures', 'question_hashes'):
+            length = self.cache.get(self._key(attempt_id, list_name, 'len')) or 0
+            keys.append(self._key(attempt_id, list_name, 'len'))
+            keys.extend(self._key(attempt_id, list_name, str(i)) for i in range(length))
+        self.cache.delete_many(keys)
+
+
+class MeasuredBackend:
+    """
+    Wraps the configured backend, recording the time of each call and the
+    size (as JSON) of what it reads or writes in the quiz state metrics.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _call(self, operation, *args, written=None, sized=True):
+        started = time.perf_counter()
+        result = getattr(self.backend, operation)(*args)
+        metrics.QUIZ_STATE_SECONDS.labels(operation).observe(time.perf_counter() - started)
+        if sized and metrics.is_enabled():
+            data = result if written is None else written
+            metrics.QUIZ_STATE_BYTES.labels(operation).observe(len(json.dumps(data, default=str)) if data else 0)
+        return result
+
+    def create(self, attempt_id, quiz_type, counters):
+        self._call('create', attempt_id, quiz_type, counters, written=counters)
+
+    def load_counters(self, attempt_id):
+        return self._call('load_counters', attempt_id)
+
+    def save_counters(self, attempt_id, counters):
+        self._call('save_counters', attempt_id, counters, written=counters)
+
+    def append(self, attempt_id, list_name, item, key=''):
+        self._call('append', attempt_id, list_name, item, key, written=item)
+
+    def get_list(self, attempt_id, list_name):
+        return self._call('get_list', attempt_id, list_name)
+
+    def put_question(self, attempt_id, qhash, payload):
+        self._call('put_question', attempt_id, qhash, payload, written=payload)
+
+    def get_questions(self, attempt_id, hashes=None):
+        return self._call('get_questions', attempt_id, hashes)
+
+    def delete(self, attempt_id):
+        self._call('delete', attempt_id, sized=False)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        backend_class = import_string(getattr(settings, 'QUIZ_STATE_BACKEND', 'students.quiz_state.DatabaseBackend'))
+        _backend = MeasuredBackend(backend_class())
+    return _backend
+
+
+# --- Attempt state ---
+
+class QuizState:
+    """
+    One quiz attempt. Counters read and write like a dict
+    (``quiz_state['level_index'] += 1``); lists are only appended to through
+    the record_* methods and are loaded lazily.
+    """
+
+    def __init__(self, backend, attempt_id, quiz_type, counters):
+        self.backend = backend
+        self.attempt_id = attempt_id
+        self.quiz_type = quiz_type
+        self.counters = counters
+        self._dirty = False
+        self._lists = {}
+        self._questions = {}
+
+    # Counters
+    def __getitem__(self, key):
+        return self.counters[key]
+
+    def __setitem__(self, key, value):
+        if self.counters.get(key) != value:
+            self.counters[key] = value
+            self._dirty = True
+
+    def __contains__(self, key):
+        return key in self.counters
+
+    def get(self, key, default=None):
+        return self.counters.get(key, default)
+
+    def save(self):
+        """Persist changed counters. List items are written as they are recorded."""
+        if self._dirty:
+            self.backend.save_counters(self.attempt_id, self.counters)
+            self._dirty = False
+
+    # Lists
+    def _list(self, name):
+        if name not in self._lists:
+            self._lists[name] = self.backend.get_list(self.attempt_id, name)
+        return self._lists[name]
+
+    def _append(self, name, item):
+        self.backend.append(self.attempt_id, name, item)
+        if name in self._lists:
+            self._lists[name].append(item)
+
+    def _resolve(self, hashes):
+        missing = [h for h in hashes if h not in self._questions]
+        if missing:
+            self._questions.update(self.backend.get_questions(self.attempt_id, missing))
+        return [self._questions.get(h, {}) for h in hashes]
+
+    @property
+    def asked_questions(self):
+        return [q.get('question', '') for q in self._resolve(self._list('asked'))]
+
+    def question_index(self):
+        """Near-duplicate index of the asked questions, from their stored signatures."""
+        signatures = self._list('signatures')
+        if len(signatures) != len(self._list('asked')):
+            # Attempt started before signatures were recorded
+            return QuestionIndex.from_questions(self.asked_questions)
+        return QuestionIndex.from_signatures(signatures)
+
+    @property
+    def asked_topics(self):
+        return list(self._list('topics'))
+
+    @property
+    def final_summary(self):
+        results = self._list('results')
+        questions = self._resolve([r.get('question_hash', '') for r in results])
+        return [
+            dict(result, question=question.get('question', 'Question not available'))
+            for result, question in zip(results, questions)
+        ]
+
+    @property
+    def current_question(self):
+        qhash = self.counters.get('current_question')
+        if not qhash:
+            return {}
+        return self._resolve([qhash])[0]
+
+    def set_current_question(self, question, level_name):
+        """Store the question being shown (once) and point the attempt at it."""
+        qhash = question_hash(question.get('question'))
+        payload = dict(question, level=level_name)
+        self.backend.put_question(self.attempt_id, qhash, payload)
+        self._questions[qhash] = payload
+        self['current_question'] = qhash
+
+    def record_topic(self, topic):
+        self._append('topics', topic)
+
+    def record_answer(self, result):
+        """Append the answered current question to the asked list and its result to the summary."""
+        qhash = self.counters.get('current_question', '')
+        result = {k: v for k, v in result.items() if k != 'question'}
+        result['question_hash'] = qhash
+        self._append('asked', qhash)
+        self._append('signatures', encode_signature(signature(self.current_question.get('question', ''))))
+        self._append('results', result)
+        self['total_answered'] = self.get('total_answered', 0) + 1
+
+    # Model context
+    def chat_history(self):
+        """
+        Rebuild the conversation from question references: the system turn plus
+        the most recent question exchanges, without any prompt or syllabus text.
+        """
+        session_id = self.counters.get('session_id', 'default')
+        history = [
+            {'role': 'user', 'parts': [SYSTEM_INSTRUCTIONS[self.quiz_type].format(session_id=session_id)]},
+            {'role': 'model', 'parts': [SYSTEM_ACKNOWLEDGEMENTS[self.quiz_type]]},
+        ]
+        for question in self._resolve(self._list('asked')[-HISTORY_EXCHANGES:]):
+            history.append({'role': 'user', 'parts': [f"Generate a {question.get('level', '')} level question."]})
+            history.append({'role': 'model', 'parts': [format_question_turn(question)]})
+        return history
+
+    def generation_context(self):
+        """Plain dict the question generators work on (and may freely mutate)."""
+        return {
+            'attempt_id': self.attempt_id,
+            'session_id': self.counters.get('session_id', 'default'),
+            'asked_questions': self.asked_questions,
+            'asked_index': self.question_index(),
+            'asked_topics': self.asked_topics,
+            'chat_history': self.chat_history(),
+        }
+
+
+def format_question_turn(question):
+    """Render a stored question the way the model originally answered."""
+    lines = [f"Topic: {question.get('topic', 'General')}", f"Question: {question.get('question', '')}"]
+    for letter, option in zip('ABCD', question.get('options', [])):
+        lines.append(f"{letter}) {option}")
+    if question.get('keywords'):
+        lines.append(f"Keywords: {', '.join(question['keywords'])}")
+    return '\n'.join(lines)
+
+
+# --- Session helpers ---
+
+def load(session, quiz_type):
+    """Return the attempt referenced by the session, or None if there is none (or it expired)."""
+    attempt_id = session.get(SESSION_KEYS[quiz_type])
+    if not attempt_id:
+        return None
+    backend = get_backend()
+    counters = backend.load_counters(attempt_id)
+    if counters is None:
+        return None
+    return QuizState(backend, attempt_id, quiz_type, counters)
+
+
+def create(session, quiz_type, counters):
+    """Start a new attempt and reference it from the session."""
+    backend = get_backend()
+    attempt_id = uuid.uuid4().hex
+    backend.create(attempt_id, quiz_type, counters)
+    session[SESSION_KEYS[quiz_type]] = attempt_id
+    return QuizState(backend, attempt_id, quiz_type, dict(counters))
+
+
+def discard(session, quiz_type):
+    """Delete the attempt referenced by the session and drop the reference."""
+    attempt_id = session.pop(SESSION_KEYS[quiz_type], None)
+    if attempt_id:
+        get_backend().delete(attempt_id)
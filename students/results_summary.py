@@ -0,0 +1,73 @@
+"""
+Per-student quiz score summaries.
+
+A student's scores for every quiz they answered come from one aggregate
+query (responses counted per quiz with a filtered Count) and are cached per
+student. students.signals drops a student's summary whenever one of their
+StudentResponse rows is saved or deleted, and retires every summary (by
+bumping a shared version) when a quiz changes.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from teachers.models import Quiz
+
+VERSION_KEY = 'student_results:version'
+
+
+def _cache_key(student_id):
+    version = cache.get_or_set(VERSION_KEY, 1, None)
+    return f"student_results:{version}:{student_id}"
+
+
+def build_summary(student_id):
+    """One query: every quiz the student answered with their correct and total counts."""
+    quizzes = (
+        Quiz.objects.filter(studentresponse__student_id=student_id)
+        .annotate(
+            total_questions=Count('studentresponse'),
+            correct_count=Count('studentresponse', filter=Q(studentresponse__is_correct=True)),
+        )
+        .order_by('id')
+        .values('id', 'title', 'total_questions', 'correct_count')
+    )
+    return [
+        {
+            'quiz': {'id': quiz['id'], 'title': quiz['title']},
+            'correct_count': quiz['correct_count'],
+            'total_questions': quiz['total_questions'],
+            'score': (quiz['correct_count'] / quiz['total_questions']) * 100 if quiz['total_questions'] > 0 else 0,
+        }
+        for quiz in quizzes
+    ]
+
+
+def get_summary(student_id):
+    """The student's cached score summary, rebuilt on a miss."""
+    key = _cache_key(student_id)
+    summary = cache.get(key)
+    if summary is None:
+        summary = build_summary(student_id)
+        cache.set(key, summary, getattr(settings, 'STUDENT_RESULTS_CACHE_TIMEOUT', 60 * 60))
+    return summary
+
+
+def get_quiz_score(student_id, quiz_id):
+    """The student's entry for one quiz (zero counts if they have not answered it)."""
+    for result in get_summary(student_id):
+        if result['quiz']['id'] == quiz_id:
+            return result
+    return {'quiz': None, 'correct_count': 0, 'total_questions': 0, 'score': 0}
+
+
+def invalidate(student_id):
+    cache.delete(_cache_key(student_id))
+
+
+def invalidate_all():
+    """Retire every cached summary (e.g. after a quiz is renamed or deleted)."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 2, None)
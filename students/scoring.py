@@ -0,0 +1,385 @@
+"""
+Descriptive-answer scoring engine.
+
+The synonym table and stopword list are compiled once at import into:
+
+* an Aho-Corasick automaton over every synonym phrase, used both to find all
+  phrases present in a student's answer in one scan and to find synonyms
+  contained in a keyword or token
+* an inverted index from every substring (4+ chars) of a synonym to the
+  groups containing it, for "token is part of a synonym" matches
+
+An answer is then scored with one scan of its text plus one pass over its
+tokens, instead of re-scanning every synonym list for every keyword and token.
+Scores and match details are identical to the original scorer
+(see students/test_data/scoring_golden.json).
+"""
+import logging
+import re
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+SYNONYM_TABLE = {
+    # Programming concepts
+    'function': ['function', 'func', 'method', 'procedure'],
+    'variable': ['variable', 'var', 'identifier', 'name'],
+    'loop': ['loop', 'iteration', 'iterate', 'repeat'],
+    'condition': ['condition', 'conditional', 'test', 'check'],
+    'boolean': ['boolean', 'bool', 'true/false', 'logical'],
+    'string': ['string', 'str', 'text', 'character'],
+    'integer': ['integer', 'int', 'number', 'whole number'],
+    'float': ['float', 'decimal', 'floating point', 'real number'],
+
+    # Operations and methods
+    # ('append' used to be listed twice; the later file-operations entry
+    # replaced ['append', 'add', 'insert', 'push'] but kept this position)
+    'append': ['append', 'add to end', 'attach'],
+    'remove': ['remove', 'delete', 'pop', 'eliminate'],
+    'equality': ['equality', 'equal', 'equals', 'same'],
+    'inequality': ['inequality', 'not equal', 'different', 'unequal'],
+    'comparison': ['comparison', 'compare', 'comparing', 'contrast'],
+
+    # Data structures
+    'list': ['list', 'array', 'sequence', 'collection'],
+    'tuple': ['tuple', 'immutable sequence'],
+    'dictionary': ['dictionary', 'dict', 'map', 'hash table'],
+
+    # File operations
+    'read': ['read', 'reading', 'input', 'load'],
+    'write': ['write', 'writing', 'output', 'save'],
+
+    # Control flow
+    'while loop': ['while', 'while loop', 'conditional loop'],
+    'for loop': ['for', 'for loop', 'iteration loop'],
+    'if statement': ['if', 'if statement', 'conditional'],
+
+    # Modules and imports
+    'import': ['import', 'importing', 'include', 'load'],
+    'module': ['module', 'library', 'package', 'file'],
+    'functionality': ['functionality', 'features', 'capabilities', 'functions'],
+    'extension': ['extension', 'expand', 'enhance', 'add to'],
+
+    # Object-oriented concepts
+    'class': ['class', 'object type', 'template'],
+    'object': ['object', 'instance', 'entity'],
+    'method': ['method', 'function', 'operation'],
+    'attribute': ['attribute', 'property', 'field', 'variable'],
+
+    # Common programming terms
+    'parameter': ['parameter', 'argument', 'input', 'param'],
+    'argument': ['argument', 'parameter', 'value', 'input'],
+    'return': ['return', 'output', 'result', 'give back'],
+    'syntax': ['syntax', 'format', 'structure', 'grammar'],
+    'error': ['error', 'exception', 'mistake', 'problem'],
+}
+
+STOPWORDS = frozenset({
+    # Articles and determiners
+    'a', 'an', 'the', 'this', 'that', 'these', 'those', 'some', 'any', 'each', 'every',
+    # Prepositions
+    'at', 'by', 'for', 'from', 'in', 'of', 'on', 'to', 'with', 'into', 'onto', 'upon',
+    'over', 'under', 'above', 'below', 'through', 'during', 'before', 'after', 'between',
+    'among', 'within', 'without', 'beyond', 'toward', 'towards', 'across', 'against',
+    # Pronouns
+    'i', 'me', 'my', 'mine', 'myself', 'you', 'your', 'yours', 'yourself', 'yourselves',
+    'he', 'him', 'his', 'himself', 'she', 'her', 'hers', 'herself', 'it', 'its', 'itself',
+    'we', 'us', 'our', 'ours', 'ourselves', 'they', 'them', 'their', 'theirs', 'themselves',
+    # Conjunctions
+    'and', 'or', 'but', 'so', 'yet', 'nor', 'although', 'though', 'because', 'since',
+    'while', 'whereas', 'if', 'unless', 'until', 'when', 'where', 'how', 'why', 'what',
+    # Auxiliary verbs and common verbs
+    'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having',
+    'do', 'does', 'did', 'doing', 'will', 'would', 'shall', 'should', 'can', 'could',
+    'may', 'might', 'must', 'ought', 'need', 'dare', 'used',
+    # Common adverbs
+    'not', 'no', 'yes', 'very', 'too', 'quite', 'rather', 'really', 'just', 'only',
+    'also', 'even', 'still', 'already', 'yet', 'again', 'once', 'twice', 'here', 'there',
+    'where', 'everywhere', 'somewhere', 'anywhere', 'nowhere', 'then', 'now', 'today',
+    'yesterday', 'tomorrow', 'always', 'never', 'sometimes', 'often', 'usually',
+    # Question words and fillers
+    'who', 'whom', 'whose', 'which', 'what', 'when', 'where', 'why', 'how', 'well',
+    'sure', 'okay', 'right', 'left', 'good', 'bad', 'better', 'best', 'worse', 'worst',
+    # Common phrases starters
+    'let', 'lets', 'make', 'take', 'give', 'put', 'get', 'got', 'come', 'go', 'see', 'look',
+    'know', 'think', 'feel', 'want', 'like', 'need', 'try', 'use', 'work', 'help',
+    # Breakdown/explanation words
+    'breakdown', 'explanation', 'difference', 'clear', 'understand', 'question'
+})
+
+PASS_SCORE = 70.0  # Answers scoring at least this are marked correct
+PARTIAL_MIN_LENGTH = 4  # Shortest synonym/token allowed in a partial (stem) match
+FUZZY_MIN_LENGTH = 5  # Shortest keyword/token compared by character overlap
+PUNCTUATION_RE = re.compile(r'[^\w\s-]')
+WHITESPACE_RE = re.compile(r'\s+')
+SEPARATOR_RE = re.compile(r'[-_]')
+
+
+def normalize_keyword(keyword):
+    """
+    Normalize keywords by handling hyphens, underscores, and common variations.
+    """
+    if not keyword:
+        return keyword
+    return SEPARATOR_RE.sub(' ', keyword.lower()).strip()
+
+
+def tokenize_text(text):
+    """
+    Lowercased words of ``text`` without punctuation, stopwords, words of two
+    letters or less and repeats, in order of first appearance.
+    """
+    if not text:
+        return []
+    text = PUNCTUATION_RE.sub(' ', text.lower())
+    words = WHITESPACE_RE.sub(' ', text).strip().split()
+
+    seen = set()
+    tokens = []
+    for word in words:
+        if len(word) > 2 and word not in STOPWORDS and word not in seen:
+            tokens.append(word)
+            seen.add(word)
+    return tokens
+
+
+# --- Compiled synonym index ---
+
+class PhraseMatcher:
+    """Aho-Corasick automaton reporting which of a fixed set of phrases occur in a text."""
+
+    def __init__(self, phrases):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for phrase in phrases:
+            if not phrase:
+                continue
+            state = 0
+            for char in phrase:
+                nxt = self.goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][char] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = nxt
+            if phrase not in self.output[state]:
+                self.output[state] = self.output[state] + (phrase,)
+
+        # Breadth-first failure links; each state also reports its suffixes' phrases
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def find(self, text):
+        """Set of phrases occurring anywhere in ``text``."""
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+# Groups in table order; a group's position decides which one a keyword resolves to
+SYNONYM_GROUPS = [tuple(synonyms) for synonyms in SYNONYM_TABLE.values()]
+NORMALIZED_GROUPS = [tuple(normalize_keyword(s) for s in synonyms) for synonyms in SYNONYM_GROUPS]
+
+# Groups listing each synonym, in table order
+GROUPS_BY_SYNONYM = {}
+for _index, _synonyms in enumerate(SYNONYM_GROUPS):
+    for _synonym in _synonyms:
+        GROUPS_BY_SYNONYM.setdefault(_synonym, [])
+        if _index not in GROUPS_BY_SYNONYM[_synonym]:
+            GROUPS_BY_SYNONYM[_synonym].append(_index)
+
+SYNONYM_MATCHER = PhraseMatcher(GROUPS_BY_SYNONYM)
+NORMALIZED_MATCHER = PhraseMatcher({s for synonyms in NORMALIZED_GROUPS for s in synonyms})
+
+# Every substring of 4+ characters of a synonym -> groups with a synonym containing it
+GROUPS_BY_FRAGMENT = {}
+for _index, _synonyms in enumerate(SYNONYM_GROUPS):
+    for _synonym in _synonyms:
+        for _start in range(len(_synonym)):
+            for _end in range(_start + PARTIAL_MIN_LENGTH, len(_synonym) + 1):
+                GROUPS_BY_FRAGMENT.setdefault(_synonym[_start:_end], set()).add(_index)
+
+
+@lru_cache(maxsize=4096)
+def _resolve_group(normalized_key):
+    """
+    Index of the first group with a synonym that contains, or is contained in,
+    the normalized keyword; None when no group matches.
+    """
+    candidates = [g for s in SYNONYM_MATCHER.find(normalized_key) for g in GROUPS_BY_SYNONYM[s]]
+    for index, synonyms in enumerate(SYNONYM_GROUPS):
+        if candidates and index > min(candidates):
+            break
+        if any(normalized_key in synonym for synonym in synonyms):
+            return index
+    return min(candidates) if candidates else None
+
+
+def get_keyword_synonyms(keyword):
+    """
+    Get synonyms and variations for common technical keywords.
+    """
+    normalized_key = normalize_keyword(keyword)
+    index = _resolve_group(normalized_key)
+    if index is None:
+        return [normalized_key]
+    return list(SYNONYM_GROUPS[index])
+
+
+@lru_cache(maxsize=8192)
+def _token_groups(token):
+    """
+    Groups ``token`` matches as (exact, partial): exact when it is one of the
+    group's synonyms, partial when a 4+ character synonym contains it or is
+    contained in it.
+    """
+    exact = frozenset(GROUPS_BY_SYNONYM.get(token, ()))
+    partial = set()
+    if len(token) >= PARTIAL_MIN_LENGTH:
+        partial.update(GROUPS_BY_FRAGMENT.get(token, ()))
+        for synonym in SYNONYM_MATCHER.find(token):
+            if len(synonym) >= PARTIAL_MIN_LENGTH:
+                partial.update(GROUPS_BY_SYNONYM[synonym])
+    return exact, frozenset(partial)
+
+
+def _matches_single(token, synonym):
+    """Exact/partial test of a token against a keyword that has no synonym group (1.0, 0.8 or 0)."""
+    if token == synonym:
+        return 1.0
+    if len(token) >= PARTIAL_MIN_LENGTH and len(synonym) >= PARTIAL_MIN_LENGTH and (synonym in token or token in synonym):
+        return 0.8
+    return 0
+
+
+# --- Scoring ---
+
+def evaluate_answer(student_answer, ai_keywords, verbose=True):
+    """
+    Score a descriptive answer against the question's keywords.
+
+    Each keyword is matched, in order of preference, by a synonym phrase in the
+    answer text (1.0), a token equal to a synonym (1.0), a token sharing a 4+
+    character stem with a synonym (0.8) or a token with enough characters in
+    common with the keyword (0.6). Returns ``(score, details)``; ``verbose``
+    logs the evaluation as a (sampled) debug event.
+    """
+    if not student_answer or not ai_keywords:
+        return 0.0, {}
+
+    student_tokens = tokenize_text(student_answer)
+    if not student_tokens:
+        return 0.0, {}
+
+    student_text_normalized = normalize_keyword(student_answer)
+    phrases_present = NORMALIZED_MATCHER.find(student_text_normalized)
+
+    # keyword position -> (best_match, match_score)
+    results = {}
+    pending = []  # (position, normalized keyword, group index or None)
+    for position, keyword in enumerate(ai_keywords):
+        normalized_keyword = normalize_keyword(keyword)
+        index = _resolve_group(normalized_keyword)
+        if index is None:
+            if normalized_keyword in student_text_normalized:
+                results[position] = (normalized_keyword, 1.0)
+                continue
+        else:
+            phrase = next((synonym for synonym, normalized in zip(SYNONYM_GROUPS[index], NORMALIZED_GROUPS[index])
+                           if normalized in phrases_present), None)
+            if phrase is not None:
+                results[position] = (phrase, 1.0)
+                continue
+        pending.append((position, normalized_keyword, index))
+
+    # One pass over the tokens for the synonym (exact / partial) and fuzzy matches
+    if pending:
+        fuzzy = {}
+        fuzzy_sets = {
+            position: set(normalized_keyword)
+            for position, normalized_keyword, _ in pending
+            if len(normalized_keyword) >= FUZZY_MIN_LENGTH
+        }
+        for token in student_tokens:
+            if not pending:
+                break
+            exact, partial = _token_groups(token)
+            token_chars = set(token) if len(token) >= FUZZY_MIN_LENGTH else None
+            still_pending = []
+            for entry in pending:
+                position, normalized_keyword, index = entry
+                if index is None:
+                    score = _matches_single(token, normalized_keyword)
+                else:
+                    score = 1.0 if index in exact else (0.8 if index in partial else 0)
+                if score:
+                    results[position] = (token, score)
+                    continue
+                if token_chars is not None and position in fuzzy_sets and position not in fuzzy:
+                    common_chars = token_chars & fuzzy_sets[position]
+                    if len(common_chars) >= min(len(token), len(normalized_keyword)) * 0.6:
+                        fuzzy[position] = (token, 0.6)
+                still_pending.append(entry)
+            pending = still_pending
+        for position, _, _ in pending:
+            if position in fuzzy:
+                results[position] = fuzzy[position]
+
+    matches = 0
+    total_possible = len(ai_keywords)
+    matched_keywords = []
+    unmatched_keywords = []
+    for position, keyword in enumerate(ai_keywords):
+        if position in results:
+            best_match, match_score = results[position]
+            matches += match_score
+            matched_keywords.append(f"{keyword}→{best_match}")
+        else:
+            unmatched_keywords.append(keyword)
+
+    # Calculate final score with bonus for comprehensive coverage
+    base_score = (matches / total_possible) * 100 if total_possible > 0 else 0
+    coverage_ratio = matches / total_possible if total_possible > 0 else 0
+    if coverage_ratio >= 0.8:  # 80% or more keywords matched
+        base_score *= 1.1  # 10% bonus
+    elif coverage_ratio >= 0.6:  # 60-79% keywords matched
+        base_score *= 1.05  # 5% bonus
+    final_score = min(base_score, 100.0)
+
+    if verbose:
+        logger.debug("Answer evaluated", extra={
+            'keywords': list(ai_keywords),
+            'student_tokens': student_tokens[:15],
+            'matched': matched_keywords,
+            'unmatched': unmatched_keywords,
+            'coverage': round(coverage_ratio, 3),
+            'score': round(final_score, 1),
+        })
+
+    evaluation_details = {
+        'matched_count': matches,
+        'total_keywords': total_possible,
+        'coverage_ratio': coverage_ratio,
+        'matched_keywords': matched_keywords,
+        'unmatched_keywords': unmatched_keywords,
+        'final_score': final_score
+    }
+    return final_score, evaluation_details
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from teachers.models import Quiz
+from . import results_summary
+from .models import StudentResponse
+
+
+@receiver([post_save, post_delete], sender=StudentResponse)
+def invalidate_student_results(sender, instance, **kwargs):
+    if instance.student_id:
+        results_summary.invalidate(instance.student_id)
+
+
+@receiver([post_save, post_delete], sender=Quiz)
+def invalidate_all_student_results(sender, instance, **kwargs):
+    results_summary.invalidate_all()
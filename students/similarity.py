@@ -0,0 +1,178 @@
+"""
+Near-duplicate detection for generated questions.
+
+A question is reduced to the character shingles of its words (case-folded,
+punctuation dropped, each word padded with spaces so its edges count) and
+summarized by a MinHash signature: for each of SIGNATURE_SIZE independent
+hashes, the smallest value over the shingles. The share of positions where two
+signatures agree estimates the Jaccard similarity of their shingle sets, so
+rewordings ("What is a Python variable?" / "What is a variable in Python?")
+match while questions about different things do not.
+
+Word shingles ignore order and operators, which is right for prose but not for
+code: "print(2**3)" and "print(3**2)" use the same words. The code of a question
+(the span from its first to its last chunk holding digits, brackets or
+operators) is therefore also shingled as one string, across word boundaries
+and with its symbols, and its exact text is added as CODE_WEIGHT shingles per
+other shingle. Questions whose code differs in any way stay well below
+DUPLICATE_THRESHOLD however much of their wording they share.
+
+``QuestionIndex`` holds the signatures of one attempt, bucketed by LSH bands
+(BANDS groups of ROWS signature values): a lookup only compares against
+questions sharing at least one band, and reports a near duplicate when the
+estimated similarity reaches DUPLICATE_THRESHOLD. Signatures are encoded as
+short strings so the quiz state can store them next to the asked questions.
+"""
+import base64
+import hashlib
+import re
+import struct
+import unicodedata
+
+SHINGLE_SIZE = 4
+HASH_BLOCKS = 4  # blake2b calls per shingle; each yields 16 hash values
+SIGNATURE_SIZE = HASH_BLOCKS * 16
+BANDS = 16
+ROWS = SIGNATURE_SIZE // BANDS
+DUPLICATE_THRESHOLD = 0.8
+CODE_WEIGHT = 1
+
+WORD_RE = re.compile(r'\w+')
+CODE_CHUNK_RE = re.compile(r'[\d()\[\]{}<>=+*/%&|^~@]|^[^\w\s]+$')
+SENTENCE_PUNCTUATION = '?.,;:!'
+_SALTS = [bytes([block]) * 16 for block in range(HASH_BLOCKS)]
+_BLOCK = struct.Struct('<16I')
+_SIGNATURE = struct.Struct(f'<{SIGNATURE_SIZE}I')
+
+
+def _normalize(text):
+    return ' '.join(unicodedata.normalize('NFKC', text or '').casefold().split())
+
+
+def _shingle(text):
+    text = f' {text} '
+    return {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+
+
+def code_span(text):
+    """The code of a question: its chunks from the first to the last one with digits, brackets or operators."""
+    chunks = _normalize(text).split(' ')
+    positions = [i for i, chunk in enumerate(chunks)
+                 if CODE_CHUNK_RE.search(chunk.rstrip(SENTENCE_PUNCTUATION) or chunk)]
+    if not positions:
+        return ''
+    return ' '.join(chunks[positions[0]:positions[-1] + 1]).rstrip(SENTENCE_PUNCTUATION)
+
+
+def shingles(text):
+    """
+    Character shingles of the words of ``text``, with word edges marked by
+    spaces, plus the shingles and weighted exact text of its code.
+    """
+    text = _normalize(text)
+    result = set()
+    for word in WORD_RE.findall(text):
+        result.update(_shingle(word))
+    code = code_span(text)
+    if code:
+        result.update(_shingle(code))
+        result.update(f'\0{i}:{code}' for i in range(CODE_WEIGHT * len(result)))
+    return result
+
+
+def signature(text):
+    """MinHash signature of a question: SIGNATURE_SIZE minimum hash values over its shingles."""
+    rows = []
+    for shingle in shingles(text) or {''}:
+        data = shingle.encode('utf-8')
+        row = ()
+        for salt in _SALTS:
+            row += _BLOCK.unpack(hashlib.blake2b(data, salt=salt).digest())
+        rows.append(row)
+    return tuple(map(min, zip(*rows)))
+
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(a == b for a, b in zip(first, second)) / SIGNATURE_SIZE
+
+
+def encode(sig):
+    return base64.b64encode(_SIGNATURE.pack(*sig)).decode('ascii')
+
+
+def decode(value):
+    return _SIGNATURE.unpack(base64.b64decode(value))
+
+
+class QuestionIndex:
+    """LSH index over the signatures of the questions one attempt has asked."""
+
+    def __init__(self):
+        self.signatures = []
+        self.buckets = {}
+
+    @classmethod
+    def from_questions(cls, questions):
+        index = cls()
+        for question in questions:
+            index.add(question)
+        return index
+
+    @classmethod
+    def from_signatures(cls, encoded):
+        index = cls()
+        for value in encoded:
+            index.add_signature(decode(value))
+        return index
+
+    @staticmethod
+    def _bands(sig):
+        return [(band, sig[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+    def add(self, question):
+        """Index a question's text; returns its signature."""
+        sig = signature(question)
+        self.add_signature(sig)
+        return sig
+
+    def add_signature(self, sig):
+        position = len(self.signatures)
+        self.signatures.append(sig)
+        for band in self._bands(sig):
+            self.buckets.setdefault(band, []).append(position)
+
+    def best_match(self, question):
+        """Highest estimated similarity of ``question`` to an indexed question (0.0 if none shares a band)."""
+        return self.best_signature_match(signature(question))
+
+    def best_signature_match(self, sig):
+        candidates = set()
+        for band in self._bands(sig):
+            candidates.update(self.buckets.get(band, ()))
+        return max((similarity(sig, self.signatures[i]) for i in candidates), default=0.0)
+
+    def is_duplicate(self, question):
+        return self.best_match(question) >= DUPLICATE_THRESHOLD
+
+    def is_duplicate_signature(self, sig):
+        return self.best_signature_match(sig) >= DUPLICATE_THRESHOLD
+
+    def __len__(self):
+        return len(self.signatures)
+
+
+def question_index(context):
+    """
+    The near-duplicate index of a generation context, built from its asked
+    questions the first time it is needed and kept in the context after that.
+    """
+    index = context.get('asked_index')
+    if index is None:
+        index = context['asked_index'] = QuestionIndex.from_questions(context.get('asked_questions', []))
+    return index
+
+
+def is_new_question(context, question):
+    """True when ``question`` is not a near duplicate of one already asked in this context."""
+    return bool(question) and not question_index(context).is_duplicate(question)
@@ -0,0 +1,572 @@
+"""
+Incremental parsing of the model's answers, and server-sent events for them.
+
+Answers come in one of two formats:
+
+* JSON matching ``MCQ_SCHEMA`` / ``DESCRIPTIVE_SCHEMA``, requested with
+  schema-constrained decoding when LLM_OUTPUT_FORMAT is 'json'
+* the free-text "Topic: / Question: / A)..D) / Correct:" (MCQ) or
+  "Topic: / Question: / Keywords:" (descriptive) format
+
+``AnswerParser`` reads an answer chunk by chunk as the model writes it, tells
+the two formats apart from the first character, and hands the text to
+``JsonQuestionParser`` or ``QuestionStreamParser``. A model that ignores the
+schema and answers in text is therefore still understood (the text fallback).
+
+``QuestionStreamParser`` is a small state machine:
+
+    preamble -> question -> options -> complete    (MCQ)
+    preamble -> question -> complete               (descriptive)
+
+Both parsers check the structure as they go and raise MalformedOutput as soon
+as the answer cannot parse (an option before the question, a fifth or
+repeated option, Correct: before all four options, no Question: line after a
+few lines), so the generation loops can drop the stream and retry at once
+instead of waiting for the rest of the completion. They stop needing input
+once the answer is ``complete``, and return the events the browser is shown
+while the question is generated (the topic, the question text as it grows,
+each option once it is complete). The correct answer and the descriptive
+keywords are never part of an event.
+
+The quiz parsers (``parse_question_from_response``,
+``parse_descriptive_response``) run the same parser over a whole answer, and
+``generation_stats`` counts answers by outcome so parse failures and retries
+can be compared between the two formats.
+
+Batches of questions (students.question_batch) come as a JSON object with a
+``questions`` array (``batch_schema``) or as text answers separated by ``---``
+lines; ``parse_batch`` keeps the questions that parse and drops the rest.
+"""
+import json
+import logging
+import re
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+
+from bloomify import metrics
+
+logger = logging.getLogger(__name__)
+
+OPTION_RE = re.compile(r'^[A-D]\)', re.IGNORECASE)
+EXTRA_OPTION_RE = re.compile(r'^[E-H]\)', re.IGNORECASE)
+OPTION_KEYS = 'ABCD'
+MAX_PREAMBLE_LINES = 3  # Lines of chatter tolerated before the Question: line
+
+MCQ_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'topic': {'type': 'string'},
+        'question': {'type': 'string'},
+        'options': {'type': 'array', 'items': {'type': 'string'}},
+        'correct_index': {'type': 'integer'},
+    },
+    'required': ['topic', 'question', 'options', 'correct_index'],
+}
+DESCRIPTIVE_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'topic': {'type': 'string'},
+        'question': {'type': 'string'},
+        'keywords': {'type': 'array', 'items': {'type': 'string'}},
+    },
+    'required': ['topic', 'question', 'keywords'],
+}
+
+BATCH_SEPARATOR = '---'
+BATCH_SEPARATOR_RE = re.compile(r'^\s*-{3,}\s*$', re.MULTILINE)
+
+JSON_STRING = r'"((?:[^"\\]|\\.)*)'
+JSON_FIELD_RE = {
+    name: re.compile(r'"' + name + r'"\s*:\s*' + JSON_STRING + r'(")?') for name in ('topic', 'question')
+}
+JSON_OPTIONS_RE = re.compile(r'"options"\s*:\s*\[')
+JSON_ITEM_RE = re.compile(r'\s*' + JSON_STRING + r'"\s*,?')
+FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+
+class MalformedOutput(Exception):
+    """The model's answer does not follow the requested format."""
+
+
+def streaming_enabled(request):
+    """
+    Whether a question generated live for ``request`` is streamed into the page.
+    Only under ASGI: a WSGI server buffers the event stream, so the browser
+    would wait for a second request that delivers every event at once.
+    """
+    return (getattr(settings, 'QUIZ_STREAMING_ENABLED', False) and isinstance(request, ASGIRequest)
+            and 'nostream' not in request.GET)
+
+
+def sse_event(event, data):
+    """One server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class QuestionStreamParser:
+    """
+    Incremental reader for one answer. ``feed`` takes the next chunk of text and
+    returns the events it completes as (name, data) pairs; ``close`` handles the
+    last line and checks that the answer is whole; ``result`` then returns the
+    parsed fields. Both raise MalformedOutput.
+    """
+
+    def __init__(self, kind='mcq'):
+        self.kind = kind
+        self.state = 'preamble'
+        self.buffer = ''
+        self.preamble_lines = 0
+        self.topic = ''
+        self.question = ''
+        self.options = {}
+        self.correct = ''
+        self.keywords = ''
+        self.current_option = None
+        self.option_lines = []
+        self.preview = ''
+
+    @property
+    def complete(self):
+        """Everything the answer needs has been read; the rest can be ignored."""
+        return self.state == 'complete'
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        events = []
+        while '\n' in self.buffer and not self.complete:
+            line, self.buffer = self.buffer.split('\n', 1)
+            events.extend(self._line(line))
+        # The question is the one line worth showing before it is complete
+        partial = self.buffer.strip()
+        if self.state == 'preamble' and partial.lower().startswith('question:'):
+            text = partial[len('question:'):].strip()
+            if text and text != self.preview:
+                self.preview = text
+                events.append(('question_partial', {'text': text}))
+        return events
+
+    def close(self):
+        events = []
+        if self.buffer and not self.complete:
+            events = self._line(self.buffer)
+        self.buffer = ''
+        events += self._finish_option()
+        if not self.question:
+            raise MalformedOutput("no Question: line")
+        if self.kind == 'mcq':
+            if len(self.options) < len(OPTION_KEYS):
+                raise MalformedOutput(f"only {len(self.options)} options")
+            if not self.correct:
+                raise MalformedOutput("no Correct: line")
+        elif not self.keywords:
+            raise MalformedOutput("no Keywords: line")
+        return events
+
+    def result(self):
+        """The parsed fields: topic, question and options / correct letter (MCQ) or keywords (descriptive)."""
+        fields = {'topic': self.topic, 'question': self.question}
+        if self.kind == 'mcq':
+            fields['options'] = [self.options[key] for key in OPTION_KEYS]
+            fields['correct'] = self.correct
+        else:
+            fields['keywords'] = self.keywords
+        return fields
+
+    def _finish_option(self):
+        if not self.current_option:
+            return []
+        key, text = self.current_option, '\n'.join(self.option_lines).strip()
+        self.options[key] = text
+        self.current_option = None
+        return [('option', {'key': key, 'text': text})]
+
+    def _line(self, line):
+        stripped = line.strip()
+        if not stripped:
+            return []
+        lowered = stripped.lower()
+        if lowered.startswith('topic:'):
+            self.topic = stripped[len('topic:'):].strip()
+            return [('topic', {'text': self.topic})]
+        if lowered.startswith('question:'):
+            if self.state != 'preamble':
+                raise MalformedOutput("a second Question: line")
+            self.question = stripped[len('question:'):].strip()
+            self.preview = self.question
+            self.state = 'question'
+            return [('question', {'text': self.question})]
+        if self.kind == 'mcq':
+            return self._mcq_line(line, stripped, lowered)
+        return self._descriptive_line(stripped, lowered)
+
+    def _mcq_line(self, line, stripped, lowered):
+        if OPTION_RE.match(stripped):
+            key = stripped[0].upper()
+            if self.state == 'preamble':
+                raise MalformedOutput(f"option {key} before the Question: line")
+            if key in self.options or key == self.current_option:
+                raise MalformedOutput(f"option {key} repeated")
+            events = self._finish_option()
+            self.state = 'options'
+            self.current_option = key
+            self.option_lines = [stripped[2:].strip()]
+            return events
+        if lowered.startswith('correct:'):
+            events = self._finish_option()  # The letter itself stays on the server
+            if len(self.options) < len(OPTION_KEYS):
+                raise MalformedOutput(f"Correct: after only {len(self.options)} options")
+            self.correct = stripped[len('correct:'):].strip().upper()
+            if self.correct not in self.options:
+                raise MalformedOutput(f"Correct: names no option ({self.correct!r})")
+            self.state = 'complete'
+            return events
+        if self.current_option:
+            if len(self.options) == len(OPTION_KEYS) - 1 and EXTRA_OPTION_RE.match(stripped):
+                raise MalformedOutput("a fifth option")
+            self.option_lines.append(line)  # Raw line, to keep code indentation
+        elif self.state == 'preamble':
+            self._count_preamble()
+        return []
+
+    def _descriptive_line(self, stripped, lowered):
+        if lowered.startswith('keywords:'):
+            if self.state == 'preamble':
+                raise MalformedOutput("Keywords: before the Question: line")
+            self.keywords = stripped[len('keywords:'):].strip()
+            if not self.keywords:
+                raise MalformedOutput("an empty Keywords: line")
+            self.state = 'complete'
+        elif self.state == 'preamble':
+            self._count_preamble()
+        return []
+
+    def _count_preamble(self):
+        self.preamble_lines += 1
+        if self.preamble_lines > MAX_PREAMBLE_LINES:
+            raise MalformedOutput(f"no Question: line in the first {MAX_PREAMBLE_LINES + 1} lines")
+
+
+def _json_string(raw):
+    """Decode the inside of a (possibly unfinished) JSON string; None if it ends mid-escape."""
+    try:
+        return json.loads('"' + raw + '"')
+    except ValueError:
+        return None
+
+
+class JsonQuestionParser:
+    """
+    Incremental reader for JSON answers, with the interface of
+    QuestionStreamParser. The topic, the question text and the options are
+    picked out of the unfinished JSON for the events; the whole object is
+    validated against the schema once it is complete.
+    """
+
+    def __init__(self, kind='mcq'):
+        self.kind = kind
+        self.buffer = ''
+        self.data = None
+        self.fields = None
+        self.sent = {}
+        self.options_sent = 0
+
+    @property
+    def complete(self):
+        return self.data is not None
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        events = self._scan()
+        text = FENCE_RE.sub('', self.buffer.strip())
+        if text.endswith('}'):
+            try:
+                self.data = json.loads(text)
+            except ValueError:
+                pass  # A closing brace inside a string, or more to come
+        return events
+
+    def close(self):
+        if self.data is None:
+            try:
+                self.data = json.loads(FENCE_RE.sub('', self.buffer.strip()))
+            except ValueError as e:
+                raise MalformedOutput(f"invalid JSON ({e})")
+        self.fields = validate_answer(self.kind, self.data)
+        return []
+
+    def result(self):
+        return self.fields
+
+    def _scan(self):
+        events = []
+        for name, pattern in JSON_FIELD_RE.items():
+            match = pattern.search(self.buffer)
+            if not match or self.sent.get(name) == 'done':
+                continue
+            text = _json_string(match.group(1))
+            if match.group(2):
+                self.sent[name] = 'done'
+                events.append((name, {'text': text}))
+            elif name == 'question' and text and text != self.sent.get(name):
+                self.sent[name] = text
+                events.append(('question_partial', {'text': text}))
+        if self.kind == 'mcq':
+            match = JSON_OPTIONS_RE.search(self.buffer)
+            if match:
+                items = []
+                position = match.end()
+                item = JSON_ITEM_RE.match(self.buffer, position)
+                while item:
+                    items.append(_json_string(item.group(1)))
+                    position = item.end()
+                    item = JSON_ITEM_RE.match(self.buffer, position)
+                if len(items) > len(OPTION_KEYS):
+                    raise MalformedOutput("a fifth option")
+                for index in range(self.options_sent, len(items)):
+                    events.append(('option', {'key': OPTION_KEYS[index], 'text': items[index]}))
+                self.options_sent = len(items)
+        return events
+
+
+def validate_answer(kind, data):
+    """Check a JSON answer against the schema's rules; returns the fields QuestionStreamParser.result() gives."""
+    if not isinstance(data, dict):
+        raise MalformedOutput("the JSON answer is not an object")
+    question = data.get('question')
+    if not isinstance(question, str) or not question.strip():
+        raise MalformedOutput("no question")
+    topic = data.get('topic')
+    fields = {'topic': topic.strip() if isinstance(topic, str) else '', 'question': question.strip()}
+    if kind == 'mcq':
+        options = data.get('options')
+        if not isinstance(options, list) or len(options) != len(OPTION_KEYS):
+            raise MalformedOutput(f"{len(options) if isinstance(options, list) else 'no'} options")
+        if not all(isinstance(option, str) and option.strip() for option in options):
+            raise MalformedOutput("an empty option")
+        correct = data.get('correct_index')
+        if isinstance(correct, bool) or not isinstance(correct, int) or not 0 <= correct < len(OPTION_KEYS):
+            raise MalformedOutput(f"correct_index names no option ({correct!r})")
+        fields['options'] = [option.strip() for option in options]
+        fields['correct'] = OPTION_KEYS[correct]
+    else:
+        keywords = data.get('keywords')
+        if isinstance(keywords, list):
+            keywords = ', '.join(k.strip() for k in keywords if isinstance(k, str) and k.strip())
+        if not isinstance(keywords, str) or not keywords.strip():
+            raise MalformedOutput("no keywords")
+        fields['keywords'] = keywords.strip()
+    return fields
+
+
+class AnswerParser:
+    """
+    Reads an answer in either format: JSON when it starts with '{' (or a code
+    fence), the text format otherwise. Same interface as the parsers it wraps;
+    ``format`` is 'json' or 'text' once the first character has arrived.
+    """
+
+    def __init__(self, kind='mcq'):
+        self.kind = kind
+        self.pending = ''
+        self.parser = None
+        self.closed = False
+
+    @property
+    def format(self):
+        if self.parser is None:
+            return None
+        return 'json' if isinstance(self.parser, JsonQuestionParser) else 'text'
+
+    @property
+    def complete(self):
+        return self.parser is not None and self.parser.complete
+
+    def feed(self, chunk):
+        if self.parser is None:
+            self.pending += chunk
+            start = self.pending.lstrip()[:1]
+            if not start:
+                return []
+            self.parser = (JsonQuestionParser if start in '{`' else QuestionStreamParser)(self.kind)
+            chunk, self.pending = self.pending, ''
+        return self.parser.feed(chunk)
+
+    def close(self):
+        self.closed = True
+        if self.parser is None:
+            raise MalformedOutput("an empty answer")
+        return self.parser.close()
+
+    def result(self):
+        return self.parser.result()
+
+
+def parse_answer(kind, text):
+    """Parse a whole answer in either format; returns the fields or raises MalformedOutput."""
+    parser = AnswerParser(kind)
+    parser.feed(text)
+    parser.close()
+    return parser.result()
+
+
+def output_schema(kind):
+    """The JSON schema to request for ``kind`` ('mcq' or 'descriptive'), or None in text mode."""
+    if getattr(settings, 'LLM_OUTPUT_FORMAT', 'json') != 'json':
+        return None
+    return MCQ_SCHEMA if kind == 'mcq' else DESCRIPTIVE_SCHEMA
+
+
+def batch_schema(kind):
+    """The JSON schema for a batch of ``kind`` questions, or None in text mode."""
+    schema = output_schema(kind)
+    if schema is None:
+        return None
+    return {
+        'type': 'object',
+        'properties': {'questions': {'type': 'array', 'items': schema}},
+        'required': ['questions'],
+    }
+
+
+def parse_batch(kind, text):
+    """
+    Parse a batch answer in either format. Returns the fields of each question
+    that parses, the number dropped, and the format ('json' or 'text'); raises
+    MalformedOutput when no question could be read.
+    """
+    stripped = FENCE_RE.sub('', (text or '').strip())
+    if stripped[:1] in '{[':
+        try:
+            data = json.loads(stripped)
+        except ValueError as e:
+            raise MalformedOutput(f"invalid JSON ({e})")
+        items = data.get('questions') if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            raise MalformedOutput("no questions array")
+        output_format = 'json'
+        parse_item = validate_answer
+    else:
+        items = [block for block in BATCH_SEPARATOR_RE.split(stripped) if block.strip()]
+        output_format = 'text'
+        parse_item = parse_answer
+
+    questions = []
+    for item in items:
+        try:
+            questions.append(parse_item(kind, item))
+        except MalformedOutput as e:
+            logger.info("Dropped a malformed question from a batch: %s", e)
+    if not questions:
+        raise MalformedOutput("no question in the batch parses")
+    return questions, len(items) - len(questions), output_format
+
+
+def read_answer(chunks, parser, parts):
+    """Feed a model stream to ``parser`` (keeping the text in ``parts``) until the answer is complete."""
+    for chunk in chunks:
+        parts.append(chunk)
+        parser.feed(chunk)
+        if parser.complete:
+            break
+    parser.close()
+
+
+async def aread_answer(chunks, parser, parts):
+    """Async ``read_answer`` that yields the parser's events as they come."""
+    async for chunk in chunks:
+        parts.append(chunk)
+        for event in parser.feed(chunk):
+            yield event
+        if parser.complete:
+            break
+    for event in parser.close():
+        yield event
+
+
+class GenerationStats:
+    """
+    Counts of model answers per quiz kind and requested output format: parsed,
+    malformed (and how many of those were dropped mid-stream), repeats, and
+    answers the text parser had to read in JSON mode, and batch answers with
+    the questions dropped from them. ``stats`` derives the parse failure rate
+    and the model calls spent per question.
+    """
+
+    COUNTERS = (
+        'answers', 'parsed', 'malformed', 'aborted_early', 'repeat', 'text_fallback', 'questions', 'failed',
+        'batches', 'batch_dropped',
+    )
+
+    def __init__(self, report_every=100):
+        self.report_every = report_every
+        self.counts = defaultdict(Counter)
+        self.answers = 0
+        self.lock = threading.Lock()
+
+    def record_answer(self, kind, schema, parser, outcome):
+        """``outcome`` is 'parsed', 'malformed' or 'repeat'."""
+        metrics.MODEL_ANSWERS.labels(kind, 'json' if schema else 'text', outcome).inc()
+        with self.lock:
+            counts = self.counts[(kind, 'json' if schema else 'text')]
+            counts['answers'] += 1
+            counts[outcome] += 1
+            if outcome == 'malformed' and not parser.closed:
+                counts['aborted_early'] += 1
+            if schema and parser.format == 'text':
+                counts['text_fallback'] += 1
+            self.answers += 1
+            answers = self.answers
+        if self.report_every and answers % self.report_every == 0:
+            logger.info("Question generation stats", extra={'stats': self.stats()})
+
+    def record_batch(self, kind, schema, output_format, generated, dropped):
+        """A batch answer: ``generated`` new questions kept, ``dropped`` unparseable or repeated ones (None: nothing parsed)."""
+        metrics.MODEL_ANSWERS.labels(kind, 'json' if schema else 'text', 'parsed' if generated is not None else 'malformed').inc()
+        with self.lock:
+            counts = self.counts[(kind, 'json' if schema else 'text')]
+            counts['answers'] += 1
+            counts['batches'] += 1
+            counts['parsed' if generated is not None else 'malformed'] += 1
+            counts['questions'] += generated or 0
+            counts['batch_dropped'] += dropped
+            if schema and output_format == 'text':
+                counts['text_fallback'] += 1
+            self.answers += 1
+            answers = self.answers
+        if self.report_every and answers % self.report_every == 0:
+            logger.info("Question generation stats", extra={'stats': self.stats()})
+
+    def record_question(self, kind, schema, generated):
+        with self.lock:
+            self.counts[(kind, 'json' if schema else 'text')]['questions' if generated else 'failed'] += 1
+
+    def stats(self):
+        with self.lock:
+            result = {}
+            for (kind, output_format), counts in sorted(self.counts.items()):
+                answers, questions = counts['answers'], counts['questions']
+                result[f"{kind}/{output_format}"] = dict(
+                    {name: counts[name] for name in self.COUNTERS},
+                    parse_failure_rate=round(counts['malformed'] / answers, 3) if answers else 0.0,
+                    calls_per_question=round(answers / questions, 2) if questions else 0.0,
+                )
+            return result
+
+    def clear(self):
+        with self.lock:
+            self.counts.clear()
+            self.answers = 0
+
+
+generation_stats = GenerationStats()
+
+
+def question_payload(kind, question):
+    """What the browser may see of a finished question."""
+    payload = {'question': question['question'], 'topic': question.get('topic', 'General')}
+    if kind == 'mcq':
+        payload['options'] = question['options']
+    return payload
@@ -1,3 +1,921 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest.mock
+from pathlib import Path
+
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from bloomify import llm, metrics
+from bloomify.log import BackgroundQueueHandler, JsonFormatter, SamplingFilter, attempt_fields
+from students import question_pool
+from students.models import PooledQuestion, StudentResponse
+from students.question_pool import QuestionPool
+from students.scoring import evaluate_answer, get_keyword_synonyms
+from students import prompts, quiz_state as quiz_states
+from students import prefetch
+from students.similarity import QuestionIndex, is_new_question
+from students.streaming import AnswerParser, MalformedOutput, QuestionStreamParser, generation_stats, parse_batch
+from students.views.dynamic_quiz_logic import parse_question_from_response
+from teachers.models import Question, Quiz, Syllabus
+
+GOLDEN_SCORING_CORPUS = Path(__file__).resolve().parent / 'test_data' / 'scoring_golden.json'
+
+# Quiz view tests draw from the question pool; a refill would generate questions on
+# background threads against the test database while the test runs
+no_pool_refills = unittest.mock.patch.object(QuestionPool, 'schedule_refill', new=lambda syllabus_id, level_name: None)
+
+
+class SyllabusTestCase(TestCase):
+    """A teacher's syllabus with a module on loops, and a student to take quizzes on it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', password='pass')
+        cls.syllabus = Syllabus.objects.create(teacher=cls.teacher, title='Python', content='MODULE 1: Loops\nfor and while')
+        cls.student = User.objects.create_user('student', password='pass')
+
+
+class ScoringGoldenCorpusTests(SimpleTestCase):
+    """The compiled scorer must reproduce the original scorer's output exactly."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(GOLDEN_SCORING_CORPUS, encoding='utf-8') as f:
+            cls.cases = json.load(f)
+
+    def test_scores_and_details_match_golden_corpus(self):
+        # The per-answer debug events are captured instead of written out
+        with self.assertLogs('students.scoring', 'DEBUG'):
+            for i, case in enumerate(self.cases):
+                with self.subTest(case=i, answer=case['answer'][:40], keywords=case['keywords']):
+                    score, details = evaluate_answer(case['answer'], case['keywords'])
+                    self.assertEqual(score, case['score'])
+                    self.assertEqual(details, case['details'])
+
+    def test_keyword_synonym_resolution(self):
+        self.assertEqual(get_keyword_synonyms('Function'), ['function', 'func', 'method', 'procedure'])
+        # The later 'append' entry of the original table wins
+        self.assertEqual(get_keyword_synonyms('append'), ['append', 'add to end', 'attach'])
+        # Substring matches pick the first group in table order
+        self.assertEqual(get_keyword_synonyms('print'), ['integer', 'int', 'number', 'whole number'])
+        self.assertEqual(get_keyword_synonyms('recursion'), ['recursion'])
+        self.assertEqual(get_keyword_synonyms('well-known'), ['well known'])
+
+
+class ResultsQueryCountTests(TestCase):
+    """Result pages must cost the same number of queries however many quizzes a student took."""
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher = User.objects.create_user('teacher', password='pass')
+        cls.syllabus = Syllabus.objects.create(teacher=teacher, title='Python', content='Variables and loops')
+        cls.light = User.objects.create_user('light', password='pass')
+        cls.heavy = User.objects.create_user('heavy', password='pass')
+        students, _ = Group.objects.get_or_create(name='student')
+        students.user_set.add(cls.light, cls.heavy)
+        cls.quizzes = cls.create_quizzes(500)
+        cls.answer(cls.light, cls.quizzes[:1])
+        cls.answer(cls.heavy, cls.quizzes)
+
+    @classmethod
+    def create_quizzes(cls, count):
+        quizzes = Quiz.objects.bulk_create([
+            Quiz(syllabus=cls.syllabus, title=f'Quiz {i}', num_questions=2, access_link=f'quiz-{i}')
+            for i in range(count)
+        ])
+        Question.objects.bulk_create([
+            Question(quiz=quiz, question_text=f'Q{n}', bloom_level='remember', correct_answer='a',
+                     option1='a', option2='b', option3='c', option4='d')
+            for quiz in quizzes for n in range(2)
+        ])
+        return quizzes
+
+    @classmethod
+    def answer(cls, student, quizzes):
+        # bulk_create skips the invalidation signals; the cache is cleared in setUp
+        StudentResponse.objects.bulk_create([
+            StudentResponse(student=student, quiz=question.quiz, question=question,
+                            selected_answer='a', is_correct=question.question_text == 'Q0')
+            for question in Question.objects.filter(quiz__in=quizzes).select_related('quiz')
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def count_queries(self, user, url):
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_my_results_query_count_is_constant(self):
+        light_queries, _ = self.count_queries(self.light, reverse('students:my_results'))
+        heavy_queries, response = self.count_queries(self.heavy, reverse('students:my_results'))
+        self.assertEqual(heavy_queries, light_queries)
+        self.assertEqual(len(response.context['results']), 500)
+        self.assertEqual(response.context['results'][0]['correct_count'], 1)
+        self.assertEqual(response.context['results'][0]['score'], 50.0)
+
+        # Served from the per-student cache on the next load
+        cached_queries, _ = self.count_queries(self.heavy, reverse('students:my_results'))
+        self.assertEqual(cached_queries, heavy_queries - 1)
+
+    def test_quiz_results_query_count_is_constant(self):
+        url = reverse('students:quiz_complete', args=[self.quizzes[0].id])
+        light_queries, _ = self.count_queries(self.light, url)
+        heavy_queries, response = self.count_queries(self.heavy, url)
+        self.assertEqual(heavy_queries, light_queries)
+        self.assertEqual((response.context['correct_count'], response.context['total_questions']), (1, 2))
+
+    def test_saving_a_response_invalidates_the_summary(self):
+        url = reverse('students:my_results')
+        self.count_queries(self.light, url)
+        response = StudentResponse.objects.get(student=self.light, question__question_text='Q1')
+        response.is_correct = True
+        response.save()
+        _, page = self.count_queries(self.light, url)
+        self.assertEqual(page.context['results'][0]['correct_count'], 2)
+
+
+class DashboardCatalogTests(TestCase):
+    """The dashboard reads syllabi from the cached catalog, not from the database."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('teacher', password='pass', first_name='Ada', last_name='Lovelace')
+        other = User.objects.create_user('other', password='pass')
+        Syllabus.objects.bulk_create([
+            Syllabus(teacher=cls.teacher if i % 2 else other, title=f'Syllabus {i}', content='x' * 1000)
+            for i in range(2000)
+        ])
+        cls.student = User.objects.create_user('student', password='pass')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.student)
+
+    def load(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('students:dashboard'), params)
+        self.assertEqual(response.status_code, 200)
+        return queries, response
+
+    def test_warm_cache_needs_no_syllabus_queries(self):
+        cold, response = self.load()
+        self.assertEqual(len(response.context['syllabi']), 2000)
+        self.assertEqual(sum('teachers_syllabus' in q['sql'] for q in cold.captured_queries), 1)
+        self.assertFalse(any('"content"' in q['sql'] for q in cold.captured_queries))
+
+        warm, _ = self.load()
+        self.assertEqual(len(warm), len(cold) - 1)
+        self.assertFalse(any('teachers_syllabus' in q['sql'] for q in warm.captured_queries))
+
+    def test_teacher_filter_and_display_names(self):
+        _, response = self.load(teacher=str(self.teacher.id))
+        self.assertEqual(len(response.context['syllabi']), 1000)
+        self.assertEqual(response.context['teacher_display'][self.teacher.id], 'Ada Lovelace')
+
+    def test_syllabus_changes_invalidate_the_catalog(self):
+        self.load()
+        syllabus = Syllabus.objects.create(teacher=self.teacher, title='Added later')
+        _, response = self.load()
+        self.assertIn('Added later', [s.title for s in response.context['syllabi']])
+        syllabus.delete()
+        _, response = self.load()
+        self.assertEqual(len(response.context['syllabi']), 2000)
+
+
+@override_settings(LLM_PROVIDER='fake', LLM_FAKE_LATENCY=0.0, QUIZ_PREFETCH_ENABLED=False,
+                   QUIZ_STREAMING_ENABLED=False, LLM_RESPONSE_CACHE={'ENABLED': False})
+@no_pool_refills
+class AsyncQuizViewTests(SyllabusTestCase):
+    """The quiz views are async and await the model through LLMClient.agenerate."""
+
+    def setUp(self):
+        llm.reset_client()
+        self.addCleanup(llm.reset_client)
+        self.async_client = AsyncClient()
+        self.async_client.force_login(self.student)
+
+    async def test_mcq_question_is_generated_and_answered(self):
+        await self.async_client.post(reverse('students:start_dynamic_quiz'),
+                                     {'syllabus': self.syllabus.id, 'num_per_taxonomy': 3})
+        response = await self.async_client.get(reverse('students:dynamic_quiz'))
+        self.assertEqual(response.status_code, 200)
+        question = response.context['question_data']
+        self.assertEqual(len(question['options']), 4)
+
+        response = await self.async_client.post(reverse('students:dynamic_quiz'),
+                                                {'answer': question['correct_answer']})
+        self.assertRedirects(response, reverse('students:dynamic_quiz'), fetch_redirect_response=False)
+
+    async def test_descriptive_question_is_generated(self):
+        await self.async_client.post(reverse('students:start_descriptive_quiz'), {'syllabus_id': self.syllabus.id})
+        response = await self.async_client.get(reverse('students:descriptive_quiz'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['question_data']['keywords'])
+
+    async def test_anonymous_students_are_sent_to_login(self):
+        response = await AsyncClient().get(reverse('students:dynamic_quiz'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('login', response.url)
+
+    def test_async_calls_wait_concurrently(self):
+        client = llm.LLMClient(llm.FakeProvider(latency=0.2), max_concurrency=1)
+
+        async def generate_many():
+            return await asyncio.gather(*(client.agenerate(f'Section: Loops {i}') for i in range(50)))
+
+        started = time.monotonic()
+        answers = asyncio.run(generate_many())
+        self.assertEqual(len(set(answers)), 50)
+        # 50 calls at 0.2s each; sequential waiting would take 10s
+        self.assertLess(time.monotonic() - started, 2.0)
+
+
+class StreamBreakerTests(SimpleTestCase):
+    """Streams the caller stops reading early still settle the circuit breaker."""
+
+    def half_open_client(self):
+        client = llm.LLMClient(llm.FakeProvider(latency=0.0), breaker=llm.CircuitBreaker(1, reset_timeout=0.0))
+        client.breaker.record_failure()
+        return client
+
+    def test_closing_a_half_open_stream_early_closes_the_breaker(self):
+        client = self.half_open_client()
+        stream = client.stream('Section: Loops')
+        self.assertTrue(next(stream))
+        stream.close()
+        self.assertEqual((client.breaker.failures, client.breaker.opened_at), (0, None))
+        self.assertTrue(client.generate('Section: Loops'))
+
+    def test_closing_or_cancelling_a_half_open_async_stream(self):
+        async def close_early(client):
+            stream = client.astream('Section: Loops')
+            self.assertTrue(await stream.__anext__())
+            await stream.aclose()
+
+        client = self.half_open_client()
+        asyncio.run(close_early(client))
+        self.assertEqual((client.breaker.failures, client.breaker.opened_at), (0, None))
+
+        async def cancel_before_the_answer(client):
+            task = asyncio.ensure_future(client.astream('Section: Loops').__anext__())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            return await client.agenerate('Section: Loops')
+
+        client = self.half_open_client()
+        client.provider = llm.FakeProvider(latency=0.5)
+        self.assertTrue(asyncio.run(cancel_before_the_answer(client)))
+
+
+class ResponseCacheTests(SimpleTestCase):
+    """Model answers are shared between equivalent prompts, within the variant, reuse and size limits."""
+
+    def lookups(self, cache, key, count, exclude=()):
+        return [cache.lookup(key, exclude) for _ in range(count)]
+
+    def test_equivalent_prompts_share_a_key(self):
+        key = llm.response_cache_key('mcq', 'abc', 'remember', ['Loops', 'For  loops'])
+        self.assertEqual(key, llm.response_cache_key('mcq', 'abc', 'remember', ['for loops', 'loops', 'LOOPS', '']))
+        self.assertNotEqual(key, llm.response_cache_key('mcq', 'abc', 'understand', ['Loops', 'For loops']))
+        self.assertNotEqual(key, llm.response_cache_key('mcq', 'def', 'remember', ['Loops', 'For loops']))
+        self.assertNotEqual(key, llm.response_cache_key('mcq', 'abc', 'remember', ['Loops']))
+
+    def test_key_serves_only_once_it_has_min_variants(self):
+        cache = llm.ResponseCache(min_variants=2, report_every=0)
+        cache.store('k', 'answer a', 'a')
+        cache.store('k', 'answer a again', 'a')  # Same question: not a new variant
+        self.assertIsNone(cache.lookup('k'))
+        cache.store('k', 'answer b', 'b')
+        self.assertIn(cache.lookup('k'), {'answer a', 'answer b'})
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'keys': 1})
+
+    def test_variants_are_excluded_retired_and_capped(self):
+        cache = llm.ResponseCache(min_variants=1, max_variants=2, max_reuse=2, report_every=0)
+        for label in 'abc':
+            cache.store('k', f'answer {label}', label)
+        # The oldest variant made room for the newest
+        self.assertIsNone(cache.lookup('k', exclude={'b', 'c'}))
+        # A variant is dropped once served max_reuse times
+        self.assertEqual(self.lookups(cache, 'k', 3, exclude={'b'}), ['answer c', 'answer c', None])
+        self.assertEqual(self.lookups(cache, 'k', 3), ['answer b', 'answer b', None])
+
+    def test_least_recently_used_key_is_evicted(self):
+        cache = llm.ResponseCache(max_keys=2, min_variants=1, report_every=0)
+        cache.store('k1', 'one', 'one')
+        cache.store('k2', 'two', 'two')
+        cache.lookup('k1')
+        cache.store('k3', 'three', 'three')
+        self.assertEqual([cache.lookup(key) for key in ('k1', 'k2', 'k3')], ['one', None, 'three'])
+
+    def test_entries_expire_after_ttl(self):
+        cache = llm.ResponseCache(ttl=60, min_variants=1, report_every=0)
+        with unittest.mock.patch.object(llm, 'time') as fake_time:
+            fake_time.monotonic.return_value = 1000.0
+            cache.store('k', 'old', 'old')
+            fake_time.monotonic.return_value = 1059.0
+            self.assertEqual(cache.lookup('k'), 'old')
+            fake_time.monotonic.return_value = 1060.0
+            self.assertIsNone(cache.lookup('k'))
+            self.assertEqual(cache.stats()['keys'], 0)
+            # Storing into an expired key starts it over
+            cache.store('k', 'new', 'new')
+            self.assertEqual(self.lookups(cache, 'k', 3), ['new'] * 3)
+
+
+def read_events(body):
+    """(event, data) pairs from a server-sent events body."""
+    events = []
+    for block in body.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+@override_settings(LLM_PROVIDER='fake', LLM_FAKE_LATENCY=0.0, QUIZ_PREFETCH_ENABLED=False,
+                   QUIZ_STREAMING_ENABLED=True, LLM_RESPONSE_CACHE={'ENABLED': False})
+@no_pool_refills
+class QuizStreamingTests(SyllabusTestCase):
+    """Questions generated live are streamed to the page as server-sent events."""
+
+    MCQ_ANSWER = (
+        "Topic: Loops\nQuestion: Which loop runs at least once?\n"
+        "A) for\nB) while\nC) a loop written as\n    while True:\n        break\nD) none\nCorrect: C\n"
+    )
+
+    def setUp(self):
+        llm.reset_client()
+        self.addCleanup(llm.reset_client)
+        self.async_client = AsyncClient()
+        self.async_client.force_login(self.student)
+
+    async def stream(self, name):
+        response = await self.async_client.get(reverse(name))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return read_events(''.join([chunk.decode() async for chunk in response.streaming_content]))
+
+    def test_parser_gives_the_same_question_on_any_chunking(self):
+        expected_options = ['for', 'while', 'a loop written as\n    while True:\n        break', 'none']
+        self.assertEqual(parse_question_from_response(self.MCQ_ANSWER), {
+            'question': 'Which loop runs at least once?', 'options': expected_options,
+            'correct_answer': expected_options[2], 'topic': 'Loops',
+        })
+        for size in (1, 3, 7, len(self.MCQ_ANSWER)):
+            parser = QuestionStreamParser('mcq')
+            events = []
+            for i in range(0, len(self.MCQ_ANSWER), size):
+                events += parser.feed(self.MCQ_ANSWER[i:i + size])
+            events += parser.close()
+            options = [data['text'] for name, data in events if name == 'option']
+            self.assertEqual(options, expected_options)
+            self.assertEqual(parser.result()['correct'], 'C')
+            self.assertIn(('topic', {'text': 'Loops'}), events)
+        # Partial question text is sent while the line is still being written
+        self.assertIn(('question_partial', {'text': 'Which'}), QuestionStreamParser().feed('Question: Which'))
+
+    async def test_mcq_question_is_streamed_then_answered(self):
+        await self.async_client.post(reverse('students:start_dynamic_quiz'),
+                                     {'syllabus': self.syllabus.id, 'num_per_taxonomy': 3})
+        page = await self.async_client.get(reverse('students:dynamic_quiz'))
+        self.assertIsNone(page.context['question_data'])
+        self.assertContains(page, reverse('students:dynamic_quiz_stream'))
+
+        events = await self.stream('students:dynamic_quiz_stream')
+        names = [name for name, _ in events]
+        self.assertIn('question_partial', names)
+        self.assertEqual(names.count('option'), 4)
+        self.assertEqual(names[-1], 'done')
+        done = events[-1][1]
+        self.assertEqual(len(done['options']), 4)
+        self.assertNotIn('correct_answer', done)
+
+        response = await self.async_client.post(reverse('students:dynamic_quiz'), {'answer': done['options'][0]})
+        self.assertRedirects(response, reverse('students:dynamic_quiz'), fetch_redirect_response=False)
+
+    def test_wsgi_requests_generate_the_question_inline(self):
+        # A WSGI server would buffer the event stream, so there is nothing to gain from it
+        self.client.force_login(self.student)
+        self.client.post(reverse('students:start_dynamic_quiz'), {'syllabus': self.syllabus.id, 'num_per_taxonomy': 3})
+        page = self.client.get(reverse('students:dynamic_quiz'))
+        self.assertTrue(page.context['question_data']['question'])
+        self.assertNotContains(page, reverse('students:dynamic_quiz_stream'))
+
+    async def test_descriptive_stream_hides_the_keywords(self):
+        await self.async_client.post(reverse('students:start_descriptive_quiz'), {'syllabus_id': self.syllabus.id})
+        events = await self.stream('students:descriptive_quiz_stream')
+        name, done = events[-1]
+        self.assertEqual(name, 'done')
+        self.assertTrue(done['question'])
+        self.assertNotIn('keywords', done)
+
+    async def test_stream_without_a_quiz_redirects(self):
+        events = await self.stream('students:dynamic_quiz_stream')
+        self.assertEqual(events, [('redirect', {'url': reverse('students:dashboard')})])
+
+
+class ScriptedProvider(llm.FakeProvider):
+    """Fake provider that streams the given answers in turn."""
+
+    def __init__(self, answers, latency):
+        super().__init__(latency=latency)
+        self.answers = list(answers)
+
+    def answer(self, contents, schema=None):
+        return self.answers.pop(0)
+
+
+@override_settings(LLM_PROVIDER='fake', QUIZ_PREFETCH_ENABLED=False, LLM_RESPONSE_CACHE={'ENABLED': False})
+class MalformedOutputTests(TestCase):
+    """Answers that cannot parse are abandoned as soon as that is clear."""
+
+    VALID = "Topic: Loops\nQuestion: Which loop runs at least once?\nA) for\nB) while\nC) do\nD) none\nCorrect: C\n"
+
+    def malformed_at(self, text):
+        parser = QuestionStreamParser('mcq')
+        with self.assertRaises(MalformedOutput) as raised:
+            parser.feed(text)
+            parser.close()
+        return str(raised.exception)
+
+    def test_structure_errors_are_caught_mid_answer(self):
+        self.assertIn('before the Question', self.malformed_at("Topic: Loops\nA) for\n"))
+        self.assertIn('fifth option', self.malformed_at(self.VALID.replace('Correct: C', 'E) repeat\nCorrect: C')))
+        self.assertIn('repeated', self.malformed_at("Question: Q\nA) for\nB) while\nA) do\n"))
+        self.assertIn('only 2 options', self.malformed_at("Question: Q\nA) for\nB) while\nCorrect: A\n"))
+        self.assertIn('no Question', self.malformed_at("Sure!\nHere you go.\nLoops are great.\nReally.\n"))
+        with self.assertRaises(MalformedOutput):
+            QuestionStreamParser('descriptive').feed("Topic: Loops\nKeywords: for, while\n")
+        # Text after the Correct: line is never needed
+        parser = QuestionStreamParser('mcq')
+        parser.feed(self.VALID + "Explanation: anything at all\nA) ignored\n")
+        self.assertTrue(parser.complete)
+
+    def test_generation_retries_without_waiting_for_a_malformed_answer(self):
+        from students.views.dynamic_quiz_logic import generate_mcq
+
+        teacher = User.objects.create_user('teacher', password='pass')
+        syllabus = Syllabus.objects.create(teacher=teacher, title='Python', content='MODULE 1: Loops\nfor and while')
+        malformed = "Topic: Loops\nA) for\n" + "B) filler option text\n" * 40
+        llm.reset_client()
+        self.addCleanup(llm.reset_client)
+        llm.get_client().provider = ScriptedProvider([malformed, self.VALID], latency=1.0)
+        context = {'session_id': 'x', 'asked_questions': [], 'asked_topics': [], 'chat_history': []}
+
+        started = time.monotonic()
+        with self.assertLogs('students.views.dynamic_quiz_logic', 'INFO') as logs:
+            mcq = generate_mcq(syllabus, 'remember', context)
+        self.assertEqual(mcq['correct_answer'], 'do')
+        self.assertEqual(logs.records[0].session_id, 'x')
+        # Two full answers would take 2s; the malformed one is dropped after its second line
+        self.assertLess(time.monotonic() - started, 1.7)
+
+
+@override_settings(LLM_PROVIDER='fake', LLM_FAKE_LATENCY=0.0, QUIZ_PREFETCH_ENABLED=False,
+                   LLM_RESPONSE_CACHE={'ENABLED': False})
+class JsonOutputTests(SyllabusTestCase):
+    """Questions can be generated as schema-constrained JSON, with the text format as a fallback."""
+
+    VALID = {'topic': 'Loops', 'question': 'Which loop runs at least once?',
+             'options': ['for', 'while', 'do-while', 'none'], 'correct_index': 2}
+
+    def setUp(self):
+        llm.reset_client()
+        self.addCleanup(llm.reset_client)
+        generation_stats.clear()
+        self.addCleanup(generation_stats.clear)
+
+    def generate(self, answers=None):
+        from students.views.dynamic_quiz_logic import generate_mcq
+
+        if answers is not None:
+            llm.get_client().provider = ScriptedProvider(answers, latency=0.0)
+        context = {'session_id': 'x', 'asked_questions': [], 'asked_topics': [], 'chat_history': []}
+        return generate_mcq(self.syllabus, 'remember', context)
+
+    def test_json_answers_stream_like_text_answers(self):
+        text = json.dumps(self.VALID)
+        parser = AnswerParser('mcq')
+        events = []
+        for i in range(0, len(text), 4):
+            events += parser.feed(text[i:i + 4])
+        events += parser.close()
+        self.assertEqual(parser.format, 'json')
+        self.assertEqual([data['text'] for name, data in events if name == 'option'], self.VALID['options'])
+        self.assertIn(('question', {'text': self.VALID['question']}), events)
+        self.assertEqual(parser.result()['correct'], 'C')
+
+        with self.assertRaises(MalformedOutput):
+            AnswerParser('mcq').feed('{"question": "Q", "options": ["a", "b", "c", "d", "e"')
+
+    def test_json_mode_uses_one_call_per_question(self):
+        mcq = self.generate()
+        self.assertEqual(len(mcq['options']), 4)
+        stats = generation_stats.stats()['mcq/json']
+        self.assertEqual((stats['answers'], stats['questions'], stats['malformed']), (1, 1, 0))
+
+    def test_invalid_json_is_retried_and_text_answers_still_parse(self):
+        invalid = json.dumps(dict(self.VALID, correct_index=7))
+        text = "Topic: Loops\nQuestion: Which loop runs at least once?\nA) for\nB) while\nC) do\nD) none\nCorrect: C"
+        with self.assertLogs('students.views.dynamic_quiz_logic', 'INFO') as logs:
+            mcq = self.generate([invalid, text])
+        self.assertEqual(mcq['correct_answer'], 'do')
+        self.assertIn('correct_index names no option', logs.output[0])
+        stats = generation_stats.stats()['mcq/json']
+        self.assertEqual(stats['malformed'], 1)
+        self.assertEqual(stats['text_fallback'], 1)
+        self.assertEqual(stats['calls_per_question'], 2.0)
+        self.assertEqual(stats['parse_failure_rate'], 0.5)
+
+    @override_settings(LLM_OUTPUT_FORMAT='text')
+    def test_text_mode_is_counted_separately(self):
+        self.generate()
+        self.assertEqual(list(generation_stats.stats()), ['mcq/text'])
+
+
+class NearDuplicateTests(TestCase):
+    """Generated questions are checked against the attempt's MinHash index instead of exact text."""
+
+    ASKED = [
+        "What is the purpose of a for loop in Python?",
+        "What is a Python variable?",
+        "Which keyword exits a loop early in Python?",
+    ]
+
+    def test_rewordings_are_duplicates_and_new_questions_are_not(self):
+        index = QuestionIndex.from_questions(self.ASKED)
+        self.assertTrue(index.is_duplicate("What is the main purpose of the for loop in Python?"))
+        self.assertTrue(index.is_duplicate("What is a variable in Python?"))
+        self.assertTrue(index.is_duplicate("which KEYWORD exits a loop early in python"))
+        self.assertFalse(index.is_duplicate("How does a dictionary store its keys?"))
+        self.assertFalse(index.is_duplicate("What does the range() function return?"))
+
+    def test_code_questions_with_reordered_tokens_are_not_duplicates(self):
+        index = QuestionIndex.from_questions([
+            "What is the output of print(2**3)?",
+            "Given x = [1, 2, 3], what does print(x[1] + x[2]) output?",
+        ])
+        self.assertFalse(index.is_duplicate("What is the output of print(3**2)?"))
+        self.assertFalse(index.is_duplicate("Given x = [1, 2, 3], what does print(x[2] + x[1]) output?"))
+        self.assertFalse(index.is_duplicate("Given x = [1, 2, 3], what does print(x[1] - x[2]) output?"))
+        # The same code in other words is still a repeat
+        self.assertTrue(index.is_duplicate("What does print(2**3) output?"))
+
+    @override_settings(QUIZ_PREFETCH_ENABLED=True)
+    def test_prefetched_and_cached_near_duplicates_are_skipped(self):
+        class Attempt:
+            def question_index(attempt):
+                return QuestionIndex.from_questions(self.ASKED)
+
+        cache.set(prefetch.cache_key('mcq', 'a1', 'remember'), {'question': 'What is a variable in Python?'})
+        self.assertIsNone(prefetch.take('mcq', 'a1', 'remember', Attempt()))
+        cache.set(prefetch.cache_key('mcq', 'a1', 'remember'), {'question': 'How does a dictionary store its keys?'})
+        self.assertIsNotNone(prefetch.take('mcq', 'a1', 'remember', Attempt()))
+
+        responses = llm.ResponseCache(min_variants=1, report_every=0)
+        responses.store('k', 'reworded answer', 'What is a variable in Python?')
+        responses.store('k', 'fresh answer', 'How does a dictionary store its keys?')
+        context = {'asked_questions': list(self.ASKED)}
+        for _ in range(5):
+            self.assertEqual(responses.lookup('k', accept=lambda label: is_new_question(context, label)), 'fresh answer')
+
+    def test_lookups_take_under_a_millisecond(self):
+        index = QuestionIndex.from_questions(
+            f"Question {i}: how does construct {i * 7919} behave inside module {i % 13}?" for i in range(200)
+        )
+        started = time.perf_counter()
+        for i in range(200):
+            index.is_duplicate(f"Explain the behaviour of construct {i} when it appears in a nested loop body.")
+        self.assertLess((time.perf_counter() - started) / 200, 0.001)
+
+    @override_settings(LLM_PROVIDER='fake', LLM_FAKE_LATENCY=0.0, QUIZ_PREFETCH_ENABLED=False,
+                       LLM_RESPONSE_CACHE={'ENABLED': False})
+    def test_near_duplicate_answers_are_regenerated(self):
+        from students.views.dynamic_quiz_logic import generate_mcq
+
+        teacher = User.objects.create_user('teacher', password='pass')
+        syllabus = Syllabus.objects.create(teacher=teacher, title='Python', content='MODULE 1: Loops\nfor and while')
+        reworded = "Topic: Loops\nQuestion: What is the main purpose of the for loop in Python?\nA) a\nB) b\nC) c\nD) d\nCorrect: A"
+        fresh = "Topic: Loops\nQuestion: Which loop runs at least once?\nA) for\nB) while\nC) do\nD) none\nCorrect: C"
+        llm.reset_client()
+        self.addCleanup(llm.reset_client)
+        llm.get_client().provider = ScriptedProvider([reworded, fresh], latency=0.0)
+        context = {'session_id': 'x', 'asked_questions': list(self.ASKED), 'asked_topics': [], 'chat_history': []}
+        with override_settings(LLM_OUTPUT_FORMAT='text'):
+            mcq = generate_mcq(syllabus, 'remember', context)
+        self.assertEqual(mcq['question'], 'Which loop runs at least once?')
+
+
+@override_settings(LLM_PROVIDER='fake', LLM_FAKE_LATENCY=0.0, QUIZ_PREFETCH_ENABLED=False,
+                   QUIZ_STREAMING_ENABLED=False, QUIZ_BATCH_GENERATION=True, QUIZ_BATCH_SPARES=2,
+                   LLM_RESPONSE_CACHE={'ENABLED': False})
+@no_pool_refills
+class BatchGenerationTests(SyllabusTestCase):
+    """A level's questions come from one batched model call and a per-attempt queue."""
+
+    def setUp(self):
+        llm.reset_client()
+        self.addCleanup(llm.reset_client)
+        generation_stats.clear()
+        self.addCleanup(generation_stats.clear)
+        cache.clear()
+        self.async_client = AsyncClient()
+        self.async_client.force_login(self.student)
+
+    async def test_a_level_takes_one_model_call(self):
+        questions = []
+        await self.async_client.post(reverse('students:start_dynamic_quiz'),
+                                     {'syllabus': self.syllabus.id, 'num_per_taxonomy': 3})
+        for _ in range(3):
+            response = await self.async_client.get(reverse('students:dynamic_quiz'))
+            question = response.context['question_data']
+            questions.append(question['question'])
+            await self.async_client.post(reverse('students:dynamic_quiz'), {'answer': question['correct_answer']})
+        self.assertEqual(len(set(questions)), 3)
+        stats = generation_stats.stats()['mcq/json']
+        # 3 questions plus 2 spares in a single answer
+        self.assertEqual((stats['batches'], stats['questions'], stats['batch_dropped']), (1, 5, 0))
+
+    def test_text_batches_drop_malformed_questions(self):
+        valid = "Topic: Loops\nQuestion: Which loop runs at least once?\nA) for\nB) while\nC) do\nD) none\nCorrect: C"
+        text = f"{valid}\n---\nTopic: Loops\nA) stray option\n---\n{valid.replace('at least once', 'forever')}"
+        with self.assertLogs('students.streaming', 'INFO') as logs:
+            questions, dropped, output_format = parse_batch('mcq', text)
+            with self.assertRaises(MalformedOutput):
+                parse_batch('mcq', '{"questions": [{"question": "Q", "options": ["a"]}]}')
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual([q['question'] for q in questions],
+                         ['Which loop runs at least once?', 'Which loop runs forever?'])
+        self.assertEqual((dropped, output_format), (1, 'text'))
+
+
+class QuestionPoolTests(SyllabusTestCase):
+    """Pooled questions are served once per attempt and refilled from the model when a bucket runs low."""
+
+    def pooled(self, *texts, level='remember'):
+        for text in texts:
+            QuestionPool.add(self.syllabus.id, level, {'question': text, 'options': ['a', 'b'], 'correct_answer': 'a'})
+
+    def draw(self, asked=(), asked_index=None):
+        with unittest.mock.patch.object(QuestionPool, 'schedule_refill') as schedule_refill:
+            question = QuestionPool.draw(self.syllabus.id, 'remember', asked, asked_index)
+        return question, schedule_refill.called
+
+    def test_draws_skip_asked_questions_until_the_bucket_is_spent(self):
+        texts = [f'Question {i}?' for i in range(question_pool.low_water() + 1)]
+        self.pooled(*texts)
+        asked = []
+        for _ in texts:
+            question, refilled = self.draw(asked)
+            self.assertNotIn(question['question'], asked)
+            self.assertFalse(refilled)
+            # Asked questions match whatever their case and spacing
+            asked.append(f"  {question['question'].upper()} ")
+        self.assertEqual(sorted(q.strip().lower() for q in asked), sorted(t.lower() for t in texts))
+        self.assertEqual(self.draw(asked), (None, True))
+        self.assertEqual(set(PooledQuestion.objects.values_list('times_served', flat=True)), {1})
+
+    def test_low_bucket_is_refilled_after_the_draw(self):
+        self.pooled('Only question?')
+        question, refilled = self.draw()
+        self.assertEqual(question['question'], 'Only question?')
+        self.assertTrue(refilled)
+
+    def test_questions_are_retired_after_max_serves(self):
+        self.pooled('Popular question?')
+        with self.settings(QUESTION_POOL_MAX_SERVES=2):
+            self.assertIsNotNone(self.draw()[0])
+            self.assertIsNotNone(self.draw()[0])
+            self.assertEqual(self.draw(), (None, True))
+        self.assertEqual(PooledQuestion.objects.get().times_served, 2)
+
+    def test_add_rejects_exact_duplicates_within_a_bucket(self):
+        self.assertTrue(QuestionPool.add(self.syllabus.id, 'remember', {'question': 'What is a loop?'}))
+        self.assertFalse(QuestionPool.add(self.syllabus.id, 'remember', {'question': '  what IS a   loop? '}))
+        self.assertTrue(QuestionPool.add(self.syllabus.id, 'understand', {'question': 'What is a loop?'}))
+        self.assertEqual(PooledQuestion.objects.count(), 2)
+
+    def test_near_duplicates_are_neither_pooled_nor_drawn(self):
+        self.pooled('What is the purpose of a for loop in Python?', 'What is a Python variable?')
+        self.assertFalse(QuestionPool.add(self.syllabus.id, 'remember', {'question': 'What is a variable in Python?'}))
+        self.assertEqual(PooledQuestion.objects.count(), 2)
+
+        asked = ['What is the main purpose of the for loop in Python?']
+        for _ in range(5):
+            question, _ = self.draw(asked, QuestionIndex.from_questions(asked))
+            self.assertEqual(question['question'], 'What is a Python variable?')
+
+    def generated(self, texts):
+        """Patch the pool's question generator to answer ``texts`` in turn."""
+        answers = iter(texts)
+        return unittest.mock.patch(
+            'students.views.dynamic_quiz_logic.generate_pool_question',
+            side_effect=lambda syllabus_id, level_name, existing: {'question': next(answers)},
+        )
+
+    def test_refill_fills_an_empty_bucket_to_the_target(self):
+        with self.generated(['Q1?', 'Q2?', 'Q3?']) as generate:
+            self.assertEqual(QuestionPool.refill(self.syllabus.id, 'remember', target=3), 3)
+        self.assertEqual(QuestionPool.available(self.syllabus.id, 'remember').count(), 3)
+        # Each call is told what the bucket already holds
+        self.assertEqual([sorted(call.args[2]) for call in generate.call_args_list], [[], ['Q1?'], ['Q1?', 'Q2?']])
+
+    def test_refill_leaves_a_full_bucket_alone(self):
+        self.pooled('Q1?', 'Q2?', 'Q3?')
+        with self.generated([]) as generate:
+            self.assertEqual(QuestionPool.refill(self.syllabus.id, 'remember', target=3), 0)
+        generate.assert_not_called()
+
+    def test_refill_gives_up_on_repeated_duplicates(self):
+        self.pooled('Q1?')
+        with self.generated(['q1?', 'Q2?'] + ['Q2?'] * 10) as generate:
+            self.assertEqual(QuestionPool.refill(self.syllabus.id, 'remember', target=3), 1)
+        # Two missing questions get two attempts each
+        self.assertEqual(generate.call_count, 4)
+
+
+class PrefetchConnectionTests(SimpleTestCase):
+    """Prefetch generation runs on worker threads that must not keep database connections open."""
+
+    def test_worker_threads_release_their_connections(self):
+        from students import prefetch
+
+        calls = []
+
+        def generate(syllabus, level_name, context):
+            calls.append(('generate', threading.current_thread()))
+            return None
+
+        def close_old_connections():
+            calls.append(('close', threading.current_thread()))
+
+        with unittest.mock.patch.object(prefetch, 'close_old_connections', close_old_connections):
+            asyncio.run(prefetch._generate_candidates('mcq', 'attempt-1', generate, None, {}, ['remember']))
+        self.assertEqual([name for name, _ in calls], ['close', 'generate', 'close'])
+        self.assertEqual(len({thread for _, thread in calls}), 1)
+        self.assertIsNot(calls[0][1], threading.main_thread())
+
+
+class PromptBudgetTests(SimpleTestCase):
+    """Generation prompts are built from compiled templates and kept within a token budget."""
+
+    def test_prompt_size_and_build_time_stay_flat_as_an_attempt_grows(self):
+        from students.management.commands.benchmark_prompts import measure
+
+        for engine in ('mcq', 'descriptive'):
+            short_tokens, _ = measure(engine, 10, repeats=5)
+            long_tokens, long_seconds = measure(engine, 200, repeats=5)
+            self.assertLessEqual(long_tokens, prompts.token_budget())
+            self.assertLess(long_tokens, short_tokens * 1.1)
+            self.assertLess(long_seconds, 0.005)
+
+    @override_settings(PROMPT_TOKEN_BUDGET=400, PROMPT_TOPICS_TOKEN_BUDGET=20)
+    def test_oldest_exchanges_are_summarized_first(self):
+        history = [{'role': 'user', 'parts': ['system']}, {'role': 'model', 'parts': ['ok']}]
+        for topic in ('Loops', 'Functions', 'Classes', 'Modules'):
+            history.append({'role': 'user', 'parts': ['prompt ' * 60]})
+            history.append({'role': 'model', 'parts': [f'Topic: {topic}\nQuestion: Q?']})
+        context = {'chat_history': history}
+
+        fitted = prompts.fit_history(context, reserve=100)
+        self.assertIs(fitted, context['chat_history'])
+        self.assertEqual([turn['role'] for turn in fitted], ['user', 'model'] * (len(fitted) // 2))
+        self.assertEqual(fitted[2]['parts'][0], prompts.SUMMARY_PREFIX + 'Loops; Functions.')
+        self.assertIn('Modules', fitted[-1]['parts'][0])
+        self.assertLessEqual(sum(prompts.turn_tokens(turn) for turn in fitted) + 100, 400)
+        # Fitting again keeps the summary instead of nesting it
+        self.assertEqual(prompts.fit_history(context, reserve=100), fitted)
+
+    @override_settings(PROMPT_TOPICS_TOKEN_BUDGET=10)
+    def test_only_recent_topics_are_listed(self):
+        self.assertEqual(prompts.topic_instruction([f'Topic {i}' for i in range(50)]),
+                         "AVOID these already covered topics: Topic 47, Topic 48, Topic 49")
+        template = prompts.PromptTemplate("Session: {session_id} | JSON: {\"questions\": []} | {topic_instruction}")
+        self.assertEqual(template.render(session_id='s1', topic_instruction='x'), 'Session: s1 | JSON: {"questions": []} | x')
+
+
+class StructuredLoggingTests(SimpleTestCase):
+    """Log records are written as JSON by a background thread, with debug events sampled."""
+
+    def record(self, level, msg, **extra):
+        return logging.makeLogRecord(dict(name='students.test', levelno=level, levelname=logging.getLevelName(level),
+                                          msg=msg, args=(), **extra))
+
+    def test_records_are_written_as_json_with_their_fields(self):
+        stream = io.StringIO()
+        handler = BackgroundQueueHandler(stream)
+        logger = logging.getLogger('students.test_structured')
+        logger.addHandler(handler)
+        logger.propagate = False
+        self.addCleanup(logger.removeHandler, handler)
+        state = {'attempt_id': 'a1', 'session_id': 's1'}
+        logger.warning("Question %d failed", 3, extra=attempt_fields(state))
+        handler.close()  # Waits for the listener to write what is queued
+
+        entry = json.loads(stream.getvalue())
+        self.assertEqual((entry['message'], entry['level']), ('Question 3 failed', 'WARNING'))
+        self.assertEqual((entry['attempt_id'], entry['session_id']), ('a1', 's1'))
+
+    def test_json_formatter_includes_extra_fields_and_exceptions(self):
+        record = self.record(logging.INFO, 'Answer evaluated', score=70.9, matched=['loop'])
+        entry = json.loads(JsonFormatter().format(record))
+        self.assertEqual((entry['score'], entry['matched']), (70.9, ['loop']))
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = self.record(logging.ERROR, 'failed', exc_info=sys.exc_info())
+        self.assertIn('ValueError: boom', json.loads(JsonFormatter().format(record))['exc_info'])
+
+    def test_only_debug_events_are_sampled(self):
+        dropping = SamplingFilter(rate=0.0)
+        self.assertFalse(dropping.filter(self.record(logging.DEBUG, 'verbose')))
+        self.assertTrue(dropping.filter(self.record(logging.INFO, 'event')))
+        self.assertTrue(SamplingFilter(rate=1.0).filter(self.record(logging.DEBUG, 'verbose')))
+
+
+class FlakyProvider(llm.FakeProvider):
+    """Fake provider whose first call fails with a retryable error."""
+
+    def __init__(self):
+        super().__init__(latency=0.0)
+        self.calls = 0
+
+    def generate(self, contents, timeout, schema=None):
+        self.calls += 1
+        if self.calls == 1:
+            raise ConnectionError('reset by peer')
+        return super().generate(contents, timeout, schema)
+
+
+class PipelineMetricsTests(TestCase):
+    """Each stage of a quiz request is measured, and /metrics/ serves the whole server's values."""
+
+    def setUp(self):
+        if not metrics.is_enabled():
+            self.skipTest('prometheus_client is not installed')
+
+    def sample(self, name, **labels):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    def test_model_calls_retries_and_parsing_are_measured(self):
+        calls = self.sample('bloomify_llm_call_seconds_count', method='generate', outcome='ok')
+        retries = self.sample('bloomify_llm_retries_total', method='generate')
+        failed_parses = self.sample('bloomify_parse_seconds_count', kind='mcq', outcome='failed')
+
+        client = llm.LLMClient(FlakyProvider(), backoff_base=0.0)
+        self.assertTrue(client.generate('Generate a remember level question.'))
+        with self.assertLogs('students.views.dynamic_quiz_logic', 'WARNING'):
+            self.assertIsNone(parse_question_from_response("Topic: Loops\nA) for\n"))
+
+        self.assertEqual(self.sample('bloomify_llm_call_seconds_count', method='generate', outcome='ok'), calls + 1)
+        self.assertEqual(self.sample('bloomify_llm_retries_total', method='generate'), retries + 1)
+        self.assertEqual(self.sample('bloomify_parse_seconds_count', kind='mcq', outcome='failed'), failed_parses + 1)
+
+    def test_quiz_state_reads_and_writes_are_sized(self):
+        before = self.sample('bloomify_quiz_state_bytes_sum', operation='save_counters')
+        state = quiz_states.create({}, 'mcq', {'session_id': 's1', 'level_index': 0})
+        state['level_index'] = 1
+        state.save()
+        written = len(json.dumps(state.counters))
+        self.assertEqual(self.sample('bloomify_quiz_state_bytes_sum', operation='save_counters'), before + written)
+        self.assertGreater(self.sample('bloomify_quiz_state_seconds_count', operation='create'), 0)
+
+    def test_endpoint_only_answers_direct_local_requests(self):
+        response = self.client.get('/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE bloomify_llm_call_seconds histogram', response.content)
+        self.assertEqual(self.client.get('/metrics/', REMOTE_ADDR='10.0.0.5').status_code, 404)
+        self.assertEqual(self.client.get('/metrics/', HTTP_X_FORWARDED_FOR='203.0.113.9').status_code, 404)
+
+    def test_worker_processes_are_added_up(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        worker = "from bloomify import metrics; metrics.LLM_RETRIES.labels('generate').inc(2)"
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory)
+        for _ in range(3):
+            subprocess.run([sys.executable, '-c', worker], cwd=Path(__file__).resolve().parent.parent, env=env, check=True)
+
+        with unittest.mock.patch.dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory):
+            text = metrics.exposition().decode()
+        self.assertIn('bloomify_llm_retries_total{method="generate"} 6.0', text)
 
-# Create your tests here.
@@ -1,16 +1,32 @@
 # In students/views/descriptive_quiz_logic.py
 
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404
+from django.urls import reverse
 from teachers.models import Syllabus
-import google.generativeai as genai
-from django.conf import settings
-import re
+from teachers.syllabus_context import render_prompt_context, arender_prompt_context
+from students import prefetch
+from students.prompts import PromptTemplate, estimate_tokens, fit_history, topic_instruction
+from students import quiz_state as quiz_states
+from students.similarity import is_new_question
+from students.streaming import (
+    AnswerParser, MalformedOutput, aread_answer, generation_stats, output_schema, parse_answer, question_payload,
+    read_answer, sse_event, streaming_enabled,
+)
+from students.scoring import tokenize_text, evaluate_answer, PASS_SCORE
+from bloomify import llm, metrics
+from bloomify.log import attempt_fields
+import functools
+import logging
 import random
+from contextlib import aclosing, closing
+
+logger = logging.getLogger(__name__)
 
 # --- Configuration ---
-genai.configure(api_key=settings.API_KEY)
-MODEL = genai.GenerativeModel('gemini-2.5-flash')
 BLOOM_LEVELS = ['remember', 'understand', 'apply', 'analyze', 'evaluate', 'create']
 
 # --- NEW: Level-Specific Instructions for Descriptive Questions ---
@@ -121,349 +137,383 @@ LEVEL_INSTRUCTIONS_DESCRIPTIVE = {
 }
 
 # --- Helper Functions ---
-def normalize_keyword(keyword):
+def descriptive_from_fields(fields):
+    """The quiz's question dict from the fields of a parsed answer, with cleaned-up keywords."""
+    # Tokenize keywords and remove duplicates while preserving order
+    raw_keywords = [k.strip().lower() for k in fields['keywords'].split(',')]
+    # Remove duplicates while preserving order
+    seen = set()
+    unique_keywords = []
+    for keyword in raw_keywords:
+        if keyword and keyword not in seen and len(keyword) > 2:
+            unique_keywords.append(keyword)
+            seen.add(keyword)
+    
+    # Further process keywords to remove stopwords
+    final_keywords = tokenize_text(' '.join(unique_keywords))
+    
+    return {
+        "question": fields['question'], 
+        "keywords": final_keywords,
+        "topic": fields['topic'] if fields['topic'] else "General"
+    }
+
+
+def parse_descriptive_response(response_text):
+    """Parses a descriptive question and its evaluation keywords from the AI's response."""
+    try:
+        with metrics.timed(metrics.PARSE_SECONDS, 'descriptive'):
+            fields = parse_answer('descriptive', response_text)
+        return descriptive_from_fields(fields)
+    except MalformedOutput as e:
+        # The whole answer is only logged for the sampled debug events
+        logger.warning("Descriptive answer could not be parsed: %s", e)
+        logger.debug("Unparsed descriptive answer", extra={'response': response_text})
+        return None
+
+VARIETY_PROMPTS = [
+    "Focus on a different concept or module from the syllabus.",
+    "Choose a topic that hasn't been covered in previous questions.",
+    "Explore a practical application or real-world scenario.",
+    "Create a question about advanced concepts in the syllabus.",
+    "Focus on fundamental principles and theory.",
+    "Generate a question about implementation details."
+]
+
+
+# Per-level parts of the descriptive prompt
+LEVEL_REQUIREMENTS_DESCRIPTIVE = {
+    "remember": "REMEMBER LEVEL: Ask ONLY for basic definitions, facts, or simple recall. NO scenarios, applications, or explanations required.",
+    "understand": "UNDERSTAND LEVEL: Ask for explanations or descriptions of how something works. NO complex applications.",
+    "apply": "APPLY LEVEL: Present a specific scenario and ask how to use a concept to solve it.",
+    "analyze": "ANALYZE LEVEL: Ask to compare, contrast, or break down concepts into parts.",
+    "evaluate": "EVALUATE LEVEL: Ask for judgment or assessment with justification.",
+    "create": "CREATE LEVEL: Ask to design, propose, or create something new.",
+}
+GOOD_EXAMPLES_DESCRIPTIVE = {
+    "remember": "- 'What is a Python function?'\n        - 'Define what a module is in Python'\n        - 'What are the basic data types in Python?'",
+    "understand": "- 'Explain how Python functions work'\n        - 'Describe the difference between lists and tuples'",
+    "apply": "- 'You need to store student grades - which data structure would you use and how?'\n        - 'How would you use a function to calculate the average of a list?'",
+    "analyze": "- 'Compare the advantages of lists vs dictionaries'\n        - 'Analyze when to use functions vs classes'",
+    "evaluate": "- 'Evaluate which loop type is better for this scenario and justify'\n        - 'Assess the best approach for error handling in this case'",
+    "create": "- 'Design a program structure for a calculator'\n        - 'Create a plan for organizing code into modules'",
+}
+BAD_EXAMPLES_DESCRIPTIVE = {
+    "remember": "- Questions asking for explanations, scenarios, or applications\n        - Questions with 'explain', 'describe', 'how would you'\n        - Complex multi-part questions",
+    "understand": "- Simple definition questions\n        - Questions asking for application or problem-solving\n        - Questions requiring analysis or evaluation",
+    "apply": "- Simple definition or explanation questions\n        - Questions without specific scenarios\n        - Questions asking for analysis or evaluation",
+    "analyze": "- Simple recall or explanation questions\n        - Questions without comparison or breakdown requirements\n        - Questions asking for application only",
+    "evaluate": "- Questions without judgment or assessment requirements\n        - Simple application or analysis questions\n        - Questions without justification requirements",
+    "create": "- Questions asking for analysis, application, or explanation only\n        - Questions without creative or design requirements",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def descriptive_template(level_name, json_output=False):
     """
-    Normalize keywords by handling hyphens, underscores, and common variations.
+    The compiled descriptive prompt for ``level_name`` (see students.prompts);
+    ``json_output`` asks for DESCRIPTIVE_SCHEMA JSON.
     """
-    if not keyword:
-        return keyword
-    
-    # Convert to lowercase and handle compound words
-    normalized = keyword.lower()
-    # Replace hyphens and underscores with spaces for matching
-    normalized = re.sub(r'[-_]', ' ', normalized)
-    return normalized.strip()
+    instruction = LEVEL_INSTRUCTIONS_DESCRIPTIVE[level_name]
+    if json_output:
+        output_format = f"""Respond with a JSON object only:
+    topic: Name of the Module/Topic you chose - make it DIFFERENT from previous topics
+    question: The {level_name} level question text - must match level requirements
+    keywords: List of 4 or more keywords for evaluating the answer"""
+    else:
+        output_format = f"""Format your response STRICTLY as follows:
+    Topic: [Name of the Module/Topic you chose - make it DIFFERENT from previous topics]
+    Question: [The {level_name} level question text - must match level requirements]
+    Keywords: [keyword1, keyword2, keyword3, keyword4]"""
+    
+    return PromptTemplate(f"""
+    Session: {{session_id}} | Seed: {{seed}}
+    
+    BLOOM'S TAXONOMY LEVEL: {level_name.upper()}
+    LEVEL DEFINITION: 
+    - Remember: Recalling facts and basic concepts
+    - Understand: Explaining ideas or concepts  
+    - Apply: Using information in a new situation
+    - Analyze: Breaking down information into parts
+    - Evaluate: Justifying a stand or decision
+    - Create: Producing new or original work
+    
+    CURRENT LEVEL FOCUS: You must create a {level_name.upper()} level question ONLY.
+    
+    {{syllabus_context}}
+    
+    Your task: {instruction}
+    
+    DIVERSITY REQUIREMENT: {{variety}}
+    TOPIC VARIETY: {{topic_instruction}}
+    
+    STRICT LEVEL REQUIREMENTS FOR {level_name.upper()}:
+    {LEVEL_REQUIREMENTS_DESCRIPTIVE[level_name]}
+    
+    GOOD EXAMPLES for {level_name.upper()} level:
+    {GOOD_EXAMPLES_DESCRIPTIVE[level_name]}
+    
+    BAD EXAMPLES for {level_name.upper()} level (AVOID):
+    {BAD_EXAMPLES_DESCRIPTIVE[level_name]}
+    
+    IMPORTANT GUIDELINES FOR KEYWORDS:
+    1. Choose UNIQUE, specific keywords (no duplicates in the list)
+    2. Focus on technical terms, concepts, and key processes
+    3. Avoid common words like 'and', 'or', 'the', 'is', 'are', 'can', 'will'
+    4. Keywords should be nouns, verbs, or adjectives that are central to the topic
+    5. Order keywords logically as they would appear in a good answer
+    6. Each keyword should add distinct value to the evaluation
+    
+    IMPORTANT GUIDELINES FOR QUESTIONS:
+    1. Choose a DIFFERENT topic/concept from previous questions
+    2. Ensure the question is unique and not similar to previous ones
+    3. Make the question clear and specific
+    4. MUST match the {level_name.upper()} level requirements exactly
+    5. Focus on one main concept or process
+    
+    {output_format}
+    
+    VERIFY: Before finalizing, check that your question truly matches {level_name.upper()} level requirements!
+    """)
+
 
-def get_keyword_synonyms(keyword):
+def build_descriptive_prompt(syllabus_context, level_name, quiz_state, json_output=False):
+    """The generation prompt for one attempt at a descriptive question at ``level_name`` (see ``descriptive_template``)."""
+    return descriptive_template(level_name, json_output).render(
+        session_id=quiz_state.get('session_id', 'default'),
+        syllabus_context=syllabus_context,
+        # Add randomness and variety to prevent same questions
+        variety=random.choice(VARIETY_PROMPTS),
+        seed=random.randint(1000, 9999),
+        # Only the most recent covered topics, so the prompt doesn't grow with the attempt
+        topic_instruction=topic_instruction(quiz_state.get('asked_topics', [])),
+    )
+
+
+def generate_descriptive_question(syllabus, level_name, quiz_state):
     """
-    Get synonyms and variations for common technical keywords.
+    Asks the model for one new descriptive question at ``level_name``, retrying up to 3 times.
+    ``quiz_state`` is a generation context (see QuizState.generation_context);
+    its ``chat_history`` is updated. Returns the parsed question or None.
     """
-    synonym_map = {
-        # Programming concepts
-        'function': ['function', 'func', 'method', 'procedure'],
-        'variable': ['variable', 'var', 'identifier', 'name'],
-        'loop': ['loop', 'iteration', 'iterate', 'repeat'],
-        'condition': ['condition', 'conditional', 'test', 'check'],
-        'boolean': ['boolean', 'bool', 'true/false', 'logical'],
-        'string': ['string', 'str', 'text', 'character'],
-        'integer': ['integer', 'int', 'number', 'whole number'],
-        'float': ['float', 'decimal', 'floating point', 'real number'],
-        
-        # Operations and methods
-        'append': ['append', 'add', 'insert', 'push'],
-        'remove': ['remove', 'delete', 'pop', 'eliminate'],
-        'equality': ['equality', 'equal', 'equals', 'same'],
-        'inequality': ['inequality', 'not equal', 'different', 'unequal'],
-        'comparison': ['comparison', 'compare', 'comparing', 'contrast'],
-        
-        # Data structures
-        'list': ['list', 'array', 'sequence', 'collection'],
-        'tuple': ['tuple', 'immutable sequence'],
-        'dictionary': ['dictionary', 'dict', 'map', 'hash table'],
-        
-        # File operations
-        'read': ['read', 'reading', 'input', 'load'],
-        'write': ['write', 'writing', 'output', 'save'],
-        'append': ['append', 'add to end', 'attach'],
-        
-        # Control flow
-        'while loop': ['while', 'while loop', 'conditional loop'],
-        'for loop': ['for', 'for loop', 'iteration loop'],
-        'if statement': ['if', 'if statement', 'conditional'],
+    client = llm.get_client()
+    deadline = client.new_deadline()  # Shared by all attempts for this question
+    schema = output_schema('descriptive')
+    descriptive_question = None
+    for i in range(3):  # Retry up to 3 times (parse failures and repeats)
+        logger.debug("Generating a descriptive question",
+                     extra=dict(attempt_fields(quiz_state), bloom_level=level_name, try_number=i + 1))
         
-        # Modules and imports
-        'import': ['import', 'importing', 'include', 'load'],
-        'module': ['module', 'library', 'package', 'file'],
-        'functionality': ['functionality', 'features', 'capabilities', 'functions'],
-        'extension': ['extension', 'expand', 'enhance', 'add to'],
+        # Topic outline plus one uncovered section instead of the whole syllabus
+        syllabus_context = render_prompt_context(syllabus, quiz_state.get('asked_topics', []))
+        prompt = build_descriptive_prompt(syllabus_context, level_name, quiz_state, json_output=bool(schema))
         
-        # Object-oriented concepts
-        'class': ['class', 'object type', 'template'],
-        'object': ['object', 'instance', 'entity'],
-        'method': ['method', 'function', 'operation'],
-        'attribute': ['attribute', 'property', 'field', 'variable'],
+        chat_history = fit_history(quiz_state, estimate_tokens(prompt))
+        chat_history.append({'role': 'user', 'parts': [prompt]})
         
-        # Common programming terms
-        'parameter': ['parameter', 'argument', 'input', 'param'],
-        'argument': ['argument', 'parameter', 'value', 'input'],
-        'return': ['return', 'output', 'result', 'give back'],
-        'syntax': ['syntax', 'format', 'structure', 'grammar'],
-        'error': ['error', 'exception', 'mistake', 'problem'],
-    }
-    
-    # Normalize the keyword first
-    normalized_key = normalize_keyword(keyword)
-    
-    # Check for exact matches and partial matches
-    for key, synonyms in synonym_map.items():
-        if normalized_key == key or normalized_key in synonyms:
-            return synonyms
-        # Also check if any synonym contains the keyword or vice versa
-        for synonym in synonyms:
-            if normalized_key in synonym or synonym in normalized_key:
-                return synonyms
-    
-    return [normalized_key]
+        # Read the answer as it streams; a malformed one is dropped at once
+        parser = AnswerParser('descriptive')
+        parts = []
+        try:
+            with closing(client.stream(chat_history, deadline=deadline, schema=schema)) as chunks:
+                read_answer(chunks, parser, parts)
+            parsed_question = descriptive_from_fields(parser.result())
+        except llm.LLMError as e:
+            # Transient errors were already retried by the client; stop here
+            logger.warning("Model call failed during generation: %s", e, extra=attempt_fields(quiz_state))
+            break
+        except MalformedOutput as e:
+            logger.info("Malformed answer, retrying without waiting for the rest: %s", e,
+                        extra=attempt_fields(quiz_state))
+            parsed_question = None
+        chat_history.append({'role': 'model', 'parts': [''.join(parts)]})
+        is_new = parsed_question and is_new_question(quiz_state, parsed_question.get('question'))
+        generation_stats.record_answer('descriptive', schema, parser,
+                                       'parsed' if is_new else 'repeat' if parsed_question else 'malformed')
+        if is_new:
+            descriptive_question = parsed_question
+            break
 
-def tokenize_text(text):
-    """
-    Enhanced tokenization that extracts meaningful tokens from text.
-    """
-    if not text:
-        return []
-    
-    # Convert to lowercase and remove basic punctuation
-    text = text.lower()
-    # Remove common punctuation but keep word boundaries
-    text = re.sub(r'[^\w\s-]', ' ', text)
-    # Replace multiple spaces with single space
-    text = re.sub(r'\s+', ' ', text).strip()
-    # Split into words
-    words = text.split()
-    
-    # Comprehensive stopwords list
-    stopwords_list = {
-        # Articles and determiners
-        'a', 'an', 'the', 'this', 'that', 'these', 'those', 'some', 'any', 'each', 'every',
-        # Prepositions
-        'at', 'by', 'for', 'from', 'in', 'of', 'on', 'to', 'with', 'into', 'onto', 'upon',
-        'over', 'under', 'above', 'below', 'through', 'during', 'before', 'after', 'between',
-        'among', 'within', 'without', 'beyond', 'toward', 'towards', 'across', 'against',
-        # Pronouns
-        'i', 'me', 'my', 'mine', 'myself', 'you', 'your', 'yours', 'yourself', 'yourselves',
-        'he', 'him', 'his', 'himself', 'she', 'her', 'hers', 'herself', 'it', 'its', 'itself',
-        'we', 'us', 'our', 'ours', 'ourselves', 'they', 'them', 'their', 'theirs', 'themselves',
-        # Conjunctions
-        'and', 'or', 'but', 'so', 'yet', 'nor', 'although', 'though', 'because', 'since',
-        'while', 'whereas', 'if', 'unless', 'until', 'when', 'where', 'how', 'why', 'what',
-        # Auxiliary verbs and common verbs
-        'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having',
-        'do', 'does', 'did', 'doing', 'will', 'would', 'shall', 'should', 'can', 'could',
-        'may', 'might', 'must', 'ought', 'need', 'dare', 'used',
-        # Common adverbs
-        'not', 'no', 'yes', 'very', 'too', 'quite', 'rather', 'really', 'just', 'only',
-        'also', 'even', 'still', 'already', 'yet', 'again', 'once', 'twice', 'here', 'there',
-        'where', 'everywhere', 'somewhere', 'anywhere', 'nowhere', 'then', 'now', 'today',
-        'yesterday', 'tomorrow', 'always', 'never', 'sometimes', 'often', 'usually',
-        # Question words and fillers
-        'who', 'whom', 'whose', 'which', 'what', 'when', 'where', 'why', 'how', 'well',
-        'sure', 'okay', 'right', 'left', 'good', 'bad', 'better', 'best', 'worse', 'worst',
-        # Common phrases starters
-        'let', 'lets', 'make', 'take', 'give', 'put', 'get', 'got', 'come', 'go', 'see', 'look',
-        'know', 'think', 'feel', 'want', 'like', 'need', 'try', 'use', 'work', 'help',
-        # Breakdown/explanation words
-        'breakdown', 'explanation', 'difference', 'clear', 'understand', 'question'
-    }
-    
-    # Filter out stopwords and short words, and remove duplicates while preserving order
-    seen = set()
-    tokens = []
-    for word in words:
-        if len(word) > 2 and word not in stopwords_list and word not in seen:
-            tokens.append(word)
-            seen.add(word)
-    
-    return tokens
+    generation_stats.record_question('descriptive', schema, descriptive_question is not None)
+    return descriptive_question
 
-def parse_descriptive_response(response_text):
-    """Parses a descriptive question and its evaluation keywords from the AI's response."""
-    lines = response_text.strip().split('\n')
-    question, keywords_str, topic = "", "", ""
-    
-    for line in lines:
-        line = line.strip()
-        if line.lower().startswith("topic:"):
-            topic = line[len("topic:"):].strip()
-        elif line.lower().startswith("question:"):
-            question = line[len("question:"):].strip()
-        elif line.lower().startswith("keywords:"):
-            keywords_str = line[len("keywords:"):].strip()
-    
-    if question and keywords_str:
-        # Tokenize keywords and remove duplicates while preserving order
-        raw_keywords = [k.strip().lower() for k in keywords_str.split(',')]
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_keywords = []
-        for keyword in raw_keywords:
-            if keyword and keyword not in seen and len(keyword) > 2:
-                unique_keywords.append(keyword)
-                seen.add(keyword)
-        
-        # Further process keywords to remove stopwords
-        final_keywords = tokenize_text(' '.join(unique_keywords))
-        
-        return {
-            "question": question, 
-            "keywords": final_keywords,
-            "topic": topic if topic else "General"
-        }
-    
-    print(f"--- PARSING FAILED (Descriptive) ---\n{response_text}\n----------------------")
-    return None
 
-def evaluate_answer_with_token_sequence(student_answer, ai_keywords):
+async def astream_descriptive_question(syllabus, level_name, quiz_state):
     """
-    Enhanced evaluation that checks for token sequence matching with flexible synonym and phrase matching.
-    Returns both score and detailed matching information for feedback storage.
+    Streaming ``generate_descriptive_question``: (event, data) pairs for the
+    browser while the model writes (see ``astream_mcq``). The keywords are not
+    sent; the last pair is ('done', question) or ('failed', {}).
     """
-    if not student_answer or not ai_keywords:
-        return 0.0, {}
-
-    # Tokenize student answer
-    student_tokens = tokenize_text(student_answer)
-    
-    if not student_tokens or not ai_keywords:
-        return 0.0, {}
-    
-    print(f"AI Keywords: {ai_keywords}")
-    print(f"Student Tokens (first 15): {student_tokens[:15]}")
-    
-    # Enhanced matching with synonyms and flexible phrase matching
-    matches = 0
-    total_possible = len(ai_keywords)
-    matched_keywords = []
-    unmatched_keywords = []
-    
-    # Create a normalized version of student text for phrase matching
-    student_text_normalized = normalize_keyword(student_answer)
-    
-    for keyword in ai_keywords:
-        found = False
-        best_match = ""
-        match_score = 0
-        
-        # Get synonyms for the keyword
-        keyword_synonyms = get_keyword_synonyms(keyword)
-        normalized_keyword = normalize_keyword(keyword)
-        
-        # Method 1: Check for phrase matches in normalized text
-        for synonym in keyword_synonyms:
-            normalized_synonym = normalize_keyword(synonym)
-            if normalized_synonym in student_text_normalized:
-                found = True
-                best_match = synonym
-                match_score = 1.0
-                break
-        
-        # Method 2: Check individual tokens if no phrase match found
-        if not found:
-            for token in student_tokens:
-                # Direct synonym matching
-                if token in keyword_synonyms:
-                    found = True
-                    best_match = token
-                    match_score = 1.0
-                    break
-                
-                # Partial matching for longer words (stem matching)
-                for synonym in keyword_synonyms:
-                    if len(synonym) > 3 and len(token) > 3:
-                        # Check if one contains the other (at least 4 characters)
-                        if (synonym in token and len(synonym) >= 4) or (token in synonym and len(token) >= 4):
-                            found = True
-                            best_match = token
-                            match_score = 0.8  # Slightly lower score for partial matches
-                            break
-                
-                if found:
-                    break
-        
-        # Method 3: Fuzzy matching for close spellings (basic)
-        if not found:
-            for token in student_tokens:
-                if len(token) > 4 and len(normalized_keyword) > 4:
-                    # Simple character overlap check
-                    common_chars = set(token) & set(normalized_keyword)
-                    if len(common_chars) >= min(len(token), len(normalized_keyword)) * 0.6:
-                        found = True
-                        best_match = token
-                        match_score = 0.6  # Lower score for fuzzy matches
-                        break
+    client = llm.get_client()
+    deadline = client.new_deadline()
+    schema = output_schema('descriptive')
+    for i in range(3):
+        syllabus_context = await arender_prompt_context(syllabus, quiz_state.get('asked_topics', []))
+        prompt = build_descriptive_prompt(syllabus_context, level_name, quiz_state, json_output=bool(schema))
+        
+        chat_history = fit_history(quiz_state, estimate_tokens(prompt))
+        chat_history.append({'role': 'user', 'parts': [prompt]})
         
-        if found:
-            matches += match_score
-            matched_keywords.append(f"{keyword}→{best_match}")
-        else:
-            unmatched_keywords.append(keyword)
-    
-    # Calculate final score with bonus for comprehensive coverage
-    base_score = (matches / total_possible) * 100 if total_possible > 0 else 0
-    
-    # Bonus scoring system
-    coverage_ratio = matches / total_possible if total_possible > 0 else 0
-    if coverage_ratio >= 0.8:  # 80% or more keywords matched
-        base_score *= 1.1  # 10% bonus
-    elif coverage_ratio >= 0.6:  # 60-79% keywords matched
-        base_score *= 1.05  # 5% bonus
-    
-    # Cap the score at 100%
-    final_score = min(base_score, 100.0)
-    
-    print(f"Enhanced Evaluation Results:")
-    print(f"  Matched: {matches}/{total_possible} ({coverage_ratio:.1%})")
-    print(f"  Final Score: {final_score:.1f}%")
-    print(f"  Matches: {matched_keywords}")
-    if unmatched_keywords:
-        print(f"  Unmatched: {unmatched_keywords}")
-    
-    # Return detailed results for storage
-    evaluation_details = {
-        'matched_count': matches,
-        'total_keywords': total_possible,
-        'coverage_ratio': coverage_ratio,
-        'matched_keywords': matched_keywords,
-        'unmatched_keywords': unmatched_keywords,
-        'final_score': final_score
-    }
-    
-    return final_score, evaluation_details
+        parser = AnswerParser('descriptive')
+        parts = []
+        try:
+            async with aclosing(client.astream(chat_history, deadline=deadline, schema=schema)) as chunks:
+                async for event in aread_answer(chunks, parser, parts):
+                    yield event
+            parsed_question = descriptive_from_fields(parser.result())
+        except llm.LLMError as e:
+            logger.warning("Model call failed during generation: %s", e, extra=attempt_fields(quiz_state))
+            break
+        except MalformedOutput as e:
+            logger.info("Malformed answer, retrying without waiting for the rest: %s", e,
+                        extra=attempt_fields(quiz_state))
+            parsed_question = None
+        chat_history.append({'role': 'model', 'parts': [''.join(parts)]})
+        is_new = parsed_question and is_new_question(quiz_state, parsed_question.get('question'))
+        generation_stats.record_answer('descriptive', schema, parser,
+                                       'parsed' if is_new else 'repeat' if parsed_question else 'malformed')
+        if is_new:
+            generation_stats.record_question('descriptive', schema, True)
+            yield 'done', parsed_question
+            return
+        yield 'reset', {}
+
+    generation_stats.record_question('descriptive', schema, False)
+    yield 'failed', {}
+
+
+async def agenerate_descriptive_question(syllabus, level_name, quiz_state):
+    """Async ``generate_descriptive_question`` for the async quiz view."""
+    async for event, data in astream_descriptive_question(syllabus, level_name, quiz_state):
+        if event == 'done':
+            return data
+    return None
 
 def initialize_quiz_state(session):
-    if 'desc_quiz_state' not in session:
-        system_instruction = "You are an expert educator who creates descriptive questions and evaluation keywords based on a syllabus."
-        session['desc_quiz_state'] = {
+    quiz_state = quiz_states.load(session, 'descriptive')
+    if quiz_state is None:
+        quiz_state = quiz_states.create(session, 'descriptive', {
             "level_index": 0,
             "questions_answered_in_level": 0,
             "correct_in_level": 0,
             "max_level_reached": 0,
-            "asked_questions": [],  # Changed to simple list like MCQ
-            "asked_topics": [],     # Added to track topics
-            "final_summary": [],
             "session_id": f"desc_{random.randint(1000, 9999)}",  # Added session ID
-            "chat_history": [{'role': 'user', 'parts': [system_instruction]}, {'role': 'model', 'parts': ["Understood."]}]
-        }
-    return session['desc_quiz_state']
+            "total_answered": 0,
+            "current_question": "",
+        })
+    return quiz_state
 
 # --- Main View Logic ---
 def handle_descriptive_quiz(request):
+    response, step = begin_descriptive_quiz(request)
+    if response is not None:
+        return response
+    if step['action'] == 'complete':
+        from feedback.services import FeedbackService
+        return complete_descriptive_quiz(request, step, FeedbackService.save_quiz_feedback(**step['feedback']))
+    step['syllabus'] = get_object_or_404(Syllabus, id=step['syllabus_id'], teacher_id=step['teacher_id'])
+    if step['question'] is None:
+        step['question'] = generate_descriptive_question(
+            step['syllabus'], step['level_name'], step['quiz_state'].generation_context()
+        )
+    return show_descriptive_question(request, step)
+
+
+async def ahandle_descriptive_quiz(request):
+    """
+    Async version of ``handle_descriptive_quiz`` for ASGI: database steps run
+    through sync_to_async while the model call and the feedback save are awaited.
+    """
+    response, step = await sync_to_async(begin_descriptive_quiz)(request)
+    if response is not None:
+        return response
+    if step['action'] == 'complete':
+        from feedback.services import FeedbackService
+        feedback_record = await FeedbackService.asave_quiz_feedback(**step['feedback'])
+        return await sync_to_async(complete_descriptive_quiz)(request, step, feedback_record)
+    step['syllabus'] = await Syllabus.objects.filter(id=step['syllabus_id'], teacher_id=step['teacher_id']).afirst()
+    if step['syllabus'] is None:
+        raise Http404("No Syllabus matches the given query.")
+    if step['question'] is None:
+        if streaming_enabled(request):
+            # Show the page now and stream the question into it (descriptive_question_events)
+            return await sync_to_async(render_descriptive_quiz)(
+                request, step, stream_url=reverse('students:descriptive_quiz_stream')
+            )
+        context = await sync_to_async(step['quiz_state'].generation_context)()
+        step['question'] = await agenerate_descriptive_question(step['syllabus'], step['level_name'], context)
+    return await sync_to_async(show_descriptive_question)(request, step)
+
+
+async def descriptive_question_events(request):
+    """Server-sent events for the student's current question (see ``dynamic_question_events``)."""
+    response, step = await sync_to_async(begin_descriptive_quiz)(request)
+    if response is not None:
+        yield sse_event('redirect', {'url': response.get('Location', reverse('students:dashboard'))})
+        return
+    if step['action'] == 'complete':
+        yield sse_event('redirect', {'url': reverse('students:descriptive_quiz')})
+        return
+
+    step['syllabus'] = await Syllabus.objects.filter(id=step['syllabus_id'], teacher_id=step['teacher_id']).afirst()
+    if step['syllabus'] is None:
+        yield sse_event('redirect', {'url': reverse('students:dashboard')})
+        return
+    if step['question'] is None:
+        context = await sync_to_async(step['quiz_state'].generation_context)()
+        async for event, data in astream_descriptive_question(step['syllabus'], step['level_name'], context):
+            if event == 'done':
+                step['question'] = data
+            elif event != 'failed':
+                yield sse_event(event, data)
+        if step['question'] is None:
+            yield sse_event('failed', {
+                'message': "Failed to generate a unique question. Please start the quiz again.",
+                'url': reverse('students:dashboard'),
+            })
+            return
+
+    await sync_to_async(store_descriptive_question)(step)
+    yield sse_event('done', question_payload('descriptive', step['question']))
+
+
+def begin_descriptive_quiz(request):
+    """
+    Everything before a question is generated (see ``begin_dynamic_quiz``).
+    Returns ``(response, None)`` or ``(None, step)`` with ``step['action']``
+    'complete' or 'question'.
+    """
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path()), None
+
     teacher_id = request.session.get('quiz_teacher_id')
     syllabus_id = request.session.get('quiz_syllabus_id')
     if not (teacher_id and syllabus_id):
         messages.error(request, 'Quiz session expired. Please start again.')
-        return redirect('students:dashboard')
+        return redirect('students:dashboard'), None
 
     quiz_state = initialize_quiz_state(request.session)
     num_per_taxonomy = int(request.session.get('quiz_num_per_taxonomy', 3))
 
     if request.method == 'POST':
         student_answer = request.POST.get('student_answer', '')
-        current_question = request.session.get('current_question_data', {})
-        
-        print(f"=== PROCESSING ANSWER ===")
-        print(f"Student answer length: {len(student_answer)}")
-        print(f"Current question exists: {'question' in current_question}")
-        print(f"Level index: {quiz_state['level_index']}")
-        print(f"Questions answered in level: {quiz_state['questions_answered_in_level']}")
-        
-        match_score, matching_details = evaluate_answer_with_token_sequence(student_answer, current_question.get('keywords', []))
-        is_correct = match_score >= 70.0
+        current_question = quiz_state.current_question
+        
+        logger.debug("Processing a descriptive answer", extra=dict(
+            attempt_fields(quiz_state),
+            answer_length=len(student_answer),
+            has_question='question' in current_question,
+            level_index=quiz_state['level_index'],
+            answered_in_level=quiz_state['questions_answered_in_level'],
+        ))
+        
+        match_score, matching_details = evaluate_answer(student_answer, current_question.get('keywords', []))
+        is_correct = match_score >= PASS_SCORE
 
         if is_correct:
             quiz_state['correct_in_level'] += 1
         
         quiz_state['questions_answered_in_level'] += 1
-        quiz_state['asked_questions'].append(current_question.get('question', 'N/A'))  # Add fallback for N/A
         
         # Store detailed results for feedback system
         detailed_result = {
@@ -478,9 +528,10 @@ def handle_descriptive_quiz(request):
             'topic': current_question.get('topic', 'General')
         }
         
-        quiz_state['final_summary'].append(detailed_result)
+        quiz_state.record_answer(detailed_result)
         
-        print(f"Added result to summary. Total questions: {len(quiz_state['final_summary'])}")
+        logger.debug("Recorded a descriptive result",
+                     extra=dict(attempt_fields(quiz_state), total_answered=quiz_state['total_answered']))
 
         if quiz_state['questions_answered_in_level'] >= num_per_taxonomy:
             required_to_pass = 2
@@ -488,229 +539,134 @@ def handle_descriptive_quiz(request):
                 quiz_state['level_index'] += 1
                 if quiz_state['level_index'] > quiz_state['max_level_reached']:
                     quiz_state['max_level_reached'] = quiz_state['level_index']
-                print(f"PASSED level. Moving to level {quiz_state['level_index']}")
+                logger.info("Level passed", extra=dict(attempt_fields(quiz_state), level_index=quiz_state['level_index']))
             else:
                 quiz_state['level_index'] -= 1
-                print(f"FAILED level. Moving to level {quiz_state['level_index']}")
-                # If we go below level 0, end the quiz
-                if quiz_state['level_index'] < 0:
-                    print("Quiz ending due to failure at basic level")
+                # Below level 0 the quiz ends
+                logger.info("Level failed", extra=dict(attempt_fields(quiz_state), level_index=quiz_state['level_index']))
             
             quiz_state['correct_in_level'] = 0
             quiz_state['questions_answered_in_level'] = 0
         
-        request.session['desc_quiz_state'] = quiz_state
-        return redirect('students:descriptive_quiz')
+        quiz_state.save()
+        return redirect('students:descriptive_quiz'), None
 
     level_index = quiz_state['level_index']
-    total_questions_answered = len(quiz_state.get('final_summary', []))
+    total_questions_answered = quiz_state.get('total_answered', 0)
     max_total_questions = num_per_taxonomy * len(BLOOM_LEVELS)  # Maximum possible questions
 
     # Safety mechanism: End quiz if too many questions have been answered
     if total_questions_answered >= max_total_questions:
-        print(f"=== QUIZ ENDING: Maximum questions reached ({total_questions_answered}) ===")
+        logger.info("Quiz ending: maximum questions reached",
+                    extra=dict(attempt_fields(quiz_state), total_answered=total_questions_answered))
         level_index = len(BLOOM_LEVELS)  # Force completion
 
     if level_index < 0 or level_index >= len(BLOOM_LEVELS):
         # Quiz is complete, save feedback and redirect
-        print(f"=== QUIZ COMPLETION TRIGGERED ===")
-        print(f"level_index: {level_index}")
-        print(f"max_level_reached: {quiz_state.get('max_level_reached', 0)}")
-        print(f"final_summary length: {len(quiz_state.get('final_summary', []))}")
-        
-        from feedback.services import FeedbackService
-        
-        # Prepare data for feedback service
-        teacher_id = request.session.get('quiz_teacher_id')
-        syllabus_id = request.session.get('quiz_syllabus_id')
-        student_user = request.user
-        max_level_reached = quiz_state.get('max_level_reached', 0)
-        question_results = quiz_state.get('final_summary', [])
-        
-        print(f"teacher_id: {teacher_id}, syllabus_id: {syllabus_id}")
-        print(f"user: {student_user.username if student_user.is_authenticated else 'Anonymous'}")
-        
-        # Save feedback to database
-        feedback_record = FeedbackService.save_quiz_feedback(
-            student_user=student_user,
-            teacher_id=teacher_id,
-            syllabus_id=syllabus_id,
-            quiz_type='descriptive',
-            max_level_reached=max_level_reached,
-            question_results=question_results
-        )
-        
-        print(f"feedback_record created: {feedback_record}")
-        
-        # Clean up session
-        request.session.pop('desc_quiz_state', None)
-        request.session.pop('current_question_data', None)
-        
-        if feedback_record:
-            print(f"Redirecting to feedback page with ID: {feedback_record.id}")
-            return redirect('feedback:detailed_feedback', feedback_id=feedback_record.id)
-        else:
-            # Fallback to old template if feedback saving fails
-            print("Feedback saving failed, using fallback template")
-            reason = "Congratulations!" if level_index >= len(BLOOM_LEVELS) else "Quiz ended."
-            return render(request, 'students/quiz_complete_descriptive.html', {
-                'summary': quiz_state['final_summary'], 'reason': reason
-            })
+        logger.info("Descriptive quiz complete", extra=dict(
+            attempt_fields(quiz_state),
+            level_index=level_index,
+            max_level_reached=quiz_state.get('max_level_reached', 0),
+            total_answered=total_questions_answered,
+        ))
+        
+        # The caller saves the feedback
+        return None, {
+            'action': 'complete',
+            'quiz_state': quiz_state,
+            'level_index': level_index,
+            'feedback': {
+                'student_user': request.user,
+                'teacher_id': teacher_id,
+                'syllabus_id': syllabus_id,
+                'quiz_type': 'descriptive',
+                'max_level_reached': quiz_state.get('max_level_reached', 0),
+                'question_results': quiz_state.final_summary,
+            },
+        }
     
-    syllabus = get_object_or_404(Syllabus, id=syllabus_id, teacher_id=teacher_id)
     level_name = BLOOM_LEVELS[level_index]
     
-    descriptive_question = None
-    for i in range(3):  # Retry up to 3 times
-        print(f"Attempt {i+1} to generate a unique descriptive question for level '{level_name}'...")
-        
-        instruction = LEVEL_INSTRUCTIONS_DESCRIPTIVE[level_name]
-        
-        # Add randomness and variety to prevent same questions
-        variety_prompts = [
-            "Focus on a different concept or module from the syllabus.",
-            "Choose a topic that hasn't been covered in previous questions.",
-            "Explore a practical application or real-world scenario.",
-            "Create a question about advanced concepts in the syllabus.",
-            "Focus on fundamental principles and theory.",
-            "Generate a question about implementation details."
-        ]
-        
-        random_variety = random.choice(variety_prompts)
-        random_seed = random.randint(1000, 9999)
-        
-        # Get topics already covered to ensure variety
-        covered_topics = quiz_state.get('asked_topics', [])
-        topic_instruction = f"AVOID these already covered topics: {', '.join(covered_topics)}" if covered_topics else "Cover any relevant topic from the syllabus."
-        
-        prompt = f"""
-        Session: {quiz_state.get('session_id', 'default')} | Seed: {random_seed}
-        
-        BLOOM'S TAXONOMY LEVEL: {level_name.upper()}
-        LEVEL DEFINITION: 
-        - Remember: Recalling facts and basic concepts
-        - Understand: Explaining ideas or concepts  
-        - Apply: Using information in a new situation
-        - Analyze: Breaking down information into parts
-        - Evaluate: Justifying a stand or decision
-        - Create: Producing new or original work
-        
-        CURRENT LEVEL FOCUS: You must create a {level_name.upper()} level question ONLY.
-        
-        Here is the entire course syllabus:
-        ---
-        {syllabus.content}
-        ---
-        
-        Your task: {instruction}
-        
-        DIVERSITY REQUIREMENT: {random_variety}
-        TOPIC VARIETY: {topic_instruction}
-        
-        CRITICAL RULE: Do NOT repeat any of the following questions:
-        ---
-        {', '.join(quiz_state['asked_questions'])}
-        ---
-        
-        STRICT LEVEL REQUIREMENTS FOR {level_name.upper()}:
-        """ + ("REMEMBER LEVEL: Ask ONLY for basic definitions, facts, or simple recall. NO scenarios, applications, or explanations required." if level_name == "remember" else 
-               "UNDERSTAND LEVEL: Ask for explanations or descriptions of how something works. NO complex applications." if level_name == "understand" else
-               "APPLY LEVEL: Present a specific scenario and ask how to use a concept to solve it." if level_name == "apply" else
-               "ANALYZE LEVEL: Ask to compare, contrast, or break down concepts into parts." if level_name == "analyze" else
-               "EVALUATE LEVEL: Ask for judgment or assessment with justification." if level_name == "evaluate" else
-               "CREATE LEVEL: Ask to design, propose, or create something new.") + f"""
-        
-        GOOD EXAMPLES for {level_name.upper()} level:
-        """ + (
-            "- 'What is a Python function?'\n        - 'Define what a module is in Python'\n        - 'What are the basic data types in Python?'" if level_name == "remember" else
-            "- 'Explain how Python functions work'\n        - 'Describe the difference between lists and tuples'" if level_name == "understand" else  
-            "- 'You need to store student grades - which data structure would you use and how?'\n        - 'How would you use a function to calculate the average of a list?'" if level_name == "apply" else
-            "- 'Compare the advantages of lists vs dictionaries'\n        - 'Analyze when to use functions vs classes'" if level_name == "analyze" else
-            "- 'Evaluate which loop type is better for this scenario and justify'\n        - 'Assess the best approach for error handling in this case'" if level_name == "evaluate" else
-            "- 'Design a program structure for a calculator'\n        - 'Create a plan for organizing code into modules'"
-        ) + f"""
-        
-        BAD EXAMPLES for {level_name.upper()} level (AVOID):
-        """ + (
-            "- Questions asking for explanations, scenarios, or applications\n        - Questions with 'explain', 'describe', 'how would you'\n        - Complex multi-part questions" if level_name == "remember" else
-            "- Simple definition questions\n        - Questions asking for application or problem-solving\n        - Questions requiring analysis or evaluation" if level_name == "understand" else
-            "- Simple definition or explanation questions\n        - Questions without specific scenarios\n        - Questions asking for analysis or evaluation" if level_name == "apply" else
-            "- Simple recall or explanation questions\n        - Questions without comparison or breakdown requirements\n        - Questions asking for application only" if level_name == "analyze" else
-            "- Questions without judgment or assessment requirements\n        - Simple application or analysis questions\n        - Questions without justification requirements" if level_name == "evaluate" else
-            "- Questions asking for analysis, application, or explanation only\n        - Questions without creative or design requirements"
-        ) + f"""
-        
-        IMPORTANT GUIDELINES FOR KEYWORDS:
-        1. Choose UNIQUE, specific keywords (no duplicates in the list)
-        2. Focus on technical terms, concepts, and key processes
-        3. Avoid common words like 'and', 'or', 'the', 'is', 'are', 'can', 'will'
-        4. Keywords should be nouns, verbs, or adjectives that are central to the topic
-        5. Order keywords logically as they would appear in a good answer
-        6. Each keyword should add distinct value to the evaluation
-        
-        IMPORTANT GUIDELINES FOR QUESTIONS:
-        1. Choose a DIFFERENT topic/concept from previous questions
-        2. Ensure the question is unique and not similar to previous ones
-        3. Make the question clear and specific
-        4. MUST match the {level_name.upper()} level requirements exactly
-        5. Focus on one main concept or process
-        
-        Format your response STRICTLY as follows:
-        Topic: [Name of the Module/Topic you chose - make it DIFFERENT from previous topics]
-        Question: [The {level_name} level question text - must match level requirements]
-        Keywords: [keyword1, keyword2, keyword3, keyword4]
-        
-        VERIFY: Before finalizing, check that your question truly matches {level_name.upper()} level requirements!
-        """
-        
-        chat_history = quiz_state['chat_history']
-        
-        # Clear chat history periodically to prevent AI from getting stuck in patterns
-        if len(chat_history) > 10:  # Keep only recent context
-            system_msg = chat_history[0:2]  # Keep system instruction
-            recent_context = chat_history[-4:]  # Keep last 2 exchanges
-            chat_history = system_msg + recent_context
-            quiz_state['chat_history'] = chat_history
-        
-        chat_history.append({'role': 'user', 'parts': [prompt]})
-        
-        try:
-            response = MODEL.generate_content(chat_history)
-            chat_history.append({'role': 'model', 'parts': [response.text]})
-            parsed_question = parse_descriptive_response(response.text)
-            if parsed_question and parsed_question.get('question') not in quiz_state['asked_questions']:
-                descriptive_question = parsed_question
-                # Track the topic to ensure variety in future questions
-                if 'asked_topics' not in quiz_state:
-                    quiz_state['asked_topics'] = []
-                quiz_state['asked_topics'].append(parsed_question.get('topic', 'General'))
-                break
-        except Exception as e:
-            print(f"API Error: {e}")
-            continue
-
-    quiz_state['chat_history'] = chat_history
+    # Use the candidate prefetched while the previous question was on screen, if any
+    descriptive_question = prefetch.take('descriptive', quiz_state.attempt_id, level_name, quiz_state)
+    return None, {
+        'action': 'question',
+        'quiz_state': quiz_state,
+        'teacher_id': teacher_id,
+        'syllabus_id': syllabus_id,
+        'syllabus': None,
+        'level_name': level_name,
+        'num_per_taxonomy': num_per_taxonomy,
+        'question': descriptive_question,
+    }
+
+
+def complete_descriptive_quiz(request, step, feedback_record):
+    """Clean up a finished attempt and show its feedback."""
+    # Clean up the attempt
+    quiz_state = step['quiz_state']
+    prefetch.discard('descriptive', quiz_state.attempt_id)
+    quiz_states.discard(request.session, 'descriptive')
+    
+    if feedback_record:
+        return redirect('feedback:detailed_feedback', feedback_id=feedback_record.id)
+    else:
+        # Fallback to old template if feedback saving fails
+        logger.warning("Feedback could not be saved; showing the fallback summary", extra=attempt_fields(quiz_state))
+        reason = "Congratulations!" if step['level_index'] >= len(BLOOM_LEVELS) else "Quiz ended."
+        return render(request, 'students/quiz_complete_descriptive.html', {
+            'summary': step['feedback']['question_results'], 'reason': reason
+        })
+
+
+def show_descriptive_question(request, step):
+    """Store the question in the attempt and render it."""
+    quiz_state = step['quiz_state']
+    level_name = step['level_name']
+    descriptive_question = step['question']
 
     if not descriptive_question:
-        print("=== FAILED TO GENERATE QUESTION ===")
-        print(f"Attempts made, level: {level_name}")
-        print(f"Already asked: {quiz_state['asked_questions']}")
+        logger.warning("Failed to generate a descriptive question", extra=dict(attempt_fields(quiz_state), bloom_level=level_name))
         messages.error(request, "Failed to generate a unique question. Please try again.")
-        request.session.pop('desc_quiz_state', None)
+        quiz_states.discard(request.session, 'descriptive')
         return redirect('students:dashboard')
 
-    print(f"=== QUESTION GENERATED SUCCESSFULLY ===")
-    print(f"Question: {descriptive_question.get('question', 'N/A')[:100]}...")
-    print(f"Keywords: {descriptive_question.get('keywords', [])}")
-    print(f"Topic: {descriptive_question.get('topic', 'N/A')}")
+    logger.debug("Descriptive question ready", extra=dict(
+        attempt_fields(quiz_state),
+        question=descriptive_question.get('question', '')[:100],
+        keywords=descriptive_question.get('keywords', []),
+        topic=descriptive_question.get('topic', ''),
+    ))
 
-    request.session['current_question_data'] = descriptive_question
-    request.session['desc_quiz_state'] = quiz_state
-    
+    store_descriptive_question(step)
+    return render_descriptive_quiz(request, step)
+
+
+def store_descriptive_question(step):
+    """Make ``step['question']`` the attempt's current question and start prefetching the next one."""
+    quiz_state = step['quiz_state']
+    descriptive_question = step['question']
+    level_name = step['level_name']
+
+    # Track the topic to ensure variety in future questions
+    quiz_state.record_topic(descriptive_question.get('topic', 'General'))
+    quiz_state.set_current_question(descriptive_question, level_name)
+    quiz_state.save()
+
+    # Generate candidates for the next question while the student writes this answer
+    prefetch.prefetch_next('descriptive', quiz_state.attempt_id, generate_descriptive_question, step['syllabus'],
+                           quiz_state, descriptive_question, step['num_per_taxonomy'])
+
+
+def render_descriptive_quiz(request, step, stream_url=None):
+    """The question page; with ``stream_url`` it is rendered empty and filled in from the event stream."""
+    quiz_state = step['quiz_state']
+    descriptive_question = None if stream_url else step['question']
     return render(request, 'students/descriptive_quiz.html', {
         'question_data': descriptive_question,
-        'level_name': level_name.capitalize(),
+        'stream_url': stream_url,
+        'level_name': step['level_name'].capitalize(),
         'current_q_num': quiz_state['questions_answered_in_level'] + 1,
-        'total_q_in_level': num_per_taxonomy,
-        'topic': descriptive_question.get('topic', 'General')
+        'total_q_in_level': step['num_per_taxonomy'],
+        'topic': descriptive_question.get('topic', 'General') if descriptive_question else ''
     })
@@ -1,18 +1,35 @@
 # In students/views/dynamic_quiz_logic.py
 
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404
+from django.urls import reverse
 from teachers.models import Syllabus
-import google.generativeai as genai
-from django.conf import settings
-import re
+from teachers.syllabus_context import render_prompt_context, arender_prompt_context, content_hash
+from students.question_pool import QuestionPool
+from students import prefetch
+from students.prompts import PromptTemplate, estimate_tokens, fit_history, topic_instruction
+from students import question_batch
+from students import quiz_state as quiz_states
+from students.similarity import is_new_question, question_index
+from students.streaming import (
+    BATCH_SEPARATOR, AnswerParser, MalformedOutput, aread_answer, batch_schema, generation_stats, output_schema,
+    parse_answer, parse_batch, question_payload, read_answer, sse_event, streaming_enabled,
+)
+from bloomify import llm, metrics
+from bloomify.log import attempt_fields
+import functools
+import logging
 import random
 import hashlib
+from contextlib import aclosing, closing
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 # --- Configuration ---
-genai.configure(api_key=settings.API_KEY)
-MODEL = genai.GenerativeModel('gemini-2.5-flash')
 BLOOM_LEVELS = ['remember', 'understand', 'apply', 'analyze', 'evaluate', 'create']
 
 # --- Level-Specific Instructions for Better Question Quality ---
@@ -44,110 +61,493 @@ LEVEL_INSTRUCTIONS = {
 }
 
 
-# --- NEW, MORE ROBUST HELPER FUNCTION ---
+def mcq_from_fields(fields):
+    """The quiz's MCQ dict from the fields of a parsed answer."""
+    options = fields['options']
+    return {
+        "question": fields['question'],
+        "options": options,
+        "correct_answer": options['ABCD'.index(fields['correct'])],
+        "topic": fields['topic'] or "General"
+    }
+
+
 def parse_question_from_response(response_text):
     """
-    A more robust, line-by-line parser for the model's response.
-    It correctly handles multi-line code snippets in options.
+    Parses a whole model answer with the incremental parser (students.streaming),
+    keeping multi-line code snippets in options. Returns the MCQ or None.
+    """
+    try:
+        with metrics.timed(metrics.PARSE_SECONDS, 'mcq'):
+            fields = parse_answer('mcq', response_text)
+        return mcq_from_fields(fields)
+    except MalformedOutput as e:
+        # The whole answer is only logged for the sampled debug events
+        logger.warning("MCQ answer could not be parsed: %s", e)
+        logger.debug("Unparsed MCQ answer", extra={'response': response_text})
+        return None
+
+VARIETY_PROMPTS = [
+    "Focus on a different concept or module from the syllabus.",
+    "Choose a topic that hasn't been covered in previous questions.",
+    "Explore a practical application or real-world scenario.",
+    "Create a question about advanced concepts in the syllabus.",
+    "Focus on fundamental principles and theory.",
+    "Generate a question about implementation details."
+]
+
+
+@functools.lru_cache(maxsize=None)
+def mcq_template(level_name, json_output=False, count=1):
+    """
+    The compiled MCQ prompt for ``level_name`` (see students.prompts); ``json_output``
+    asks for MCQ_SCHEMA JSON. With ``count`` above 1 it asks for a batch of that
+    many questions (see students.streaming.parse_batch).
     """
-    lines = response_text.strip().split('\n')
+    level_instruction = LEVEL_INSTRUCTIONS[level_name]
+    if count > 1 and json_output:
+        output_format = f"""Respond with a JSON object only: {{"questions": [...]}} holding exactly {count} questions, each on a DIFFERENT topic or concept. {level_instruction['format']} Each question has:
+    topic: Name of the Module/Topic it covers
+    question: The question text
+    options: Exactly four options - keep them of similar length
+    correct_index: Index (0-3) of the correct option - vary it between questions"""
+    elif count > 1:
+        output_format = f"""Write exactly {count} questions, each on a DIFFERENT topic or concept, separated by a line containing only {BATCH_SEPARATOR}. {level_instruction['format']} Format each question STRICTLY as follows:
+    Topic: [Name of the Module/Topic it covers]
+    Question: [The question text]
+    A) [Option A - keep similar length to other options]
+    B) [Option B - keep similar length to other options]
+    C) [Option C - keep similar length to other options]
+    D) [Option D - keep similar length to other options]
+    Correct: [The correct letter - vary it between questions]"""
+    elif json_output:
+        output_format = f"""Respond with a JSON object only. {level_instruction['format']}
+    topic: Name of the Module/Topic you chose - make it DIFFERENT from previous topics
+    question: The question text - ensure it's UNIQUE and DIFFERENT
+    options: Exactly four options - keep them of similar length
+    correct_index: Index (0-3) of the correct option - RANDOMIZE this, don't always use 0"""
+    else:
+        output_format = f"""Format your response STRICTLY as follows. {level_instruction['format']}
+    Topic: [Name of the Module/Topic you chose - make it DIFFERENT from previous topics]
+    Question: [The question text - ensure it's UNIQUE and DIFFERENT]
+    A) [Option A - keep similar length to other options]
+    B) [Option B - keep similar length to other options]
+    C) [Option C - keep similar length to other options] 
+    D) [Option D - keep similar length to other options]
+    Correct: [The correct letter - RANDOMIZE this, don't always use A]"""
     
-    question, topic, correct_letter = "", "", ""
-    options = {}
-    current_option_key = None
-    buffer = []
-
-    for line in lines:
-        stripped_line = line.strip()
-        if not stripped_line:
-            continue
-
-        if stripped_line.lower().startswith("question:"):
-            question = stripped_line[len("question:"):].strip()
-        elif stripped_line.lower().startswith("topic:"):
-            topic = stripped_line[len("topic:"):].strip()
-        elif stripped_line.lower().startswith("correct:"):
-            if current_option_key:  # Save the last option buffer before processing 'Correct:'
-                options[current_option_key] = "\n".join(buffer).strip()
-            correct_letter = stripped_line[len("correct:"):].strip().upper()
-            current_option_key = None  # Stop capturing
-        elif re.match(r'^[A-D]\)', stripped_line, re.IGNORECASE):
-            if current_option_key:  # A new option is starting, so save the previous one
-                options[current_option_key] = "\n".join(buffer).strip()
-            
-            current_option_key = stripped_line[0].upper()
-            buffer = [stripped_line[2:].strip()]  # Start a new buffer for the new option
-        elif current_option_key:  # If we are in the middle of capturing an option
-            buffer.append(line) # Append the raw line to preserve indentation
-
-    # Final check and format
-    if question and len(options) == 4 and correct_letter in options:
-        # Ensure options are always in A, B, C, D order
-        ordered_options = [options.get('A', ''), options.get('B', ''), options.get('C', ''), options.get('D', '')]
-        return {
-            "question": question,
-            "options": ordered_options,
-            "correct_answer": options[correct_letter],
-            "topic": topic or "General"
-        }
+    return PromptTemplate(f"""
+    Session: {{session_id}} | Seed: {{seed}}
+    
+    {{syllabus_context}}
+    
+    Your task: {level_instruction['desc']}
+    
+    DIVERSITY REQUIREMENT: {{variety}}
+    TOPIC VARIETY: {{topic_instruction}}
     
-    # If parsing fails, print the problematic response for debugging
-    print("--- PARSING FAILED ---")
-    print("Could not parse the following response from the AI:")
-    print(response_text)
-    print("----------------------")
+    IMPORTANT GUIDELINES:
+    1. Randomize the correct answer position - do NOT always make A the correct answer
+    2. Keep all options roughly the same length - avoid making the correct answer obviously longer
+    3. Make all distractors plausible and related to the topic
+    4. The correct answer should be randomly positioned (A, B, C, or D)
+    5. Choose a DIFFERENT topic/concept from previous questions
+    6. Ensure the question is unique and not similar to previous ones
+    
+    {output_format}
+    """)
+
+
+def build_mcq_prompt(syllabus_context, level_name, quiz_state, json_output=False, count=1):
+    """The generation prompt for one attempt at an MCQ at ``level_name`` (see ``mcq_template``)."""
+    return mcq_template(level_name, json_output, count).render(
+        session_id=quiz_state.get('session_id', 'default'),
+        syllabus_context=syllabus_context,
+        # Add randomness and variety to prevent same questions
+        variety=random.choice(VARIETY_PROMPTS),
+        seed=random.randint(1000, 9999),
+        # Only the most recent covered topics, so the prompt doesn't grow with the attempt
+        topic_instruction=topic_instruction(quiz_state.get('asked_topics', [])),
+    )
+
+
+def generate_mcq(syllabus, level_name, quiz_state, use_cache=True):
+    """
+    Asks the model for one new question at ``level_name``, retrying up to 3 times.
+    ``quiz_state`` is a generation context (see QuizState.generation_context);
+    its ``chat_history`` is updated. Returns the parsed MCQ or None.
+
+    With ``use_cache`` the first attempt may reuse an answer to an equivalent
+    prompt (same syllabus, level and covered topics) from the response cache.
+    """
+    client = llm.get_client()
+    deadline = client.new_deadline()  # Shared by all attempts for this question
+    responses = llm.get_response_cache()
+    cache_key = llm.response_cache_key('mcq', content_hash(syllabus.content), level_name, quiz_state.get('asked_topics', []))
+    schema = output_schema('mcq')
+    mcq = None
+    for i in range(3): # Retry up to 3 times (parse failures and repeats)
+        logger.debug("Generating a question", extra=dict(attempt_fields(quiz_state), bloom_level=level_name, try_number=i + 1))
+        
+        # Topic outline plus one uncovered section instead of the whole syllabus
+        syllabus_context = render_prompt_context(syllabus, quiz_state.get('asked_topics', []))
+        prompt = build_mcq_prompt(syllabus_context, level_name, quiz_state, json_output=bool(schema))
+        
+        chat_history = fit_history(quiz_state, estimate_tokens(prompt))
+        chat_history.append({'role': 'user', 'parts': [prompt]})
+        
+        response_text = None
+        if use_cache and i == 0:
+            response_text = responses.lookup(cache_key, exclude=quiz_state['asked_questions'],
+                                             accept=lambda label: is_new_question(quiz_state, label))
+        from_cache = response_text is not None
+        if from_cache:
+            parsed_mcq = parse_question_from_response(response_text)
+        else:
+            # Read the answer as it streams; a malformed one is dropped at once
+            parser = AnswerParser('mcq')
+            parts = []
+            try:
+                with closing(client.stream(chat_history, deadline=deadline, schema=schema)) as chunks:
+                    read_answer(chunks, parser, parts)
+                parsed_mcq = mcq_from_fields(parser.result())
+            except llm.LLMError as e:
+                # Transient errors were already retried by the client; stop here
+                logger.warning("Model call failed during generation: %s", e, extra=attempt_fields(quiz_state))
+                break
+            except MalformedOutput as e:
+                logger.info("Malformed answer, retrying without waiting for the rest: %s", e,
+                            extra=attempt_fields(quiz_state))
+                parsed_mcq = None
+            response_text = ''.join(parts)
+        chat_history.append({'role': 'model', 'parts': [response_text]})
+
+        is_new = parsed_mcq and is_new_question(quiz_state, parsed_mcq.get('question'))
+        if not from_cache:
+            generation_stats.record_answer('mcq', schema, parser, 'parsed' if is_new else 'repeat' if parsed_mcq else 'malformed')
+        if is_new:
+            if not from_cache:
+                responses.store(cache_key, response_text, parsed_mcq['question'])
+            mcq = parsed_mcq
+            break
+
+    generation_stats.record_question('mcq', schema, mcq is not None)
+    return mcq
+
+
+async def astream_mcq(syllabus, level_name, quiz_state, use_cache=True):
+    """
+    Streaming ``generate_mcq``: an async generator of (event, data) pairs for the
+    browser while the model writes its answer (see students.streaming). A retry
+    yields ('reset', {}); the last pair is ('done', mcq) or ('failed', {}).
+    """
+    client = llm.get_client()
+    deadline = client.new_deadline()
+    responses = llm.get_response_cache()
+    cache_key = llm.response_cache_key('mcq', content_hash(syllabus.content), level_name, quiz_state.get('asked_topics', []))
+    schema = output_schema('mcq')
+    for i in range(3):
+        syllabus_context = await arender_prompt_context(syllabus, quiz_state.get('asked_topics', []))
+        prompt = build_mcq_prompt(syllabus_context, level_name, quiz_state, json_output=bool(schema))
+        
+        chat_history = fit_history(quiz_state, estimate_tokens(prompt))
+        chat_history.append({'role': 'user', 'parts': [prompt]})
+        
+        parser = AnswerParser('mcq')
+        response_text = None
+        if use_cache and i == 0:
+            response_text = responses.lookup(cache_key, exclude=quiz_state['asked_questions'],
+                                             accept=lambda label: is_new_question(quiz_state, label))
+        from_cache = response_text is not None
+        parts = [response_text] if from_cache else []
+        try:
+            if from_cache:
+                for event in parser.feed(response_text) + parser.close():
+                    yield event
+            else:
+                async with aclosing(client.astream(chat_history, deadline=deadline, schema=schema)) as chunks:
+                    async for event in aread_answer(chunks, parser, parts):
+                        yield event
+            parsed_mcq = mcq_from_fields(parser.result())
+        except llm.LLMError as e:
+            logger.warning("Model call failed during generation: %s", e, extra=attempt_fields(quiz_state))
+            break
+        except MalformedOutput as e:
+            logger.info("Malformed answer, retrying without waiting for the rest: %s", e,
+                        extra=attempt_fields(quiz_state))
+            parsed_mcq = None
+        response_text = ''.join(parts)
+        chat_history.append({'role': 'model', 'parts': [response_text]})
+
+        is_new = parsed_mcq and is_new_question(quiz_state, parsed_mcq.get('question'))
+        if not from_cache:
+            generation_stats.record_answer('mcq', schema, parser, 'parsed' if is_new else 'repeat' if parsed_mcq else 'malformed')
+        if is_new:
+            if not from_cache:
+                responses.store(cache_key, response_text, parsed_mcq['question'])
+            generation_stats.record_question('mcq', schema, True)
+            yield 'done', parsed_mcq
+            return
+        yield 'reset', {}
+
+    generation_stats.record_question('mcq', schema, False)
+    yield 'failed', {}
+
+
+async def agenerate_mcq(syllabus, level_name, quiz_state, use_cache=True):
+    """Async ``generate_mcq`` for the async quiz view: awaits the model instead of blocking a thread."""
+    async for event, data in astream_mcq(syllabus, level_name, quiz_state, use_cache):
+        if event == 'done':
+            return data
     return None
 
-def initialize_quiz_state(session):
-    """Initializes or validates the quiz state in the user's session."""
-    quiz_state = session.get('quiz_state', {})
-    required_keys = ["level_index", "questions_answered_in_level", "asked_questions", "chat_history"]
 
-    if not all(key in quiz_state for key in required_keys):
+def accept_mcq_batch(response_text, quiz_state, schema):
+    """
+    The usable questions of a batch answer, in order: those that parse and are
+    not near duplicates of an asked question or of each other. They are added
+    to the context's question index. Records the batch in generation_stats.
+    """
+    try:
+        batch, dropped, output_format = parse_batch('mcq', response_text)
+    except MalformedOutput as e:
+        logger.info("Malformed batch, retrying: %s", e, extra=attempt_fields(quiz_state))
+        generation_stats.record_batch('mcq', schema, None, None, 0)
+        return []
+    index = question_index(quiz_state)
+    mcqs = []
+    for fields in batch:
+        mcq = mcq_from_fields(fields)
+        if is_new_question(quiz_state, mcq['question']):
+            index.add(mcq['question'])
+            mcqs.append(mcq)
+        else:
+            dropped += 1
+    generation_stats.record_batch('mcq', schema, output_format, len(mcqs), dropped)
+    return mcqs
+
+
+def generate_mcq_batch(syllabus, level_name, quiz_state, count):
+    """
+    Asks the model for ``count`` new questions at ``level_name`` in one call
+    (see students.question_batch), retrying up to 3 times while none of them
+    is usable. Returns the MCQs, possibly fewer than ``count``, or [].
+    """
+    client = llm.get_client()
+    deadline = client.new_deadline()
+    schema = batch_schema('mcq')
+    for i in range(3):
+        logger.debug("Generating a batch", extra=dict(attempt_fields(quiz_state), bloom_level=level_name, count=count, try_number=i + 1))
+        syllabus_context = render_prompt_context(syllabus, quiz_state.get('asked_topics', []))
+        prompt = build_mcq_prompt(syllabus_context, level_name, quiz_state, json_output=bool(schema), count=count)
+
+        chat_history = fit_history(quiz_state, estimate_tokens(prompt))
+        chat_history.append({'role': 'user', 'parts': [prompt]})
+        try:
+            response_text = client.generate(chat_history, deadline=deadline, schema=schema)
+        except llm.LLMError as e:
+            logger.warning("Model call failed during generation: %s", e, extra=attempt_fields(quiz_state))
+            break
+        chat_history.append({'role': 'model', 'parts': [response_text]})
+
+        mcqs = accept_mcq_batch(response_text, quiz_state, schema)
+        if mcqs:
+            return mcqs
+    generation_stats.record_question('mcq', schema, False)
+    return []
+
+
+async def agenerate_mcq_batch(syllabus, level_name, quiz_state, count):
+    """Async ``generate_mcq_batch``."""
+    client = llm.get_client()
+    deadline = client.new_deadline()
+    schema = batch_schema('mcq')
+    for i in range(3):
+        syllabus_context = await arender_prompt_context(syllabus, quiz_state.get('asked_topics', []))
+        prompt = build_mcq_prompt(syllabus_context, level_name, quiz_state, json_output=bool(schema), count=count)
+
+        chat_history = fit_history(quiz_state, estimate_tokens(prompt))
+        chat_history.append({'role': 'user', 'parts': [prompt]})
+        try:
+            response_text = await client.agenerate(chat_history, deadline=deadline, schema=schema)
+        except llm.LLMError as e:
+            logger.warning("Model call failed during generation: %s", e, extra=attempt_fields(quiz_state))
+            break
+        chat_history.append({'role': 'model', 'parts': [response_text]})
+
+        mcqs = accept_mcq_batch(response_text, quiz_state, schema)
+        if mcqs:
+            return mcqs
+    generation_stats.record_question('mcq', schema, False)
+    return []
+
+
+def use_batch(step, mcqs):
+    """Show the first question of a batch; the rest are queued for the level when it is stored."""
+    step['mcq'] = mcqs[0] if mcqs else None
+    step['queued'] = mcqs[1:]
+
+
+def generate_pool_question(syllabus_id, level_name, existing_questions):
+    """
+    Generates a question for the shared pool. Uses a fresh, student-independent
+    conversation and treats the questions already in the bucket as asked.
+    """
+    syllabus = Syllabus.objects.get(id=syllabus_id)
+    pool_state = {
+        'session_id': f"pool_{syllabus_id}_{level_name}",
+        'asked_questions': list(existing_questions),
+        'asked_topics': [],
+        'chat_history': [
+            {'role': 'user', 'parts': ["You are an expert educator and assessment designer. Create diverse, varied questions covering different topics and concepts from the given syllabus."]},
+            {'role': 'model', 'parts': ["Understood. I will create diverse questions covering different topics and concepts, avoiding repetitive patterns."]}
+        ],
+    }
+    # Pool questions must be new, so the response cache is bypassed
+    return generate_mcq(syllabus, level_name, pool_state, use_cache=False)
+
+
+def initialize_quiz_state(session):
+    """Loads the student's quiz attempt, or starts a new one."""
+    quiz_state = quiz_states.load(session, 'mcq')
+    if quiz_state is None:
         # Create a unique session identifier for more randomness
         session_id = hashlib.md5(f"{datetime.now().isoformat()}{random.randint(1000, 9999)}".encode()).hexdigest()[:8]
-        
-        system_instruction = f"You are an expert educator and assessment designer with session ID {session_id}. Create diverse, varied questions covering different topics and concepts from the given syllabus. Avoid repetitive patterns and ensure each question explores different aspects of the material."
-        quiz_state = {
+        quiz_state = quiz_states.create(session, 'mcq', {
             "level_index": 0,
             "questions_answered_in_level": 0,
             "correct_in_level": 0,
             "max_level_reached": 0,
             "consecutive_failures": 0,  # Track consecutive level failures
             "session_id": session_id,  # Add unique session identifier
-            "asked_questions": [],
-            "asked_topics": [],  # Track topics to ensure variety
-            "final_summary": [],
-            "chat_history": [
-                {'role': 'user', 'parts': [system_instruction]},
-                {'role': 'model', 'parts': ["Understood. I will create diverse questions covering different topics and concepts, avoiding repetitive patterns."]}
-            ]
-        }
-        session['quiz_state'] = quiz_state
+            "total_answered": 0,
+            "current_question": "",
+        })
     return quiz_state
 
 
 def handle_dynamic_quiz(request):
     """Handles the dynamic quiz flow with intelligent, level-aware prompting."""
+    response, step = begin_dynamic_quiz(request)
+    if response is not None:
+        return response
+    if step['action'] == 'complete':
+        from feedback.services import FeedbackService
+        return complete_dynamic_quiz(request, step, FeedbackService.save_quiz_feedback(**step['feedback']))
+    if step['mcq'] is None:
+        syllabus = get_object_or_404(Syllabus, id=step['syllabus_id'], teacher_id=step['teacher_id'])
+        step['syllabus'] = syllabus
+        context = step['quiz_state'].generation_context()
+        if question_batch.is_enabled():
+            use_batch(step, generate_mcq_batch(syllabus, step['level_name'], context, step['batch_size']))
+        else:
+            step['mcq'] = generate_mcq(syllabus, step['level_name'], context)
+    return show_dynamic_question(request, step)
+
+
+async def ahandle_dynamic_quiz(request):
+    """
+    Async version of ``handle_dynamic_quiz`` for ASGI. The short database steps
+    run through sync_to_async; the model call and the feedback save are awaited,
+    so a student waiting on generation does not hold a worker thread.
+    """
+    response, step = await sync_to_async(begin_dynamic_quiz)(request)
+    if response is not None:
+        return response
+    if step['action'] == 'complete':
+        from feedback.services import FeedbackService
+        feedback_record = await FeedbackService.asave_quiz_feedback(**step['feedback'])
+        return await sync_to_async(complete_dynamic_quiz)(request, step, feedback_record)
+    if step['mcq'] is None:
+        if streaming_enabled(request):
+            # Show the page now and stream the question into it (dynamic_question_events)
+            return await sync_to_async(render_dynamic_quiz)(request, step, stream_url=reverse('students:dynamic_quiz_stream'))
+        syllabus = await Syllabus.objects.filter(id=step['syllabus_id'], teacher_id=step['teacher_id']).afirst()
+        if syllabus is None:
+            raise Http404("No Syllabus matches the given query.")
+        step['syllabus'] = syllabus
+        context = await sync_to_async(step['quiz_state'].generation_context)()
+        if question_batch.is_enabled():
+            use_batch(step, await agenerate_mcq_batch(syllabus, step['level_name'], context, step['batch_size']))
+        else:
+            step['mcq'] = await agenerate_mcq(syllabus, step['level_name'], context)
+    return await sync_to_async(show_dynamic_question)(request, step)
+
+
+async def dynamic_question_events(request):
+    """
+    Server-sent events for the student's current question. Sends the question
+    at once when one was prefetched or pooled; otherwise streams the model's
+    answer as it is generated, then stores the question in the attempt and
+    sends it as 'done'. Anything else (quiz over, session expired) becomes a
+    'redirect' back to the quiz page or wherever the flow sends the student.
+    """
+    response, step = await sync_to_async(begin_dynamic_quiz)(request)
+    if response is not None:
+        yield sse_event('redirect', {'url': response.get('Location', reverse('students:dashboard'))})
+        return
+    if step['action'] == 'complete':
+        yield sse_event('redirect', {'url': reverse('students:dynamic_quiz')})
+        return
+
+    if step['mcq'] is None:
+        syllabus = await Syllabus.objects.filter(id=step['syllabus_id'], teacher_id=step['teacher_id']).afirst()
+        if syllabus is None:
+            yield sse_event('redirect', {'url': reverse('students:dashboard')})
+            return
+        step['syllabus'] = syllabus
+        context = await sync_to_async(step['quiz_state'].generation_context)()
+        if question_batch.is_enabled():
+            # A batch is read whole; the page gets the first question once it is in
+            use_batch(step, await agenerate_mcq_batch(syllabus, step['level_name'], context, step['batch_size']))
+        else:
+            async for event, data in astream_mcq(syllabus, step['level_name'], context):
+                if event == 'done':
+                    step['mcq'] = data
+                elif event != 'failed':
+                    yield sse_event(event, data)
+        if step['mcq'] is None:
+            yield sse_event('failed', {
+                'message': "Failed to generate a unique question. Please start the quiz again.",
+                'url': reverse('students:dashboard'),
+            })
+            return
+
+    await sync_to_async(store_dynamic_question)(step)
+    yield sse_event('done', question_payload('mcq', step['mcq']))
+
+
+def begin_dynamic_quiz(request):
+    """
+    Everything before a question is generated: records a POSTed answer, detects
+    the end of the quiz and looks for a prefetched or pooled question.
+
+    Returns ``(response, None)`` when the request is already answered, otherwise
+    ``(None, step)`` where ``step['action']`` is 'complete' (save the feedback,
+    then ``complete_dynamic_quiz``) or 'question' (generate the question if
+    ``step['mcq']`` is None, then ``show_dynamic_question``).
+    """
+    if not request.user.is_authenticated:
+        return redirect_to_login(request.get_full_path()), None
+
     teacher_id = request.session.get('quiz_teacher_id')
     syllabus_id = request.session.get('quiz_syllabus_id')
     if not (teacher_id and syllabus_id):
         messages.error(request, 'Quiz session expired. Please start again.')
-        return redirect('students:dashboard')
+        return redirect('students:dashboard'), None
 
     quiz_state = initialize_quiz_state(request.session)
     num_per_taxonomy = int(request.session.get('quiz_num_per_taxonomy', 3))
 
     if request.method == 'POST':
         user_answer = request.POST.get('answer')
-        current_question = request.session.get('current_question_data', {})
+        current_question = quiz_state.current_question
         
         is_correct = (user_answer.strip() == current_question.get('correct_answer').strip())
         if is_correct:
             quiz_state['correct_in_level'] += 1
         
         quiz_state['questions_answered_in_level'] += 1
-        quiz_state['asked_questions'].append(current_question.get('question'))
         
         # Store detailed results for feedback system
         detailed_result = {
@@ -167,7 +567,7 @@ def handle_dynamic_quiz(request):
             }
         }
         
-        quiz_state['final_summary'].append(detailed_result)
+        quiz_state.record_answer(detailed_result)
 
         if quiz_state['questions_answered_in_level'] >= num_per_taxonomy:
             pass_marks = {3: 2, 6: 4, 8: 6}
@@ -195,150 +595,119 @@ def handle_dynamic_quiz(request):
             quiz_state['correct_in_level'] = 0
             quiz_state['questions_answered_in_level'] = 0
         
-        request.session['quiz_state'] = quiz_state
-        return redirect('students:dynamic_quiz')
+        quiz_state.save()
+        return redirect('students:dynamic_quiz'), None
 
     level_index = quiz_state['level_index']
 
     if level_index < 0 or level_index >= len(BLOOM_LEVELS):
-        # Quiz is complete, save feedback and redirect
-        from feedback.services import FeedbackService
-        
-        # Prepare data for feedback service
-        teacher_id = request.session.get('quiz_teacher_id')
-        syllabus_id = request.session.get('quiz_syllabus_id')
-        student_user = request.user
-        max_level_reached = quiz_state.get('max_level_reached', 0)
-        question_results = quiz_state.get('final_summary', [])
-        
-        # Save feedback to database
-        feedback_record = FeedbackService.save_quiz_feedback(
-            student_user=student_user,
-            teacher_id=teacher_id,
-            syllabus_id=syllabus_id,
-            quiz_type='mcq',
-            max_level_reached=max_level_reached,
-            question_results=question_results
-        )
-        
-        # Clean up session
-        request.session.pop('quiz_state', None)
-        request.session.pop('current_question_data', None)
-        
-        if feedback_record:
-            return redirect('feedback:detailed_feedback', feedback_id=feedback_record.id)
-        else:
-            # Fallback to old template if feedback saving fails
-            reason = "Congratulations! You mastered all levels." if level_index >= len(BLOOM_LEVELS) else "Quiz ended."
-            return render(request, 'students/quiz_complete_dynamic.html', {
-                'summary': quiz_state['final_summary'],
-                'reason': reason
-            })
+        # Quiz is complete; the caller saves the feedback
+        return None, {
+            'action': 'complete',
+            'quiz_state': quiz_state,
+            'level_index': level_index,
+            'feedback': {
+                'student_user': request.user,
+                'teacher_id': teacher_id,
+                'syllabus_id': syllabus_id,
+                'quiz_type': 'mcq',
+                'max_level_reached': quiz_state.get('max_level_reached', 0),
+                'question_results': quiz_state.final_summary,
+            },
+        }
     
-    syllabus = get_object_or_404(Syllabus, id=syllabus_id, teacher_id=teacher_id)
     level_name = BLOOM_LEVELS[level_index]
+
+    # Prefer the candidate prefetched while the previous question was on screen, then
+    # one queued from an earlier batch, then the pre-generated pool; only call the
+    # model live when all of them come up empty. Each source skips near duplicates
+    # of the questions already asked.
+    mcq = prefetch.take('mcq', quiz_state.attempt_id, level_name, quiz_state)
+    if not mcq:
+        mcq = question_batch.take('mcq', quiz_state.attempt_id, level_name, quiz_state)
+    if mcq:
+        QuestionPool.add(syllabus_id, level_name, mcq)
+    else:
+        mcq = QuestionPool.draw(syllabus_id, level_name, quiz_state.asked_questions, quiz_state.question_index())
+    return None, {
+        'action': 'question',
+        'quiz_state': quiz_state,
+        'teacher_id': teacher_id,
+        'syllabus_id': syllabus_id,
+        'syllabus': None,
+        'level_name': level_name,
+        'num_per_taxonomy': num_per_taxonomy,
+        'batch_size': question_batch.batch_size(quiz_state, num_per_taxonomy),
+        'mcq': mcq,
+        'generated': mcq is None,
+        'queued': [],
+    }
+
+
+def complete_dynamic_quiz(request, step, feedback_record):
+    """Clean up a finished attempt and show its feedback."""
+    quiz_state = step['quiz_state']
+    prefetch.discard('mcq', quiz_state.attempt_id)
+    question_batch.discard('mcq', quiz_state.attempt_id)
+    quiz_states.discard(request.session, 'mcq')
     
-    mcq = None
-    for i in range(3): # Retry up to 3 times
-        print(f"Attempt {i+1} to generate a unique question for level '{level_name}'...")
-        
-        level_instruction = LEVEL_INSTRUCTIONS[level_name]
-        
-        # Add randomness and variety to prevent same questions
-        variety_prompts = [
-            "Focus on a different concept or module from the syllabus.",
-            "Choose a topic that hasn't been covered in previous questions.",
-            "Explore a practical application or real-world scenario.",
-            "Create a question about advanced concepts in the syllabus.",
-            "Focus on fundamental principles and theory.",
-            "Generate a question about implementation details."
-        ]
-        
-        random_variety = random.choice(variety_prompts)
-        random_seed = random.randint(1000, 9999)
-        
-        # Get topics already covered to ensure variety
-        covered_topics = quiz_state.get('asked_topics', [])
-        topic_instruction = f"AVOID these already covered topics: {', '.join(covered_topics)}" if covered_topics else "Cover any relevant topic from the syllabus."
-        
-        prompt = f"""
-        Session: {quiz_state.get('session_id', 'default')} | Seed: {random_seed}
-        
-        Here is the entire course syllabus:
-        ---
-        {syllabus.content}
-        ---
-        
-        Your task: {level_instruction['desc']}
-        
-        DIVERSITY REQUIREMENT: {random_variety}
-        TOPIC VARIETY: {topic_instruction}
-        
-        CRITICAL RULE: Do NOT repeat any of the following questions:
-        ---
-        {', '.join(quiz_state['asked_questions'])}
-        ---
-        
-        IMPORTANT GUIDELINES:
-        1. Randomize the correct answer position - do NOT always make A the correct answer
-        2. Keep all options roughly the same length - avoid making the correct answer obviously longer
-        3. Make all distractors plausible and related to the topic
-        4. The correct answer should be randomly positioned (A, B, C, or D)
-        5. Choose a DIFFERENT topic/concept from previous questions
-        6. Ensure the question is unique and not similar to previous ones
-        
-        Format your response STRICTLY as follows. {level_instruction['format']}
-        Topic: [Name of the Module/Topic you chose - make it DIFFERENT from previous topics]
-        Question: [The question text - ensure it's UNIQUE and DIFFERENT]
-        A) [Option A - keep similar length to other options]
-        B) [Option B - keep similar length to other options]
-        C) [Option C - keep similar length to other options] 
-        D) [Option D - keep similar length to other options]
-        Correct: [The correct letter - RANDOMIZE this, don't always use A]
-        """
-        
-        chat_history = quiz_state['chat_history']
-        
-        # Clear chat history periodically to prevent AI from getting stuck in patterns
-        if len(chat_history) > 10:  # Keep only recent context
-            system_msg = chat_history[0:2]  # Keep system instruction
-            recent_context = chat_history[-4:]  # Keep last 2 exchanges
-            chat_history = system_msg + recent_context
-            quiz_state['chat_history'] = chat_history
-        
-        chat_history.append({'role': 'user', 'parts': [prompt]})
-        
-        try:
-            response = MODEL.generate_content(chat_history)
-            chat_history.append({'role': 'model', 'parts': [response.text]})
-            
-            parsed_mcq = parse_question_from_response(response.text)
-
-            if parsed_mcq and parsed_mcq.get('question') not in quiz_state['asked_questions']:
-                mcq = parsed_mcq
-                # Track the topic to ensure variety in future questions
-                if 'asked_topics' not in quiz_state:
-                    quiz_state['asked_topics'] = []
-                quiz_state['asked_topics'].append(parsed_mcq.get('topic', 'General'))
-                break
-                
-        except Exception as e:
-            print(f"An API error occurred during generation: {e}")
-            continue
+    if feedback_record:
+        return redirect('feedback:detailed_feedback', feedback_id=feedback_record.id)
+    # Fallback to old template if feedback saving fails
+    reason = "Congratulations! You mastered all levels." if step['level_index'] >= len(BLOOM_LEVELS) else "Quiz ended."
+    return render(request, 'students/quiz_complete_dynamic.html', {
+        'summary': step['feedback']['question_results'],
+        'reason': reason
+    })
 
-    quiz_state['chat_history'] = chat_history
 
-    if not mcq:
+def show_dynamic_question(request, step):
+    """Store the question (generated or drawn) in the attempt and render it."""
+    if not step['mcq']:
         messages.error(request, "Failed to generate a unique question. The quiz has been reset.")
-        request.session.pop('quiz_state', None)
+        quiz_states.discard(request.session, 'mcq')
         return redirect('students:dashboard')
+    store_dynamic_question(step)
+    return render_dynamic_quiz(request, step)
 
-    request.session['current_question_data'] = mcq
-    request.session['quiz_state'] = quiz_state
-    
+
+def store_dynamic_question(step):
+    """Make ``step['mcq']`` the attempt's current question and start prefetching the next one."""
+    quiz_state = step['quiz_state']
+    syllabus = step['syllabus']
+    syllabus_id = step['syllabus_id']
+    level_name = step['level_name']
+    num_per_taxonomy = step['num_per_taxonomy']
+    mcq = step['mcq']
+    if step['generated']:
+        QuestionPool.add(syllabus_id, level_name, mcq)
+
+    # Track the topic to ensure variety in future questions
+    quiz_state.record_topic(mcq.get('topic', 'General'))
+    quiz_state.set_current_question(mcq, level_name)
+    quiz_state.save()
+    question_batch.put('mcq', quiz_state.attempt_id, level_name, step['queued'])
+
+    # Generate candidates for the next question while the student answers this one.
+    # Levels with batch questions queued, or that the pool can still serve, are skipped.
+    next_levels = prefetch.candidate_levels(quiz_state, num_per_taxonomy)
+    if question_batch.is_enabled():
+        queued = question_batch.queued_levels('mcq', quiz_state.attempt_id, next_levels)
+        next_levels = [level for level in next_levels if level not in queued]
+    next_levels = QuestionPool.levels_running_low(syllabus_id, next_levels)
+    if next_levels:
+        syllabus = syllabus or Syllabus.objects.get(id=syllabus_id)
+        prefetch.prefetch_next('mcq', quiz_state.attempt_id, generate_mcq, syllabus, quiz_state, mcq,
+                               num_per_taxonomy, levels=next_levels)
+
+
+def render_dynamic_quiz(request, step, stream_url=None):
+    """The question page; with ``stream_url`` it is rendered empty and filled in from the event stream."""
+    quiz_state = step['quiz_state']
     return render(request, 'students/dynamic_quiz.html', {
-        'question_data': mcq,
-        'level_name': level_name.capitalize(),
+        'question_data': None if stream_url else step['mcq'],
+        'stream_url': stream_url,
+        'level_name': step['level_name'].capitalize(),
         'current_q_num': quiz_state['questions_answered_in_level'] + 1,
-        'total_q_in_level': num_per_taxonomy
+        'total_q_in_level': step['num_per_taxonomy']
     })
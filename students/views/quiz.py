@@ -1,11 +1,12 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import redirect
 from django.contrib import messages
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
 from teachers.models import Syllabus
-import google.generativeai as genai
+from teachers.ingestion import wait_for_extraction
 from rest_framework.views import APIView
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from students import quiz_state as quiz_states
 
 @method_decorator(login_required, name='dispatch')
 class StartDynamicQuizView(APIView):
@@ -22,6 +23,9 @@ class StartDynamicQuizView(APIView):
         except Syllabus.DoesNotExist:
             messages.error(request, 'The selected syllabus does not exist.')
             return redirect('students:dashboard')
+        if wait_for_extraction(syllabus):
+            messages.error(request, 'The selected syllabus is still being processed. Please try again shortly.')
+            return redirect('students:dashboard')
         
         # Get teacher from the selected syllabus
         teacher_id = syllabus.teacher.id
@@ -40,20 +44,39 @@ class StartDynamicQuizView(APIView):
     def get(self, request):
         return redirect('students:dashboard')
 
-@method_decorator(login_required, name='dispatch')
-class DynamicQuizView(APIView):
-    def get(self, request):
-        from .dynamic_quiz_logic import handle_dynamic_quiz
-        resp = handle_dynamic_quiz(request)
-        if resp is None:
-            return HttpResponse('An error occurred in quiz logic.', status=500)
-        return resp
-    def post(self, request):
-        from .dynamic_quiz_logic import handle_dynamic_quiz
-        resp = handle_dynamic_quiz(request)
-        if resp is None:
-            return HttpResponse('An error occurred in quiz logic.', status=500)
-        return resp
+async def dynamic_quiz(request):
+    """
+    Async MCQ quiz view. Under ASGI a student waiting on question generation
+    only holds a coroutine, not a worker thread; under WSGI Django runs it in
+    the request thread. Login is checked inside the flow, since login_required
+    does not wrap async views on this Django version.
+    """
+    from .dynamic_quiz_logic import ahandle_dynamic_quiz
+    resp = await ahandle_dynamic_quiz(request)
+    if resp is None:
+        return HttpResponse('An error occurred in quiz logic.', status=500)
+    return resp
+
+async def descriptive_quiz(request):
+    """Async descriptive quiz view (see ``dynamic_quiz``)."""
+    from .descriptive_quiz_logic import ahandle_descriptive_quiz
+    return await ahandle_descriptive_quiz(request)
+
+async def dynamic_quiz_stream(request):
+    """Server-sent events that fill in the MCQ page while its question is generated."""
+    from .dynamic_quiz_logic import dynamic_question_events
+    return event_stream(dynamic_question_events(request))
+
+async def descriptive_quiz_stream(request):
+    """Server-sent events for the descriptive quiz page."""
+    from .descriptive_quiz_logic import descriptive_question_events
+    return event_stream(descriptive_question_events(request))
+
+def event_stream(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Let nginx pass events through as they are sent
+    return response
 
 @login_required
 def start_descriptive_quiz(request):
@@ -63,9 +86,8 @@ def start_descriptive_quiz(request):
     """
     if request.method == 'POST':
         # --- THOROUGHLY CLEAR ALL PREVIOUS QUIZ DATA ---
-        # Note the different session key 'desc_quiz_state' to keep the quiz types separate
-        request.session.pop('desc_quiz_state', None)
-        request.session.pop('current_question_data', None)
+        # The descriptive attempt is stored separately from the MCQ one to keep the quiz types separate
+        quiz_states.discard(request.session, 'descriptive')
         request.session.pop('quiz_teacher_id', None)
         request.session.pop('quiz_syllabus_id', None)
         request.session.pop('quiz_num_per_taxonomy', None)
@@ -82,6 +104,9 @@ def start_descriptive_quiz(request):
         except Syllabus.DoesNotExist:
             messages.error(request, "The selected syllabus does not exist.")
             return redirect('students:dashboard')
+        if wait_for_extraction(syllabus):
+            messages.error(request, "The selected syllabus is still being processed. Please try again shortly.")
+            return redirect('students:dashboard')
 
         # Set the new quiz parameters in the session (can be shared with the MCQ quiz)
         request.session['quiz_teacher_id'] = syllabus.teacher.id
@@ -2,17 +2,17 @@ from django.shortcuts import render, get_object_or_404
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
 from teachers.models import Quiz
-from students.models import StudentResponse
+from students import results_summary
 from rest_framework.views import APIView
 
 @method_decorator(login_required, name='dispatch')
 class QuizResultsView(APIView):
     def get(self, request, quiz_id):
         quiz = get_object_or_404(Quiz, id=quiz_id)
-        responses = StudentResponse.objects.filter(student=request.user, quiz=quiz)
-        correct_count = responses.filter(is_correct=True).count()
-        total_questions = responses.count()
-        score = (correct_count / total_questions) * 100 if total_questions > 0 else 0
+        result = results_summary.get_quiz_score(request.user.id, quiz.id)
+        correct_count = result['correct_count']
+        total_questions = result['total_questions']
+        score = result['score']
         student_name = request.session.get('student_name', request.user.first_name)
         student_college = request.session.get('student_college', '')
         return render(request, 'students/quiz_complete.html', {
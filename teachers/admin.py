@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Syllabus, Quiz, Question
+from .models import Syllabus, SyllabusChunk, Quiz, Question
 
 admin.site.register(Syllabus)
 admin.site.register(Quiz)
 admin.site.register(Question)
+admin.site.register(SyllabusChunk)
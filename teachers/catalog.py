@@ -0,0 +1,51 @@
+"""
+Cached syllabus catalog for the student dashboard.
+
+The catalog is a list of lightweight SyllabusEntry tuples (id, title, teacher
+id, teacher display name, college) built with one values() query that never
+reads the syllabus ``content``. It is cached under a single key and dropped by
+teachers.signals whenever a Syllabus is saved or deleted. Teacher name changes
+show up when the entry expires (SYLLABUS_CATALOG_CACHE_TIMEOUT).
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Syllabus
+
+CACHE_KEY = 'syllabus_catalog'
+
+SyllabusEntry = namedtuple('SyllabusEntry', ['id', 'title', 'teacher_id', 'teacher_display', 'college'])
+
+
+def build_catalog():
+    """One query over Syllabus joined with its teacher; content is not loaded."""
+    rows = Syllabus.objects.order_by('id').values_list(
+        'id', 'title', 'teacher_id', 'teacher__first_name', 'teacher__last_name', 'teacher__username', 'college'
+    )
+    catalog = []
+    for syllabus_id, title, teacher_id, first_name, last_name, username, college in rows:
+        # Same as User.get_full_name() or username
+        full_name = f"{first_name} {last_name}".strip()
+        catalog.append(SyllabusEntry(syllabus_id, title, teacher_id, full_name or username, college or ''))
+    return catalog
+
+
+def get_catalog():
+    """The cached catalog, rebuilt on a miss."""
+    catalog = cache.get(CACHE_KEY)
+    if catalog is None:
+        catalog = build_catalog()
+        cache.set(CACHE_KEY, catalog, getattr(settings, 'SYLLABUS_CATALOG_CACHE_TIMEOUT', 60 * 60))
+    return catalog
+
+
+def get_teachers(catalog):
+    """(teacher id, display name) for every teacher with a syllabus, ordered by name."""
+    teachers = {entry.teacher_id: entry.teacher_display for entry in catalog}
+    return sorted(teachers.items(), key=lambda item: (item[1].lower(), item[0]))
+
+
+def invalidate():
+    cache.delete(CACHE_KEY)
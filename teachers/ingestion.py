@@ -0,0 +1,241 @@
+"""
+PDF syllabus ingestion.
+
+Uploading a PDF without typed content only queues the syllabus
+(``queue_extraction``); the text is extracted on the background executor by
+``extract_syllabus_pdf``:
+
+1. pages are read one at a time with the optional ``pypdf`` package, and each
+   page's normalized lines are spooled to a temporary file, so memory use
+   depends on the largest page, not on the size of the PDF
+2. lines that open or close most pages (running headers, footers and page
+   numbers) are counted while spooling and dropped on the way back
+3. the remaining text becomes the syllabus content and is chunked through
+   the syllabus context layer
+
+``Syllabus.extraction_status`` moves from pending to processing to ready or
+failed (with ``extraction_error``); ``extraction_updated_at`` records when it
+last changed. A pending or processing extraction that has not moved within
+SYLLABUS_EXTRACTION_TIMEOUT is taken to be lost (a restart, a crashed worker):
+``wait_for_extraction`` queues it again when a student starts a quiz on the
+syllabus, and ``manage.py extract_syllabus_pdfs`` runs the same extraction for
+those syllabi and failed ones.
+"""
+import importlib.util
+import logging
+import re
+import tempfile
+import unicodedata
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from bloomify import background
+from .models import Syllabus
+from .syllabus_context import build_syllabus_context
+
+logger = logging.getLogger(__name__)
+
+EDGE_LINES = 2  # Lines at the top and bottom of a page checked for repeats
+REPEAT_MIN_PAGES = 3
+REPEAT_MIN_SHARE = 0.5  # A header/footer appears on at least this share of pages
+PAGE_BREAK = '\f'
+
+CONTROL_CHARS_RE = re.compile(r'[\x00-\x08\x0b-\x1f\x7f]')
+HYPHEN_BREAK_RE = re.compile(r'(\w)-\n(\w)')
+PAGE_NUMBER_RE = re.compile(r'^[-–\s]*(page\s*)?\d+(\s*(of|/)\s*\d+)?[-–\s]*$', re.IGNORECASE)
+EDGE_PAGE_NUMBER_RE = re.compile(r'^\s*(page\s*)?\d+(\s*(of|/)\s*\d+)?\b|\b(page\s*)?\d+(\s*(of|/)\s*\d+)?\s*$')
+
+
+class ExtractionError(Exception):
+    """The PDF could not be read."""
+
+
+def pdf_available():
+    return importlib.util.find_spec('pypdf') is not None
+
+
+def iter_pdf_pages(file, max_pages=None):
+    """Yield the raw text of each page of a PDF file object, one page at a time."""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ExtractionError("PDF extraction needs the 'pypdf' package")
+    try:
+        reader = PdfReader(file)
+        if reader.is_encrypted:
+            reader.decrypt('')
+        for number, page in enumerate(reader.pages):
+            if max_pages and number >= max_pages:
+                return
+            yield page.extract_text() or ''
+    except ExtractionError:
+        raise
+    except Exception as e:
+        raise ExtractionError(f"Could not read the PDF: {e}") from e
+
+
+def normalize_page(text):
+    """Normalized, non-empty lines of one page: NFKC, no control characters, joined hyphenation, single spaces."""
+    text = unicodedata.normalize('NFKC', text).replace('\r\n', '\n').replace('\r', '\n')
+    text = CONTROL_CHARS_RE.sub(' ', text)
+    text = HYPHEN_BREAK_RE.sub(r'\1\2', text)
+    lines = [' '.join(line.split()) for line in text.split('\n')]
+    return [line for line in lines if line]
+
+
+def edge_signature(line):
+    """
+    Key under which a header/footer line repeats: case-folded, with a leading
+    or trailing page number ("Page 3 of 12", "- 3 -") removed. Numbers inside
+    the line are kept so "Module 1" and "Module 2" stay distinct.
+    """
+    return EDGE_PAGE_NUMBER_RE.sub('', line.casefold()).strip()
+
+
+def _edge_lines(lines):
+    if len(lines) <= 2 * EDGE_LINES:
+        return lines
+    return lines[:EDGE_LINES] + lines[-EDGE_LINES:]
+
+
+def repeated_signatures(edge_counts, page_count):
+    """Signatures frequent enough among the page edges to be running headers or footers."""
+    if page_count < REPEAT_MIN_PAGES:
+        return set()
+    threshold = max(REPEAT_MIN_PAGES, page_count * REPEAT_MIN_SHARE)
+    return {signature for signature, count in edge_counts.items() if count >= threshold}
+
+
+def _strip_edges(lines, repeated):
+    """Drop page numbers and repeated lines from the top and bottom of a page."""
+    def is_noise(line):
+        return PAGE_NUMBER_RE.match(line) or edge_signature(line) in repeated
+
+    start, end = 0, len(lines)
+    while start < min(end, EDGE_LINES) and is_noise(lines[start]):
+        start += 1
+    while end > max(start, len(lines) - EDGE_LINES) and is_noise(lines[end - 1]):
+        end -= 1
+    return lines[start:end]
+
+
+def extract_text(pages):
+    """
+    Turn an iterable of raw page texts into syllabus content with running
+    headers and footers removed. Returns (content, page count).
+    """
+    edge_counts = Counter()
+    page_count = 0
+    with tempfile.TemporaryFile('w+', encoding='utf-8') as spool:
+        for raw in pages:
+            lines = normalize_page(raw)
+            page_count += 1
+            # A line counts once per page even if it opens and closes it
+            edge_counts.update({edge_signature(line) for line in _edge_lines(lines)})
+            for line in lines:
+                spool.write(line + '\n')
+            spool.write(PAGE_BREAK + '\n')
+
+        repeated = repeated_signatures(edge_counts, page_count)
+        spool.seek(0)
+        parts, page = [], []
+        for line in spool:
+            line = line.rstrip('\n')
+            if line == PAGE_BREAK:
+                kept = _strip_edges(page, repeated)
+                if kept:
+                    parts.append('\n'.join(kept))
+                page = []
+            else:
+                page.append(line)
+    # Pages are separated by a blank line so paragraphs do not run across page breaks
+    return '\n\n'.join(parts).strip(), page_count
+
+
+def extraction_timeout():
+    return getattr(settings, 'SYLLABUS_EXTRACTION_TIMEOUT', 10 * 60)
+
+
+def stale_extractions():
+    """Filter for syllabi whose pending or processing extraction has not moved within the timeout."""
+    cutoff = timezone.now() - timedelta(seconds=extraction_timeout())
+    return Q(extraction_status__in=['pending', 'processing']) & (
+        Q(extraction_updated_at__lt=cutoff) | Q(extraction_updated_at__isnull=True)
+    )
+
+
+def _mark_failed(syllabus_id, error):
+    Syllabus.objects.filter(id=syllabus_id).update(
+        extraction_status='failed', extraction_error=str(error), extraction_updated_at=timezone.now()
+    )
+
+
+def extract_syllabus_pdf(syllabus_id):
+    """
+    Extract the text of a syllabus' PDF into its content and rebuild its
+    chunks. Records the outcome in ``extraction_status``; returns True on
+    success. Any error marks the syllabus failed.
+    """
+    # A stale processing extraction was lost and can be taken over
+    updated = Syllabus.objects.filter(~Q(extraction_status='processing') | stale_extractions(), id=syllabus_id).update(
+        extraction_status='processing', extraction_error='', extraction_updated_at=timezone.now()
+    )
+    if not updated:
+        return False  # Deleted, or another worker has it
+
+    try:
+        syllabus = Syllabus.objects.get(id=syllabus_id)
+        if not syllabus.pdf_file:
+            raise ExtractionError("The syllabus has no PDF file")
+        with syllabus.pdf_file.open('rb') as pdf:
+            pages = iter_pdf_pages(pdf, getattr(settings, 'SYLLABUS_PDF_MAX_PAGES', None))
+            content, page_count = extract_text(pages)
+        if not content:
+            raise ExtractionError("No text could be extracted (the PDF may contain only scanned images)")
+
+        with transaction.atomic():
+            syllabus.content = content
+            syllabus.page_count = page_count
+            syllabus.extraction_status = 'ready'
+            syllabus.extracted_at = syllabus.extraction_updated_at = timezone.now()
+            syllabus.save(update_fields=['content', 'page_count', 'extraction_status', 'extracted_at',
+                                         'extraction_updated_at'])
+            build_syllabus_context(syllabus)
+    except (ExtractionError, OSError) as e:
+        logger.warning("PDF extraction failed: %s", e, extra={'syllabus_id': syllabus_id})
+        _mark_failed(syllabus_id, e)
+        return False
+    except Exception as e:
+        logger.exception("PDF extraction failed", extra={'syllabus_id': syllabus_id})
+        _mark_failed(syllabus_id, e)
+        return False
+    return True
+
+
+def queue_extraction(syllabus):
+    """Mark the syllabus pending and extract its PDF in the background once the transaction commits."""
+    syllabus.extraction_status = 'pending'
+    syllabus.extraction_error = ''
+    syllabus.extraction_updated_at = timezone.now()
+    syllabus.save(update_fields=['extraction_status', 'extraction_error', 'extraction_updated_at'])
+    transaction.on_commit(lambda: background.submit(extract_syllabus_pdf, syllabus.id))
+
+
+def wait_for_extraction(syllabus):
+    """
+    Whether quizzes on the syllabus have to wait for its PDF extraction. A lost
+    extraction (pending or processing for longer than the timeout) is queued
+    again, so the wait ends once it finishes or fails.
+    """
+    if syllabus.extraction_status not in ('pending', 'processing'):
+        return False
+    cutoff = timezone.now() - timedelta(seconds=extraction_timeout())
+    if syllabus.extraction_updated_at is None or syllabus.extraction_updated_at < cutoff:
+        logger.warning("Requeueing a lost PDF extraction", extra={'syllabus_id': syllabus.id})
+        queue_extraction(syllabus)
+    return True
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from teachers.ingestion import extract_syllabus_pdf, stale_extractions
+from teachers.models import Syllabus
+
+
+class Command(BaseCommand):
+    help = ("Extract text from uploaded syllabus PDFs that failed, or were left pending or processing by a restart "
+            "(or that never had content).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--syllabus', type=int, action='append', help='Only extract these syllabus IDs')
+        parser.add_argument('--force', action='store_true',
+                            help='Also re-extract syllabi marked ready or stuck in processing')
+
+    def handle(self, *args, **options):
+        syllabi = Syllabus.objects.exclude(pdf_file='').exclude(pdf_file__isnull=True)
+        if options['syllabus']:
+            syllabi = syllabi.filter(id__in=options['syllabus'])
+        if options['force']:
+            syllabi.filter(extraction_status='processing').update(extraction_status='pending')
+        else:
+            # Newer pending or processing extractions are most likely still running on the background executor.
+            # Uploads from before extraction existed have no status and no content
+            syllabi = syllabi.filter(
+                Q(extraction_status='failed')
+                | stale_extractions()
+                | Q(extraction_status='none', content__isnull=True)
+                | Q(extraction_status='none', content='')
+            )
+
+        succeeded = failed = 0
+        for syllabus_id in syllabi.values_list('id', flat=True):
+            if extract_syllabus_pdf(syllabus_id):
+                succeeded += 1
+                self.stdout.write(f"Syllabus {syllabus_id}: extracted")
+            else:
+                failed += 1
+                error = Syllabus.objects.filter(id=syllabus_id).values_list('extraction_error', flat=True).first()
+                self.stdout.write(self.style.WARNING(f"Syllabus {syllabus_id}: failed ({error})"))
+
+        self.stdout.write(self.style.SUCCESS(f"PDF extraction complete. {succeeded} extracted, {failed} failed."))
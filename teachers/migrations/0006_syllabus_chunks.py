@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teachers', '0005_delete_choice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syllabus',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.CreateModel(
+            name='SyllabusChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('topic', models.CharField(max_length=200)),
+                ('summary', models.CharField(blank=True, default='', max_length=200)),
+                ('content', models.TextField()),
+                ('content_hash', models.CharField(max_length=40)),
+                ('syllabus', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='teachers.syllabus')),
+            ],
+            options={
+                'ordering': ['position'],
+                'unique_together': {('syllabus', 'position')},
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teachers', '0006_syllabus_chunks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syllabus',
+            name='extracted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='syllabus',
+            name='extraction_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='syllabus',
+            name='extraction_status',
+            field=models.CharField(choices=[('none', 'No PDF'), ('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='none', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='syllabus',
+            name='page_count',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('teachers', '0007_syllabus_extraction_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='syllabus',
+            name='extraction_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -2,17 +2,48 @@ from django.db import models
 from django.contrib.auth.models import User
 
 class Syllabus(models.Model):
+    EXTRACTION_STATUSES = [
+        ('none', 'No PDF'),
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    
     teacher = models.ForeignKey(User, on_delete=models.CASCADE)
     teacher_name = models.CharField(max_length=100, blank=True, null=True)
     college = models.CharField(max_length=200, blank=True, null=True)
     title = models.CharField(max_length=200)
     content = models.TextField(blank=True, null=True)
     pdf_file = models.FileField(upload_to='syllabus/', blank=True, null=True)
+    content_hash = models.CharField(max_length=40, blank=True, default='')  # Hash of content the chunks were built from
+    # Text extraction from pdf_file (teachers.ingestion)
+    extraction_status = models.CharField(max_length=20, choices=EXTRACTION_STATUSES, default='none')
+    extraction_error = models.TextField(blank=True, default='')
+    extraction_updated_at = models.DateTimeField(null=True, blank=True)  # Last change of extraction_status
+    page_count = models.IntegerField(null=True, blank=True)
+    extracted_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return self.title
 
+class SyllabusChunk(models.Model):
+    """One topic section of a syllabus, sent to the model instead of the full text."""
+    syllabus = models.ForeignKey(Syllabus, on_delete=models.CASCADE, related_name='chunks')
+    position = models.IntegerField()
+    topic = models.CharField(max_length=200)
+    summary = models.CharField(max_length=200, blank=True, default='')
+    content = models.TextField()
+    content_hash = models.CharField(max_length=40)
+    
+    class Meta:
+        ordering = ['position']
+        unique_together = ('syllabus', 'position')
+    
+    def __str__(self):
+        return f"{self.syllabus.title} - {self.topic}"
+
 class Quiz(models.Model):
     syllabus = models.ForeignKey(Syllabus, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
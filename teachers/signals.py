@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalog
+from .models import Syllabus
+
+
+@receiver([post_save, post_delete], sender=Syllabus)
+def invalidate_syllabus_catalog(sender, instance, **kwargs):
+    catalog.invalidate()
@@ -0,0 +1,211 @@
+"""
+Syllabus context layer.
+
+Each syllabus is split into topic chunks once (on upload, or lazily when its
+content changes) and stored as SyllabusChunk rows together with the hash of
+the content they were built from. Prompts then carry a compact topic outline
+plus the one chunk the question should be about, instead of the whole
+syllabus text. Built contexts are cached under the content hash, so an edit
+to the syllabus naturally invalidates them.
+"""
+import hashlib
+import random
+import re
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import SyllabusChunk
+
+CHUNK_MAX_CHARS = 1500
+SUMMARY_MAX_CHARS = 160
+CACHE_TIMEOUT = 60 * 60 * 24
+
+SECTION_WORDS_RE = re.compile(r'^(module|unit|chapter|section|week|part|topic|lesson)\b\s*[\w.-]*\s*[:.\-–]?', re.IGNORECASE)
+
+
+def content_hash(content):
+    return hashlib.sha1((content or '').encode('utf-8')).hexdigest()
+
+
+def _is_heading(line):
+    """Markdown headings, "Module 1: ..."-style lines and short ALL-CAPS lines start a section."""
+    line = line.strip()
+    if not line or len(line) > 100:
+        return False
+    if line.startswith('#') or SECTION_WORDS_RE.match(line):
+        return True
+    return line.isupper() and len(line) >= 4
+
+
+def _clean_heading(line):
+    return re.sub(r'^[#\s]+', '', line).strip(' :-–')[:200]
+
+
+def _summarize(text):
+    """First sentence of a chunk, trimmed, used as its one-line summary in the outline."""
+    text = re.sub(r'\s+', ' ', text).strip()
+    sentence = re.split(r'(?<=[.!?])\s', text, maxsplit=1)[0]
+    if len(sentence) > SUMMARY_MAX_CHARS:
+        sentence = sentence[:SUMMARY_MAX_CHARS].rsplit(' ', 1)[0] + '…'
+    return sentence
+
+
+def split_into_chunks(content, max_chars=CHUNK_MAX_CHARS):
+    """
+    Split syllabus text into (topic, text) chunks. Headings start new sections;
+    sections longer than ``max_chars`` are split on paragraph boundaries.
+    """
+    sections = []
+    topic, heading, lines = None, None, []
+
+    def close_section():
+        body = '\n'.join(lines).strip()
+        # A heading without a body ("Module 2: Loops, conditionals") is its own content
+        if body or heading:
+            sections.append((topic, body or heading))
+
+    for line in (content or '').splitlines():
+        if _is_heading(line):
+            close_section()
+            topic, heading, lines = _clean_heading(line), line.strip(), []
+        else:
+            lines.append(line)
+    close_section()
+
+    chunks = []
+    for topic, text in sections:
+        paragraphs = [p.strip() for p in re.split(r'\n\s*\n', text) if p.strip()]
+        buffer = ''
+        for paragraph in paragraphs:
+            while len(paragraph) > max_chars:
+                cut = paragraph.rfind(' ', 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                if buffer:
+                    chunks.append((topic, buffer))
+                    buffer = ''
+                chunks.append((topic, paragraph[:cut].strip()))
+                paragraph = paragraph[cut:].strip()
+            if buffer and len(buffer) + len(paragraph) + 2 > max_chars:
+                chunks.append((topic, buffer))
+                buffer = ''
+            buffer = f"{buffer}\n\n{paragraph}" if buffer else paragraph
+        if buffer:
+            chunks.append((topic, buffer))
+
+    return [(topic or _summarize(text)[:80] or 'General', text) for topic, text in chunks]
+
+
+def build_syllabus_context(syllabus, force=False):
+    """
+    (Re)build the stored chunks of a syllabus. Does nothing when the stored
+    chunks already match the current content, unless ``force`` is set.
+    """
+    current_hash = content_hash(syllabus.content)
+    if not force and syllabus.content_hash == current_hash:
+        return False
+
+    with transaction.atomic():
+        SyllabusChunk.objects.filter(syllabus=syllabus).delete()
+        SyllabusChunk.objects.bulk_create([
+            SyllabusChunk(
+                syllabus=syllabus,
+                position=position,
+                topic=topic,
+                summary=_summarize(text),
+                content=text,
+                content_hash=content_hash(text),
+            )
+            for position, (topic, text) in enumerate(split_into_chunks(syllabus.content))
+        ])
+        syllabus.content_hash = current_hash
+        syllabus.save(update_fields=['content_hash'])
+    return True
+
+
+def get_syllabus_context(syllabus):
+    """
+    Return ``{'hash', 'outline', 'chunks'}`` for a syllabus, where ``outline`` is a
+    list of (topic, summary) and ``chunks`` a list of (topic, text). Served from
+    the cache while the content is unchanged.
+    """
+    current_hash = content_hash(syllabus.content)
+    key = f"syllabus_context:{syllabus.pk}:{current_hash}"
+    context = cache.get(key)
+    if context is None:
+        if syllabus.content_hash != current_hash:
+            build_syllabus_context(syllabus)
+        rows = list(SyllabusChunk.objects.filter(syllabus=syllabus).values_list('topic', 'summary', 'content'))
+        context = _context_from_rows(current_hash, rows)
+        cache.set(key, context, CACHE_TIMEOUT)
+    return context
+
+
+async def aget_syllabus_context(syllabus):
+    """Async ``get_syllabus_context`` for async views; chunks are read with the async ORM."""
+    current_hash = content_hash(syllabus.content)
+    key = f"syllabus_context:{syllabus.pk}:{current_hash}"
+    context = await cache.aget(key)
+    if context is None:
+        if syllabus.content_hash != current_hash:
+            # Rebuilding runs in a transaction, which the async ORM cannot do
+            await sync_to_async(build_syllabus_context)(syllabus)
+        rows = [row async for row in SyllabusChunk.objects.filter(syllabus=syllabus).values_list('topic', 'summary', 'content')]
+        context = _context_from_rows(current_hash, rows)
+        await cache.aset(key, context, CACHE_TIMEOUT)
+    return context
+
+
+def _context_from_rows(current_hash, rows):
+    outline = {}
+    for topic, summary, _ in rows:
+        outline.setdefault(topic, summary)  # Long sections span several chunks
+    return {
+        'hash': current_hash,
+        'outline': list(outline.items()),
+        'chunks': [(topic, text) for topic, _, text in rows],
+    }
+
+
+def choose_chunk(context, covered_topics=()):
+    """Pick a chunk whose topic has not been covered yet (falls back to any chunk)."""
+    chunks = context['chunks']
+    if not chunks:
+        return None
+    covered = [t.lower() for t in covered_topics if t]
+
+    def is_covered(topic):
+        topic = topic.lower()
+        return any(topic in c or c in topic for c in covered)
+
+    fresh = [chunk for chunk in chunks if not is_covered(chunk[0])]
+    return random.choice(fresh or chunks)
+
+
+def render_prompt_context(syllabus, covered_topics=()):
+    """
+    Prompt section describing the syllabus: the topic outline plus the chunk
+    the next question should focus on.
+    """
+    return _format_prompt_context(syllabus, get_syllabus_context(syllabus), covered_topics)
+
+
+async def arender_prompt_context(syllabus, covered_topics=()):
+    """Async ``render_prompt_context``."""
+    return _format_prompt_context(syllabus, await aget_syllabus_context(syllabus), covered_topics)
+
+
+def _format_prompt_context(syllabus, context, covered_topics):
+    chunk = choose_chunk(context, covered_topics)
+    if chunk is None:
+        return f"Course: {syllabus.title}\n(No syllabus text is available; ask about the course title's core concepts.)"
+
+    outline = '\n'.join(f"- {topic}: {summary}" if summary and summary != topic else f"- {topic}"
+                        for topic, summary in context['outline'])
+    topic, text = chunk
+    return (
+        f"Course outline ({syllabus.title}):\n{outline}\n\n"
+        f"Base the question on this section of the syllabus:\n"
+        f"Section: {topic}\n---\n{text}\n---"
+    )
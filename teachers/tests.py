@@ -1,3 +1,124 @@
-from django.test import TestCase
+import tempfile
+from io import StringIO
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .ingestion import extract_text, wait_for_extraction
+from .models import Syllabus
+
+
+class PdfTextExtractionTests(SimpleTestCase):
+    def page(self, number, body):
+        return f"CS101 Programming Fundamentals\n{body}\nBloomify College · Page {number} of 6"
+
+    def test_running_headers_and_footers_are_removed(self):
+        pages = [self.page(n, f"MODULE {n}: Topic {n}\nThis module covers concept {n} in de-\ntail.") for n in range(1, 7)]
+        content, page_count = extract_text(pages)
+        self.assertEqual(page_count, 6)
+        self.assertNotIn('CS101', content)
+        self.assertNotIn('Page', content)
+        for n in range(1, 7):
+            self.assertIn(f"MODULE {n}: Topic {n}\nThis module covers concept {n} in detail.", content)
+
+    def test_short_documents_keep_their_edges(self):
+        content, _ = extract_text(['CS101\nLoops\n- 1 -', 'CS101\nFunctions\n- 2 -'])
+        # Too few pages to tell a header from content; bare page numbers still go
+        self.assertEqual(content, 'CS101\nLoops\n\nCS101\nFunctions')
+
+    def test_text_is_normalized(self):
+        content, _ = extract_text(['ﬁrst\x07  line\r\n\r\nsecond\tline'])
+        self.assertEqual(content, 'first line\nsecond line')
+
+
+@override_settings(BACKGROUND_TASKS_ALWAYS_EAGER=True)
+class SyllabusUploadTests(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user('teacher', password='pass')
+        self.client.force_login(self.teacher)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = self.settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def upload(self, content, pdf=None):
+        data = {'teacher_name': 'T', 'college': 'C', 'title': 'Python', 'content': content}
+        if pdf is not None:
+            data['pdf_file'] = pdf
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('teachers:upload_syllabus'), data)
+        self.assertEqual(response.status_code, 302)
+        return Syllabus.objects.get()
+
+    def test_typed_content_is_chunked_immediately(self):
+        syllabus = self.upload('MODULE 1: Variables\nNames bound to values.')
+        self.assertEqual(syllabus.extraction_status, 'none')
+        self.assertEqual(syllabus.chunks.count(), 1)
+
+    def test_unreadable_pdf_is_marked_failed(self):
+        pdf = SimpleUploadedFile('syllabus.pdf', b'not a pdf', content_type='application/pdf')
+        with self.assertLogs('teachers.ingestion', 'WARNING'):
+            syllabus = self.upload('', pdf)
+        self.assertEqual(syllabus.extraction_status, 'failed')
+        self.assertTrue(syllabus.extraction_error)
+        self.assertFalse(syllabus.content)
+
+    def test_unexpected_error_marks_the_syllabus_failed(self):
+        pdf = SimpleUploadedFile('syllabus.pdf', b'%PDF-1.4', content_type='application/pdf')
+        with mock.patch('teachers.ingestion.iter_pdf_pages', side_effect=RuntimeError('boom')), \
+                self.assertLogs('teachers.ingestion', 'ERROR'):
+            syllabus = self.upload('', pdf)
+        self.assertEqual(syllabus.extraction_status, 'failed')
+        self.assertEqual(syllabus.extraction_error, 'boom')
+
+    def test_stale_extraction_is_retried(self):
+        pdf = SimpleUploadedFile('syllabus.pdf', b'%PDF-1.4', content_type='application/pdf')
+        with mock.patch('teachers.ingestion.iter_pdf_pages', return_value=iter([])), \
+                self.assertLogs('teachers.ingestion', 'WARNING'):
+            syllabus = self.upload('', pdf)
+        # Left processing by a restart
+        Syllabus.objects.filter(id=syllabus.id).update(
+            extraction_status='processing', extraction_updated_at=timezone.now() - timedelta(hours=1)
+        )
+
+        with mock.patch('teachers.ingestion.iter_pdf_pages', return_value=iter(['MODULE 1: Variables'])):
+            call_command('extract_syllabus_pdfs', stdout=StringIO())
+        syllabus.refresh_from_db()
+        self.assertEqual(syllabus.extraction_status, 'ready')
+        self.assertEqual(syllabus.content, 'MODULE 1: Variables')
+
+    def test_running_extraction_is_left_alone(self):
+        pdf = SimpleUploadedFile('syllabus.pdf', b'%PDF-1.4', content_type='application/pdf')
+        with mock.patch('teachers.ingestion.iter_pdf_pages', return_value=iter([])), \
+                self.assertLogs('teachers.ingestion', 'WARNING'):
+            syllabus = self.upload('', pdf)
+        Syllabus.objects.filter(id=syllabus.id).update(extraction_status='processing', extraction_updated_at=timezone.now())
+
+        with mock.patch('teachers.ingestion.iter_pdf_pages') as pages:
+            call_command('extract_syllabus_pdfs', stdout=StringIO())
+        pages.assert_not_called()
+        self.assertEqual(Syllabus.objects.get().extraction_status, 'processing')
+
+    def test_quizzes_wait_only_on_a_live_extraction(self):
+        pdf = SimpleUploadedFile('syllabus.pdf', b'%PDF-1.4', content_type='application/pdf')
+        with mock.patch('teachers.ingestion.iter_pdf_pages', return_value=iter([])), \
+                self.assertLogs('teachers.ingestion', 'WARNING'):
+            syllabus = self.upload('', pdf)
+        self.assertFalse(wait_for_extraction(syllabus))
+
+        syllabus.extraction_status = 'pending'
+        syllabus.extraction_updated_at = timezone.now() - timedelta(hours=1)
+        with mock.patch('teachers.ingestion.iter_pdf_pages', return_value=iter(['MODULE 1: Variables'])), \
+                self.assertLogs('teachers.ingestion', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(wait_for_extraction(syllabus))
+        # The lost extraction was queued again and has now finished
+        syllabus.refresh_from_db()
+        self.assertEqual(syllabus.extraction_status, 'ready')
+        self.assertFalse(wait_for_extraction(syllabus))
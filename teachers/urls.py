@@ -6,4 +6,5 @@ app_name = 'teachers'
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('upload-syllabus/', views.upload_syllabus, name='upload_syllabus'),
+    path('syllabus/<int:syllabus_id>/analytics/', views.syllabus_analytics, name='syllabus_analytics'),
 ]
@@ -1,7 +1,12 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from datetime import timedelta
+from django.utils import timezone
+from feedback.rollups import syllabus_analytics as build_syllabus_analytics
+from .ingestion import queue_extraction
 from .models import Syllabus
+from .syllabus_context import build_syllabus_context
 
 @login_required
 def dashboard(request):
@@ -17,7 +22,7 @@ def upload_syllabus(request):
         content = request.POST.get('content')
         pdf_file = request.FILES.get('pdf_file')
         
-        Syllabus.objects.create(
+        syllabus = Syllabus.objects.create(
             teacher=request.user,
             teacher_name=teacher_name,
             college=college,
@@ -25,7 +30,30 @@ def upload_syllabus(request):
             content=content,
             pdf_file=pdf_file
         )
+        if pdf_file and not (content or '').strip():
+            # Text is extracted from the PDF in the background, then chunked
+            queue_extraction(syllabus)
+            messages.success(request, 'Syllabus uploaded! Its text is being extracted from the PDF.')
+            return redirect('teachers:dashboard')
+        # Chunk the syllabus once so quiz prompts only carry the relevant section
+        build_syllabus_context(syllabus)
         messages.success(request, 'Syllabus uploaded successfully!')
         return redirect('teachers:dashboard')
     
     return render(request, 'teachers/upload_syllabus.html')
+
+@login_required
+def syllabus_analytics(request, syllabus_id):
+    """Mastery, drop-off and accuracy for one syllabus, read from the analytics rollups."""
+    syllabus = get_object_or_404(Syllabus, id=syllabus_id, teacher=request.user)
+    try:
+        days = int(request.GET.get('days', 0))
+    except ValueError:
+        days = 0
+    since = timezone.localdate() - timedelta(days=days - 1) if days > 0 else None
+    
+    return render(request, 'teachers/syllabus_analytics.html', {
+        'syllabus': syllabus,
+        'analytics': build_syllabus_analytics(syllabus, since=since),
+        'days': days,
+    })